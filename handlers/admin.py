@@ -2,7 +2,7 @@ from aiogram import Router, F
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile, BufferedInputFile
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from datetime import datetime, timedelta
 import asyncio
@@ -10,17 +10,19 @@ import random
 import json
 import logging
 from typing import List, Dict, Any
-from io import BytesIO
-import matplotlib.pyplot as plt
-import matplotlib
-matplotlib.use('Agg')
+import os
 
-from models import Database
+from services.async_db import get_db
+from services import broadcast, export
+from services.charts import get_renderer
+from services.metrics import get_totals
+from services.stats import day_start, get_daily_series, get_hourly_series, parse_timestamp
 from keyboards.replay import *
 from utils import format_full_profile
 
 router = Router()
-db = Database()
+db = get_db()
+charts = get_renderer()
 
 # Список админов
 ADMIN_IDS = [8383742459]  # Замените на ваш ID
@@ -162,23 +164,26 @@ async def admin_command(message: Message, state: FSMContext):
 async def admin_stats(callback: CallbackQuery):
     """Страница статистики"""
     try:
-        # Общая статистика
-        total_users = db.cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0]
-        total_profiles = db.cursor.execute("SELECT COUNT(*) FROM profiles WHERE is_active = 1").fetchone()[0]
-        total_bots = db.cursor.execute("SELECT COUNT(*) FROM bot_profiles").fetchone()[0]
-        
-        # Лайки и просмотры
-        total_likes = db.cursor.execute("SELECT COUNT(*) FROM likes WHERE like_type = 'like'").fetchone()[0]
-        total_views = db.cursor.execute("SELECT COUNT(*) FROM views").fetchone()[0]
+        # Общая статистика (пользователи, просмотры и продажи - из счетчиков событий;
+        # пользователи и платежи не удаляются, поэтому счетчики равны текущим числам)
+        totals = await get_totals(db, ['users', 'views', 'sales', 'revenue'])
+        total_users = totals['users']
+        total_profiles = await db.fetchval("SELECT COUNT(*) FROM profiles WHERE is_active = 1")
+        total_bots = await db.fetchval("SELECT COUNT(*) FROM bot_profiles")
+        
+        # Лайки удаляются и ставятся заново (бот-лайки, отмена оценки),
+        # поэтому считаются по текущему состоянию (индекс idx_likes_type)
+        total_likes = await db.fetchval("SELECT COUNT(*) FROM likes WHERE like_type = 'like'")
+        # Просмотры - число событий: старые просмотры удаляются при повторном показе
+        total_views = totals['views']
         
         # Продажи
-        total_sales = db.cursor.execute("SELECT COUNT(*) FROM star_payments WHERE status = 'completed'").fetchone()[0]
-        total_revenue = db.cursor.execute("SELECT SUM(stars_amount) FROM star_payments WHERE status = 'completed'").fetchone()[0] or 0
+        total_sales = totals['sales']
+        total_revenue = totals['revenue']
         
         # Последняя активность
-        db.cursor.execute("SELECT MAX(created_at) FROM users")
-        last_registration = db.cursor.fetchone()[0]
-        last_registration_text = datetime.fromtimestamp(last_registration).strftime('%d.%m.%Y %H:%M') if last_registration else "Нет данных"
+        last_registration = parse_timestamp(await db.fetchval("SELECT MAX(created_at) FROM users"))
+        last_registration_text = last_registration.strftime('%d.%m.%Y %H:%M') if last_registration else "Нет данных"
         
         stats_text = (
             "📊 <b>Общая статистика</b>\n\n"
@@ -186,7 +191,7 @@ async def admin_stats(callback: CallbackQuery):
             f"📝 <b>Активные анкеты:</b> {total_profiles}\n"
             f"🤖 <b>Бот-анкеты:</b> {total_bots}\n"
             f"❤️ <b>Всего лайков:</b> {total_likes}\n"
-            f"👀 <b>Просмотры:</b> {total_views}\n"
+            f"👀 <b>Просмотров за все время:</b> {total_views}\n"
             f"💰 <b>Продажи:</b> {total_sales}\n"
             f"💵 <b>Выручка:</b> {total_revenue} ⭐\n"
             f"📅 <b>Последняя регистрация:</b> {last_registration_text}\n\n"
@@ -211,37 +216,21 @@ async def stats_general(callback: CallbackQuery):
     """Детальная общая статистика"""
     try:
         # Статистика за сегодня
-        today_start = int(datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
-        
-        new_users_today = db.cursor.execute(
-            "SELECT COUNT(*) FROM users WHERE created_at >= ?",
-            (today_start,)
-        ).fetchone()[0]
-        
-        new_profiles_today = db.cursor.execute(
-            "SELECT COUNT(*) FROM profiles WHERE created_at >= ?",
-            (today_start,)
-        ).fetchone()[0]
-        
-        likes_today = db.cursor.execute(
-            "SELECT COUNT(*) FROM likes WHERE created_at >= ?",
-            (today_start,)
-        ).fetchone()[0]
-        
-        views_today = db.cursor.execute(
-            "SELECT COUNT(*) FROM views WHERE created_at >= ?",
-            (today_start,)
-        ).fetchone()[0]
+        today = await get_totals(db, ['users', 'profiles', 'likes', 'dislikes', 'views'], start=day_start())
+        new_users_today = today['users']
+        new_profiles_today = today['profiles']
+        likes_today = today['likes'] + today['dislikes']
+        views_today = today['views']
         
         # Статистика по полу
-        gender_stats = db.cursor.execute('''
+        gender_stats = await db.fetchall('''
             SELECT gender, COUNT(*) as count FROM profiles WHERE is_active = 1 GROUP BY gender
-        ''').fetchall()
+        ''')
         
         gender_text = "\n".join([f"  • {row['gender']}: {row['count']}" for row in gender_stats])
         
         # Топ-5 популярных профилей
-        popular_profiles = db.cursor.execute('''
+        popular_profiles = await db.fetchall('''
             SELECT p.name, p.age, COUNT(l.id) as likes_count
             FROM profiles p
             LEFT JOIN likes l ON p.id = l.to_profile_id AND l.like_type = 'like'
@@ -249,7 +238,7 @@ async def stats_general(callback: CallbackQuery):
             GROUP BY p.id
             ORDER BY likes_count DESC
             LIMIT 5
-        ''').fetchall()
+        ''')
         
         popular_text = ""
         for i, profile in enumerate(popular_profiles, 1):
@@ -295,7 +284,7 @@ async def stats_gender(callback: CallbackQuery):
     """Статистика по полу"""
     try:
         # Статистика распределения по полу
-        db.cursor.execute('''
+        gender_stats = await db.fetchall('''
             SELECT 
                 gender,
                 COUNT(*) as count,
@@ -306,15 +295,13 @@ async def stats_gender(callback: CallbackQuery):
             ORDER BY count DESC
         ''')
         
-        gender_stats = db.cursor.fetchall()
-        
         gender_text = ""
         for stat in gender_stats:
             bar = "▓" * int(stat['percentage'] / 5)
             gender_text += f"{stat['gender']}: {stat['count']} ({stat['percentage']}%)\n{bar}\n\n"
         
         # Статистика по тому, кого ищут
-        db.cursor.execute('''
+        looking_stats = await db.fetchall('''
             SELECT 
                 looking_for,
                 COUNT(*) as count
@@ -324,8 +311,6 @@ async def stats_gender(callback: CallbackQuery):
             ORDER BY count DESC
         ''')
         
-        looking_stats = db.cursor.fetchall()
-        
         looking_text = ""
         for stat in looking_stats:
             looking_text += f"{stat['looking_for']}: {stat['count']}\n"
@@ -367,49 +352,21 @@ async def stats_daily(callback: CallbackQuery):
     """Дневная статистика"""
     try:
         # Статистика за последние 7 дней
-        stats_7_days = []
-        for i in range(6, -1, -1):
-            date = datetime.now() - timedelta(days=i)
-            start_of_day = int(date.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
-            end_of_day = start_of_day + 86400
-            
-            # Пользователи
-            new_users = db.cursor.execute(
-                "SELECT COUNT(*) FROM users WHERE created_at BETWEEN ? AND ?",
-                (start_of_day, end_of_day)
-            ).fetchone()[0]
-            
-            # Анкеты
-            new_profiles = db.cursor.execute(
-                "SELECT COUNT(*) FROM profiles WHERE created_at BETWEEN ? AND ?",
-                (start_of_day, end_of_day)
-            ).fetchone()[0]
-            
-            # Лайки
-            likes = db.cursor.execute(
-                "SELECT COUNT(*) FROM likes WHERE created_at BETWEEN ? AND ? AND like_type = 'like'",
-                (start_of_day, end_of_day)
-            ).fetchone()[0]
-            
-            stats_7_days.append({
-                'date': date.strftime('%d.%m'),
-                'users': new_users,
-                'profiles': new_profiles,
-                'likes': likes
-            })
+        series = await get_daily_series(db, ['users', 'profiles', 'likes'], days=7)
         
         daily_text = ""
-        for stat in stats_7_days:
+        for date, users, profiles, likes in zip(series['dates'], series['users'],
+                                                series['profiles'], series['likes']):
             daily_text += (
-                f"📅 <b>{stat['date']}:</b>\n"
-                f"  👥 Пользователи: {stat['users']}\n"
-                f"  📝 Анкеты: {stat['profiles']}\n"
-                f"  ❤️ Лайки: {stat['likes']}\n\n"
+                f"📅 <b>{date.strftime('%d.%m')}:</b>\n"
+                f"  👥 Пользователи: {users}\n"
+                f"  📝 Анкеты: {profiles}\n"
+                f"  ❤️ Лайки: {likes}\n\n"
             )
         
         # Тренды
-        user_growth = stats_7_days[-1]['users'] - stats_7_days[0]['users'] if len(stats_7_days) > 1 else 0
-        like_growth = stats_7_days[-1]['likes'] - stats_7_days[0]['likes'] if len(stats_7_days) > 1 else 0
+        user_growth = series['users'][-1] - series['users'][0]
+        like_growth = series['likes'][-1] - series['likes'][0]
         
         trends_text = (
             f"📈 <b>Тренды (7 дней):</b>\n"
@@ -456,13 +413,13 @@ async def stats_activity(callback: CallbackQuery):
         # Активные пользователи (за последние 7 дней)
         week_ago = int((datetime.now() - timedelta(days=7)).timestamp())
         
-        active_users = db.cursor.execute(
+        active_users = await db.fetchval(
             "SELECT COUNT(DISTINCT viewer_id) FROM views WHERE created_at >= ?",
             (week_ago,)
-        ).fetchone()[0]
+        )
         
         # Самые активные пользователи
-        top_active = db.cursor.execute('''
+        top_active = await db.fetchall('''
             SELECT u.telegram_id, u.username, COUNT(v.id) as views_count
             FROM users u
             JOIN profiles p ON u.id = p.user_id
@@ -470,7 +427,7 @@ async def stats_activity(callback: CallbackQuery):
             GROUP BY u.id
             ORDER BY views_count DESC
             LIMIT 10
-        ''', (week_ago,)).fetchall()
+        ''', (week_ago,))
         
         top_text = ""
         for i, user in enumerate(top_active, 1):
@@ -478,7 +435,7 @@ async def stats_activity(callback: CallbackQuery):
             top_text += f"{i}. {username}: {user['views_count']} просмотров\n"
         
         # Процент активных пользователей
-        total_users = db.cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        total_users = (await get_totals(db, ['users']))['users']
         active_percentage = (active_users / total_users * 100) if total_users > 0 else 0
         
         stats_text = (
@@ -522,20 +479,20 @@ async def admin_bots(callback: CallbackQuery):
     """Управление бот-анкетами"""
     try:
         # Проверяем количество бот-анкет
-        bot_count = db.cursor.execute(
+        bot_count = await db.fetchval(
             "SELECT COUNT(*) FROM bot_profiles"
-        ).fetchone()[0] or 0
+        ) or 0
         
-        active_bots = db.cursor.execute(
+        active_bots = await db.fetchval(
             "SELECT COUNT(*) FROM bot_profiles WHERE is_active = 1"
-        ).fetchone()[0] or 0
+        ) or 0
         
         # Получаем статистику лайков от ботов
-        bot_likes = db.cursor.execute(
+        bot_likes = await db.fetchval(
             "SELECT COUNT(*) FROM likes l "
             "JOIN bot_profiles bp ON l.from_user_id = (SELECT user_id FROM profiles WHERE id = bp.profile_id) "
             "WHERE l.like_type = 'like'"
-        ).fetchone()[0] or 0
+        ) or 0
         
         bot_stats = (
             f"🤖 <b>Бот-анкеты</b>\n\n"
@@ -621,11 +578,11 @@ class AutoLikeSystem:
     async def _process_bot_likes(self):
         try:
             # Получаем активные бот-анкеты
-            bot_profiles = db.cursor.execute(
+            bot_profiles = await db.fetchall(
                 "SELECT p.* FROM profiles p "
                 "JOIN bot_profiles bp ON p.id = bp.profile_id "
                 "WHERE bp.is_active = 1"
-            ).fetchall()
+            )
             
             if not bot_profiles:
                 self.logger.info("📭 Нет активных бот-анкет")
@@ -640,13 +597,13 @@ class AutoLikeSystem:
                     bot_profile = dict(bot_profile) if hasattr(bot_profile, 'keys') else bot_profile
                     
                     # Получаем список пользователей, которым этот бот УЖЕ ставил лайки
-                    db.cursor.execute('''
+                    rows = await db.fetchall('''
                         SELECT to_profile_id FROM likes 
                         WHERE from_user_id = ?
                         AND like_type = 'like'
                     ''', (bot_profile['user_id'],))
                     
-                    already_liked = [row[0] for row in db.cursor.fetchall()]
+                    already_liked = [row[0] for row in rows]
                     
                     # Получаем реальных пользователей для лайков
                     if already_liked:
@@ -670,7 +627,7 @@ class AutoLikeSystem:
                         '''
                         params = [bot_profile['id'], random.randint(2, 4)]
                     
-                    real_users = db.cursor.execute(query, params).fetchall()
+                    real_users = await db.fetchall(query, params)
                     
                     if not real_users:
                         self.logger.info(f"👤 Нет новых реальных пользователей для бота {bot_profile['name']}")
@@ -680,7 +637,7 @@ class AutoLikeSystem:
                     for user in real_users:
                         try:
                             user_id = user[0] if isinstance(user, tuple) else user['id']
-                            result = db.add_like(bot_profile['user_id'], user_id, 'like')
+                            result = await db.add_like(bot_profile['user_id'], user_id, 'like')
                             if result.get('success'):
                                 bot_likes += 1
                                 total_likes += 1
@@ -712,27 +669,25 @@ class AutoLikeSystem:
         
         try:
             # Получаем telegram_id пользователя
-            target_telegram_id = db.get_telegram_id_by_profile_id(profile_id)
+            target_telegram_id = await db.get_telegram_id_by_profile_id(profile_id)
             
             if not target_telegram_id:
                 return
             
             # Получаем полную информацию о боте
-            bot_full_profile = db.get_profile_by_id(bot_profile['id'])
+            bot_full_profile = await db.get_profile_by_id(bot_profile['id'])
             
             if not bot_full_profile:
                 return
             
             # Получаем количество лайков у пользователя
-            db.cursor.execute('''
+            result = await db.fetchone('''
                 SELECT COUNT(*) as like_count 
                 FROM likes 
                 WHERE to_profile_id = ? 
                 AND like_type = 'like' 
                 AND is_mutual = 0
             ''', (profile_id,))
-            
-            result = db.cursor.fetchone()
             like_count = result['like_count'] if result else 0
             
             # Создаем текст уведомления (БЕЗ упоминания имени бота)
@@ -768,16 +723,16 @@ async def admin_sales(callback: CallbackQuery):
     """Управление продажами"""
     try:
         # Общая статистика продаж
-        total_sales = db.cursor.execute(
+        total_sales = await db.fetchval(
             "SELECT COUNT(*) FROM star_payments WHERE status = 'completed'"
-        ).fetchone()[0] or 0
+        ) or 0
         
-        total_revenue = db.cursor.execute(
+        total_revenue = await db.fetchval(
             "SELECT SUM(stars_amount) FROM star_payments WHERE status = 'completed'"
-        ).fetchone()[0] or 0
+        ) or 0
         
         # Статистика по типам продуктов
-        product_stats = db.cursor.execute('''
+        product_stats = await db.fetchall('''
             SELECT 
                 product_type,
                 product_duration,
@@ -787,7 +742,7 @@ async def admin_sales(callback: CallbackQuery):
             WHERE status = 'completed'
             GROUP BY product_type, product_duration
             ORDER BY revenue DESC
-        ''').fetchall()
+        ''')
         
         product_text = ""
         for stat in product_stats:
@@ -799,15 +754,15 @@ async def admin_sales(callback: CallbackQuery):
         
         # Продажи за последние 7 дней
         week_ago = int((datetime.now() - timedelta(days=7)).timestamp())
-        sales_week = db.cursor.execute(
+        sales_week = await db.fetchval(
             "SELECT COUNT(*) FROM star_payments WHERE status = 'completed' AND created_at >= ?",
             (week_ago,)
-        ).fetchone()[0] or 0
+        ) or 0
         
-        revenue_week = db.cursor.execute(
+        revenue_week = await db.fetchval(
             "SELECT SUM(stars_amount) FROM star_payments WHERE status = 'completed' AND created_at >= ?",
             (week_ago,)
-        ).fetchone()[0] or 0
+        ) or 0
         
         sales_text = (
             f"💰 <b>Статистика продаж</b>\n\n"
@@ -851,7 +806,7 @@ async def admin_affiliates(callback: CallbackQuery):
     """Управление аффилиатами"""
     try:
         # Получаем список всех аффилиатов
-        affiliates = db.get_all_affiliates()
+        affiliates = await db.get_all_affiliates()
         
         affiliates_text = "👨‍💼 <b>Система аффилиатов</b>\n\n"
         
@@ -912,7 +867,7 @@ async def admin_broadcast(callback: CallbackQuery):
     """Управление рассылкой"""
     try:
         # Статистика предыдущих рассылок
-        db.cursor.execute('''
+        stats = await db.fetchone('''
             SELECT 
                 COUNT(*) as total_broadcasts,
                 SUM(sent_count) as total_sent,
@@ -921,8 +876,6 @@ async def admin_broadcast(callback: CallbackQuery):
             WHERE status = 'completed'
         ''')
         
-        stats = db.cursor.fetchone()
-        
         broadcast_text = (
             "📢 <b>Система рассылки</b>\n\n"
             f"📊 <b>Статистика:</b>\n"
@@ -993,8 +946,8 @@ async def process_broadcast_message(message: Message, state: FSMContext):
         )
         return
     
-    # Получаем количество пользователей
-    total_users = db.cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    # Получаем количество пользователей (заблокировавшие бота не получат рассылку)
+    total_users = await db.fetchval("SELECT COUNT(*) FROM users WHERE is_blocked = 0")
     
     # Сохраняем сообщение
     broadcast_data = {
@@ -1070,28 +1023,27 @@ async def start_broadcast(callback: CallbackQuery, state: FSMContext):
         return
     
     # Создаем запись о рассылке
-    admin_id = db.cursor.execute(
+    admin_id = await db.fetchone(
         "SELECT id FROM users WHERE telegram_id = ?",
         (callback.from_user.id,)
-    ).fetchone()
+    )
     
     if admin_id:
         admin_id = admin_id['id']
-        db.cursor.execute('''
-            INSERT INTO broadcasts (admin_id, message_text, total_count, status)
-            VALUES (?, ?, ?, 'pending')
-        ''', (admin_id, broadcast_data['text'], 0))
-        broadcast_id = db.cursor.lastrowid
-        db.connection.commit()
+        broadcast_id = await db.execute('''
+            INSERT INTO broadcasts (admin_id, message_text, media_type, media_file_id, total_count, status)
+            VALUES (?, ?, ?, ?, ?, 'pending')
+        ''', (admin_id, broadcast_data['text'] or '', broadcast_data['media_type'],
+              broadcast_data['media_file_id'], 0))
         
         # Начинаем рассылку в фоне
-        asyncio.create_task(send_broadcast(callback.bot, broadcast_id, broadcast_data))
+        broadcast.start_broadcast(callback.bot, db, broadcast_id, send_broadcast_report)
     
     await callback.message.edit_text(
         "🚀 <b>Рассылка начата!</b>\n\n"
         "⏳ <b>Рассылка выполняется в фоновом режиме.</b>\n"
         "📊 <b>Прогресс будет отображаться в разделе '📢 Рассылка'.</b>\n"
-        "⏰ <b>Примерное время:</b> 10 минут на 1000 пользователей",
+        "⏰ <b>Примерное время:</b> около минуты на 2000 пользователей",
         parse_mode="HTML",
         reply_markup=InlineKeyboardBuilder()
             .add(InlineKeyboardButton(text="🔙 В админку", callback_data="admin_back"))
@@ -1101,114 +1053,32 @@ async def start_broadcast(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     await callback.answer()
 
-async def send_broadcast(bot, broadcast_id: int, broadcast_data: dict):
-    """Фоновая отправка рассылки"""
-    try:
-        # Получаем всех пользователей
-        db.cursor.execute("SELECT telegram_id FROM users")
-        users = db.cursor.fetchall()
-        
-        total_users = len(users)
-        sent_count = 0
-        failed_count = 0
-        
-        # Обновляем общее количество
-        db.cursor.execute(
-            "UPDATE broadcasts SET total_count = ? WHERE id = ?",
-            (total_users, broadcast_id)
-        )
-        db.cursor.execute(
-            "UPDATE broadcasts SET status = 'sending' WHERE id = ?",
-            (broadcast_id,)
-        )
-        db.connection.commit()
-        
-        # Отправляем каждому пользователю
-        for i, user in enumerate(users):
-            try:
-                telegram_id = user['telegram_id']
-                
-                if broadcast_data['media_type'] == 'photo':
-                    await bot.send_photo(
-                        chat_id=telegram_id,
-                        photo=broadcast_data['media_file_id'],
-                        caption=broadcast_data['text'],
-                        parse_mode="HTML"
-                    )
-                elif broadcast_data['media_type'] == 'video':
-                    await bot.send_video(
-                        chat_id=telegram_id,
-                        video=broadcast_data['media_file_id'],
-                        caption=broadcast_data['text'],
-                        parse_mode="HTML"
-                    )
-                elif broadcast_data['media_type'] == 'document':
-                    await bot.send_document(
-                        chat_id=telegram_id,
-                        document=broadcast_data['media_file_id'],
-                        caption=broadcast_data['text'],
-                        parse_mode="HTML"
-                    )
-                else:
-                    await bot.send_message(
-                        chat_id=telegram_id,
-                        text=broadcast_data['text'],
-                        parse_mode="HTML"
-                    )
-                
-                sent_count += 1
-                
-                # Обновляем каждые 50 отправок
-                if sent_count % 50 == 0:
-                    db.cursor.execute(
-                        "UPDATE broadcasts SET sent_count = ? WHERE id = ?",
-                        (sent_count, broadcast_id)
-                    )
-                    db.connection.commit()
-                
-                # Задержка чтобы не спамить
-                await asyncio.sleep(0.1)
-                
-            except Exception as e:
-                failed_count += 1
-                print(f"❌ Ошибка отправки пользователю {telegram_id}: {e}")
-                continue
-        
-        # Завершаем рассылку
-        db.cursor.execute(
-            "UPDATE broadcasts SET sent_count = ?, status = 'completed' WHERE id = ?",
-            (sent_count, broadcast_id)
-        )
-        db.connection.commit()
-        
-        # Отправляем отчет админу
-        report_text = (
-            f"✅ <b>Рассылка #{broadcast_id} завершена!</b>\n\n"
-            f"📊 <b>Статистика:</b>\n"
-            f"👥 <b>Всего получателей:</b> {total_users}\n"
-            f"📤 <b>Успешно отправлено:</b> {sent_count}\n"
-            f"❌ <b>Не отправлено:</b> {failed_count}\n"
-            f"📈 <b>Успешность:</b> {sent_count/total_users*100:.1f}%"
-        )
-        
-        # Отправляем всем админам
-        for admin_id in ADMIN_IDS:
-            try:
-                await bot.send_message(
-                    chat_id=admin_id,
-                    text=report_text,
-                    parse_mode="HTML"
-                )
-            except:
-                pass
-                
-    except Exception as e:
-        print(f"❌ Критическая ошибка рассылки: {e}")
-        db.cursor.execute(
-            "UPDATE broadcasts SET status = 'failed' WHERE id = ?",
-            (broadcast_id,)
-        )
-        db.connection.commit()
+async def send_broadcast_report(bot, broadcast_id: int, stats: dict):
+    """Отчет админам о завершенной рассылке"""
+    total_users = stats['total']
+    sent_count = stats['sent']
+    success_rate = sent_count / total_users * 100 if total_users else 0
+    
+    report_text = (
+        f"✅ <b>Рассылка #{broadcast_id} завершена!</b>\n\n"
+        f"📊 <b>Статистика:</b>\n"
+        f"👥 <b>Всего получателей:</b> {total_users}\n"
+        f"📤 <b>Успешно отправлено:</b> {sent_count}\n"
+        f"🚫 <b>Заблокировали бота:</b> {stats['blocked']}\n"
+        f"❌ <b>Не отправлено:</b> {stats['failed']}\n"
+        f"📈 <b>Успешность:</b> {success_rate:.1f}%"
+    )
+    
+    # Отправляем всем админам
+    for admin_id in ADMIN_IDS:
+        try:
+            await bot.send_message(
+                chat_id=admin_id,
+                text=report_text,
+                parse_mode="HTML"
+            )
+        except:
+            pass
 
 # ========== ЖАЛОБЫ И МОДЕРАЦИЯ ==========
 
@@ -1217,26 +1087,26 @@ async def admin_reports(callback: CallbackQuery):
     """Управление жалобами"""
     try:
         # Статистика жалоб
-        new_reports = db.cursor.execute(
+        new_reports = await db.fetchval(
             "SELECT COUNT(*) FROM reports WHERE status = 'pending'"
-        ).fetchone()[0]
+        )
         
-        pending_reports = db.cursor.execute(
+        pending_reports = await db.fetchval(
             "SELECT COUNT(*) FROM reports WHERE status = 'reviewed'"
-        ).fetchone()[0]
+        )
         
-        closed_reports = db.cursor.execute(
+        closed_reports = await db.fetchval(
             "SELECT COUNT(*) FROM reports WHERE status = 'closed'"
-        ).fetchone()[0]
+        )
         
         # Самые частые причины
-        common_reasons = db.cursor.execute('''
+        common_reasons = await db.fetchall('''
             SELECT reason, COUNT(*) as count
             FROM reports 
             GROUP BY reason
             ORDER BY count DESC
             LIMIT 5
-        ''').fetchall()
+        ''')
         
         reasons_text = ""
         for reason in common_reasons:
@@ -1270,7 +1140,7 @@ async def reports_new(callback: CallbackQuery, state: FSMContext):
     """Новые жалобы"""
     try:
         # Получаем новые жалобы
-        reports = db.cursor.execute('''
+        reports = await db.fetchall('''
             SELECT r.*, u.telegram_id as reporter_telegram_id, p.name as reported_name
             FROM reports r
             JOIN users u ON r.reporter_id = u.telegram_id
@@ -1278,7 +1148,7 @@ async def reports_new(callback: CallbackQuery, state: FSMContext):
             WHERE r.status = 'pending'
             ORDER BY r.created_at DESC
             LIMIT 10
-        ''').fetchall()
+        ''')
         
         if not reports:
             await callback.message.edit_text(
@@ -1339,14 +1209,14 @@ async def view_report(callback: CallbackQuery):
         report_id = int(callback.data.replace("view_report_", ""))
         
         # Получаем информацию о жалобе
-        report = db.cursor.execute('''
+        report = await db.fetchone('''
             SELECT r.*, u.telegram_id as reporter_telegram_id, u.username as reporter_username,
                    p.name as reported_name, p.age as reported_age, p.city as reported_city
             FROM reports r
             JOIN users u ON r.reporter_id = u.telegram_id
             JOIN profiles p ON r.reported_profile_id = p.id
             WHERE r.id = ?
-        ''', (report_id,)).fetchone()
+        ''', (report_id,))
         
         if not report:
             await callback.answer("❌ Жалоба не найдена!")
@@ -1447,12 +1317,9 @@ async def admin_users(callback: CallbackQuery):
     """Управление пользователями"""
     try:
         # Статистика пользователей
-        total_users = db.cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0]
-        users_with_profiles = db.cursor.execute("SELECT COUNT(DISTINCT user_id) FROM profiles").fetchone()[0]
-        users_today = db.cursor.execute(
-            "SELECT COUNT(*) FROM users WHERE created_at >= ?",
-            (int(datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()),)
-        ).fetchone()[0]
+        total_users = (await get_totals(db, ['users']))['users']
+        users_with_profiles = await db.fetchval("SELECT COUNT(DISTINCT user_id) FROM profiles")
+        users_today = (await get_totals(db, ['users'], start=day_start()))['users']
         
         users_text = (
             "👥 <b>Управление пользователями</b>\n\n"
@@ -1534,51 +1401,16 @@ async def stats_charts(callback: CallbackQuery):
     """Генерация графиков статистики"""
     try:
         # Создаем график роста пользователей за 30 дней
-        dates = []
-        user_counts = []
-        profile_counts = []
-        
-        for i in range(29, -1, -1):
-            date = datetime.now() - timedelta(days=i)
-            start_of_day = int(date.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
-            end_of_day = start_of_day + 86400
-            
-            users = db.cursor.execute(
-                "SELECT COUNT(*) FROM users WHERE created_at < ?",
-                (end_of_day,)
-            ).fetchone()[0]
-            
-            profiles = db.cursor.execute(
-                "SELECT COUNT(*) FROM profiles WHERE created_at < ?",
-                (end_of_day,)
-            ).fetchone()[0]
-            
-            dates.append(date.strftime('%d.%m'))
-            user_counts.append(users)
-            profile_counts.append(profiles)
-        
-        # Создаем график
-        fig, ax = plt.subplots(figsize=(12, 6))
-        ax.plot(dates[::3], user_counts[::3], marker='o', label='👥 Пользователи', linewidth=2.5, markersize=8)
-        ax.plot(dates[::3], profile_counts[::3], marker='s', label='📝 Анкеты', linewidth=2.5, markersize=8)
-        ax.set_xlabel('📅 Дата', fontsize=12, fontweight='bold')
-        ax.set_ylabel('📊 Количество', fontsize=12, fontweight='bold')
-        ax.set_title('📈 Рост пользователей и анкет за 30 дней', fontsize=14, fontweight='bold')
-        ax.legend(fontsize=11, loc='upper left')
-        ax.grid(True, alpha=0.3)
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        # Сохраняем график в буфер
-        buf = BytesIO()
-        plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-        buf.seek(0)
-        plt.close(fig)
+        series = await get_daily_series(db, ['users', 'profiles'], days=30, cumulative=True)
+        dates = [date.strftime('%d.%m') for date in series['dates']]
+        user_counts = series['users']
+        profile_counts = series['profiles']
         
         # Отправляем график
-        buf.name = 'statistics_chart.png'
-        await callback.message.answer_photo(
-            FSInputFile(buf, filename='statistics_chart.png'),
+        await charts.send(
+            callback.message, 'growth',
+            {'dates': dates, 'users': user_counts, 'profiles': profile_counts},
+            filename='statistics_chart.png',
             caption="📊 <b>График роста пользователей за 30 дней</b>\n\n"
                     "📈 <b>Синяя линия:</b> Всего пользователей\n"
                     "🟠 <b>Оранжевая линия:</b> Активных анкет\n\n"
@@ -1602,9 +1434,132 @@ async def stats_charts(callback: CallbackQuery):
         logging.error(f"Ошибка генерации графиков: {e}")
         await callback.answer(f"❌ Ошибка: {e}", show_alert=True)
 
+EXPORT_TITLES = {
+    'users': "👥 Пользователи",
+    'profiles': "📝 Анкеты",
+    'likes': "❤️ Лайки",
+    'views': "👀 Просмотры",
+    'payments': "💰 Платежи",
+}
+
 @router.callback_query(F.data == "export_data")
 async def export_data(callback: CallbackQuery):
-    """Экспорт данных"""
+    """Экспорт данных: выбор таблицы"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    builder = InlineKeyboardBuilder()
+    for dataset, title in EXPORT_TITLES.items():
+        builder.add(InlineKeyboardButton(text=title, callback_data=f"export_pick_{dataset}"))
+    builder.add(
+        InlineKeyboardButton(text="📊 Сводка (JSON)", callback_data="export_summary"),
+        InlineKeyboardButton(text="🔙 Назад", callback_data="admin_stats")
+    )
+    builder.adjust(2, 2, 1, 2)
+    
+    await callback.message.edit_text(
+        "📤 <b>Экспорт данных</b>\n\n"
+        "Выберите, что выгрузить. Таблица выгружается целиком в сжатый файл, "
+        "большие таблицы - частями до 45 МБ.",
+        parse_mode="HTML",
+        reply_markup=builder.as_markup()
+    )
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("export_pick_"))
+async def export_pick_format(callback: CallbackQuery):
+    """Экспорт данных: выбор формата"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    dataset = callback.data.replace("export_pick_", "")
+    if dataset not in EXPORT_TITLES:
+        await callback.answer("❌ Неизвестная таблица", show_alert=True)
+        return
+    
+    builder = InlineKeyboardBuilder()
+    for fmt in export.get_formats():
+        builder.add(InlineKeyboardButton(text=fmt.upper(), callback_data=f"export_run_{dataset}_{fmt}"))
+    builder.add(InlineKeyboardButton(text="🔙 Назад", callback_data="export_data"))
+    builder.adjust(len(export.get_formats()), 1)
+    
+    await callback.message.edit_text(
+        f"📤 <b>Экспорт: {EXPORT_TITLES[dataset]}</b>\n\n"
+        "Выберите формат файла:",
+        parse_mode="HTML",
+        reply_markup=builder.as_markup()
+    )
+    await callback.answer()
+
+@router.callback_query(F.data.startswith("export_run_"))
+async def export_run(callback: CallbackQuery):
+    """Выгрузка таблицы и отправка файла"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
+    dataset, fmt = callback.data.replace("export_run_", "").rsplit("_", 1)
+    if dataset not in EXPORT_TITLES or fmt not in export.get_formats():
+        await callback.answer("❌ Неизвестный формат", show_alert=True)
+        return
+    
+    await callback.answer("⏳ Выгрузка началась")
+    status = await callback.message.answer(
+        f"⏳ <b>Выгрузка {EXPORT_TITLES[dataset]} ({fmt.upper()})...</b>",
+        parse_mode="HTML"
+    )
+    
+    async def show_progress(done: int, total: int):
+        percent = done * 100 / total if total else 100
+        await status.edit_text(
+            f"⏳ <b>Выгрузка {EXPORT_TITLES[dataset]} ({fmt.upper()}):</b> "
+            f"{done}/{total} ({percent:.0f}%)",
+            parse_mode="HTML"
+        )
+    
+    paths = []
+    try:
+        paths = await export.export(db, dataset, fmt, on_progress=show_progress)
+        
+        # Бот не может отправить файл больше 50 МБ
+        largest = max(os.path.getsize(path) for path in paths)
+        if largest > export.TELEGRAM_FILE_LIMIT:
+            await status.edit_text(
+                f"❌ <b>Экспорт не удался:</b> файл {largest / 1024 / 1024:.1f} МБ "
+                f"больше лимита Telegram (50 МБ)",
+                parse_mode="HTML"
+            )
+            return
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        for number, path in enumerate(paths, 1):
+            part = f"_part{number}" if len(paths) > 1 else ""
+            part_caption = f", часть {number}/{len(paths)}" if len(paths) > 1 else ""
+            await callback.message.answer_document(
+                document=FSInputFile(path, filename=f"{dataset}_{timestamp}{part}{export.file_suffix(fmt)}"),
+                caption=f"📤 <b>{EXPORT_TITLES[dataset]}</b> ({fmt.upper()}{part_caption})",
+                parse_mode="HTML"
+            )
+        await status.edit_text("✅ <b>Экспорт завершен!</b>", parse_mode="HTML")
+    except Exception as e:
+        logging.error(f"Ошибка экспорта данных: {e}")
+        await status.edit_text(f"❌ <b>Экспорт не удался:</b> {e}", parse_mode="HTML")
+    finally:
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+@router.callback_query(F.data == "export_summary")
+async def export_summary(callback: CallbackQuery):
+    """Экспорт сводных счетчиков в JSON"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Нет доступа", show_alert=True)
+        return
+    
     try:
         export_data_dict = {
             "timestamp": datetime.now().isoformat(),
@@ -1612,10 +1567,11 @@ async def export_data(callback: CallbackQuery):
         }
         
         # Пользователи
-        users_count = db.cursor.execute('SELECT COUNT(*) FROM users').fetchone()[0]
-        profiles_count = db.cursor.execute('SELECT COUNT(*) FROM profiles WHERE is_active = 1').fetchone()[0]
-        sales_count = db.cursor.execute('SELECT COUNT(*) FROM star_payments WHERE status = "completed"').fetchone()[0]
-        total_revenue = db.cursor.execute('SELECT SUM(stars_amount) FROM star_payments WHERE status = "completed"').fetchone()[0] or 0
+        totals = await get_totals(db, ['users', 'sales', 'revenue'])
+        users_count = totals['users']
+        profiles_count = await db.fetchval('SELECT COUNT(*) FROM profiles WHERE is_active = 1')
+        sales_count = totals['sales']
+        total_revenue = totals['revenue']
         
         export_data_dict["statistics"] = {
             "total_users": users_count,
@@ -1627,12 +1583,12 @@ async def export_data(callback: CallbackQuery):
         # Сохраняем в JSON
         json_data = json.dumps(export_data_dict, ensure_ascii=False, indent=2)
         
-        # Создаем буфер
-        json_buffer = BytesIO(json_data.encode('utf-8'))
-        
         # Отправляем файл
         await callback.message.answer_document(
-            document=FSInputFile(json_buffer, filename=f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"),
+            document=BufferedInputFile(
+                json_data.encode('utf-8'),
+                filename=f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+            ),
             caption="<b>Data Export</b>\n\n"
                     f"Users: {users_count}\n"
                     f"Profiles: {profiles_count}\n"
@@ -1641,14 +1597,7 @@ async def export_data(callback: CallbackQuery):
             parse_mode="HTML"
         )
         
-        builder = InlineKeyboardBuilder()
-        builder.add(InlineKeyboardButton(text="Back", callback_data="admin_stats"))
-        
-        await callback.message.answer(
-            "✅ <b>Экспорт завершен!</b>",
-            parse_mode="HTML",
-            reply_markup=builder.as_markup()
-        )
+        await callback.answer("✅ Экспорт завершен!")
     except Exception as e:
         logging.error(f"Ошибка экспорта данных: {e}")
         await callback.answer("Экспорт не удался", show_alert=True)
@@ -1660,7 +1609,7 @@ async def gender_chart(callback: CallbackQuery):
     """График распределения по полу"""
     try:
         # Статистика по полу
-        gender_data = db.cursor.execute('''
+        gender_data = await db.fetchall('''
             SELECT 
                 gender,
                 COUNT(*) as count
@@ -1668,7 +1617,7 @@ async def gender_chart(callback: CallbackQuery):
             WHERE is_active = 1
             GROUP BY gender
             ORDER BY count DESC
-        ''').fetchall()
+        ''')
         
         if not gender_data:
             await callback.answer("❌ Нет данных для графика", show_alert=True)
@@ -1677,30 +1626,10 @@ async def gender_chart(callback: CallbackQuery):
         # Создаем круговую диаграмму
         genders = [g['gender'] for g in gender_data]
         counts = [g['count'] for g in gender_data]
-        colors = ['#FF69B4', '#4169E1', '#FFD700']
-        
-        fig, ax = plt.subplots(figsize=(10, 8))
-        wedges, texts, autotexts = ax.pie(counts, labels=genders, autopct='%1.1f%%', colors=colors[:len(genders)], startangle=90)
-        
-        for autotext in autotexts:
-            autotext.set_color('white')
-            autotext.set_fontweight('bold')
-            autotext.set_fontsize(12)
-        
-        for text in texts:
-            text.set_fontsize(14)
-            text.set_fontweight('bold')
-        
-        ax.set_title('👫 Распределение пользователей по полу', fontsize=16, fontweight='bold', pad=20)
-        
-        buf = BytesIO()
-        plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-        buf.seek(0)
-        plt.close(fig)
         
-        buf.name = 'gender_chart.png'
-        await callback.message.answer_photo(
-            FSInputFile(buf, filename='gender_chart.png'),
+        await charts.send(
+            callback.message, 'gender', {'labels': genders, 'counts': counts},
+            filename='gender_chart.png',
             caption="👫 <b>Распределение пользователей по полу</b>\n\n" +
                     "\n".join([f"• {g['gender']}: {g['count']} ({g['count']*100/sum(counts):.1f}%)" for g in gender_data]),
             parse_mode="HTML"
@@ -1715,33 +1644,7 @@ async def gender_chart(callback: CallbackQuery):
 async def daily_table(callback: CallbackQuery):
     """Таблица по дням"""
     try:
-        stats_7_days = []
-        for i in range(6, -1, -1):
-            date = datetime.now() - timedelta(days=i)
-            start_of_day = int(date.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
-            end_of_day = start_of_day + 86400
-            
-            new_users = db.cursor.execute(
-                "SELECT COUNT(*) FROM users WHERE created_at BETWEEN ? AND ?",
-                (start_of_day, end_of_day)
-            ).fetchone()[0]
-            
-            new_profiles = db.cursor.execute(
-                "SELECT COUNT(*) FROM profiles WHERE created_at BETWEEN ? AND ?",
-                (start_of_day, end_of_day)
-            ).fetchone()[0]
-            
-            likes = db.cursor.execute(
-                "SELECT COUNT(*) FROM likes WHERE created_at BETWEEN ? AND ? AND like_type = 'like'",
-                (start_of_day, end_of_day)
-            ).fetchone()[0]
-            
-            stats_7_days.append({
-                'date': date.strftime('%a, %d.%m'),
-                'users': new_users,
-                'profiles': new_profiles,
-                'likes': likes
-            })
+        series = await get_daily_series(db, ['users', 'profiles', 'likes'], days=7)
         
         table_text = (
             "📅 <b>Статистика за 7 дней</b>\n\n"
@@ -1751,8 +1654,9 @@ async def daily_table(callback: CallbackQuery):
             "─────────────|──────────────|────────|───────\n"
         )
         
-        for stat in stats_7_days:
-            table_text += f"{stat['date']:12} | {stat['users']:12} | {stat['profiles']:6} | {stat['likes']:5}\n"
+        for date, users, profiles, likes in zip(series['dates'], series['users'],
+                                                series['profiles'], series['likes']):
+            table_text += f"{date.strftime('%a, %d.%m'):12} | {users:12} | {profiles:6} | {likes:5}\n"
         
         table_text += (
             "</code>\n\n"
@@ -1782,47 +1686,13 @@ async def daily_table(callback: CallbackQuery):
 async def daily_chart(callback: CallbackQuery):
     """График по дням"""
     try:
-        dates = []
-        users_data = []
+        series = await get_daily_series(db, ['users'], days=30)
+        dates = [date.strftime('%d.%m') for date in series['dates']]
+        users_data = series['users']
         
-        for i in range(29, -1, -1):
-            date = datetime.now() - timedelta(days=i)
-            start_of_day = int(date.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
-            end_of_day = start_of_day + 86400
-            
-            new_users = db.cursor.execute(
-                "SELECT COUNT(*) FROM users WHERE created_at BETWEEN ? AND ?",
-                (start_of_day, end_of_day)
-            ).fetchone()[0]
-            
-            dates.append(date.strftime('%d.%m'))
-            users_data.append(new_users)
-        
-        fig, ax = plt.subplots(figsize=(12, 5))
-        bars = ax.bar(dates[::3], users_data[::3], color='#FF69B4', alpha=0.7, edgecolor='#FF1493', linewidth=2)
-        
-        ax.set_xlabel('📅 Дата', fontsize=11, fontweight='bold')
-        ax.set_ylabel('👥 Новых пользователей', fontsize=11, fontweight='bold')
-        ax.set_title('📈 Статистика новых пользователей за 30 дней', fontsize=12, fontweight='bold')
-        ax.grid(True, alpha=0.3, axis='y')
-        
-        for bar in bars:
-            height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2., height,
-                    f'{int(height)}',
-                    ha='center', va='bottom', fontweight='bold')
-        
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        buf = BytesIO()
-        plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-        buf.seek(0)
-        plt.close(fig)
-        
-        buf.name = 'daily_chart.png'
-        await callback.message.answer_photo(
-            FSInputFile(buf, filename='daily_chart.png'),
+        await charts.send(
+            callback.message, 'daily', {'dates': dates, 'users': users_data},
+            filename='daily_chart.png',
             caption="📈 <b>График новых пользователей за 30 дней</b>\n\n"
                     "📊 <b>Показаны каждые 3 дня для читаемости</b>",
             parse_mode="HTML"
@@ -1838,38 +1708,11 @@ async def activity_chart(callback: CallbackQuery):
     """График активности"""
     try:
         hours = list(range(24))
-        activity = []
+        activity = (await get_hourly_series(db, ['views']))['views']
         
-        now = datetime.now()
-        for hour in hours:
-            hour_start = int(now.replace(hour=hour, minute=0, second=0, microsecond=0).timestamp())
-            hour_end = hour_start + 3600
-            
-            count = db.cursor.execute(
-                "SELECT COUNT(*) FROM views WHERE created_at BETWEEN ? AND ?",
-                (hour_start, hour_end)
-            ).fetchone()[0]
-            activity.append(count)
-        
-        fig, ax = plt.subplots(figsize=(12, 5))
-        ax.plot(hours, activity, marker='o', linewidth=2.5, markersize=8, color='#FF69B4')
-        ax.fill_between(hours, activity, alpha=0.3, color='#FF69B4')
-        
-        ax.set_xlabel('Hour (UTC)', fontsize=11, fontweight='bold')
-        ax.set_ylabel('Views', fontsize=11, fontweight='bold')
-        ax.set_title('Activity by Hour', fontsize=12, fontweight='bold')
-        ax.grid(True, alpha=0.3)
-        ax.set_xticks(range(0, 24, 2))
-        
-        plt.tight_layout()
-        
-        buf = BytesIO()
-        plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-        buf.seek(0)
-        plt.close(fig)
-        
-        await callback.message.answer_photo(
-            FSInputFile(buf, filename='activity_chart.png'),
+        await charts.send(
+            callback.message, 'activity', {'hours': hours, 'views': activity},
+            filename='activity_chart.png',
             caption="<b>Activity by Hour</b>\n\nRecommendation: Send broadcasts at peak hours (19:00-23:00)",
             parse_mode="HTML"
         )
@@ -1883,44 +1726,16 @@ async def activity_chart(callback: CallbackQuery):
 async def sales_chart(callback: CallbackQuery):
     """График доходов"""
     try:
-        dates = []
-        revenue = []
-        
-        for i in range(29, -1, -1):
-            date = datetime.now() - timedelta(days=i)
-            start_of_day = int(date.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
-            end_of_day = start_of_day + 86400
-            
-            daily_revenue = db.cursor.execute(
-                "SELECT SUM(stars_amount) FROM star_payments WHERE status = 'completed' AND created_at BETWEEN ? AND ?",
-                (start_of_day, end_of_day)
-            ).fetchone()[0] or 0
-            
-            dates.append(date.strftime('%d.%m'))
-            revenue.append(daily_revenue)
-        
-        fig, ax = plt.subplots(figsize=(12, 5))
-        ax.plot(dates[::3], revenue[::3], marker='o', linewidth=2.5, markersize=8, color='#FFD700')
-        ax.fill_between(range(len(dates[::3])), revenue[::3], alpha=0.3, color='#FFD700')
-        
-        ax.set_xlabel('Date', fontsize=11, fontweight='bold')
-        ax.set_ylabel('Revenue (Stars)', fontsize=11, fontweight='bold')
-        ax.set_title('Revenue Chart (30 days)', fontsize=12, fontweight='bold')
-        ax.grid(True, alpha=0.3, axis='y')
-        
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        buf = BytesIO()
-        plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-        buf.seek(0)
-        plt.close(fig)
+        series = await get_daily_series(db, ['revenue'], days=30)
+        dates = [date.strftime('%d.%m') for date in series['dates']]
+        revenue = series['revenue']
         
         total_rev = sum(revenue)
         avg_rev = total_rev // 30 if total_rev > 0 else 0
         
-        await callback.message.answer_photo(
-            FSInputFile(buf, filename='sales_chart.png'),
+        await charts.send(
+            callback.message, 'sales', {'dates': dates, 'revenue': revenue},
+            filename='sales_chart.png',
             caption=f"<b>Revenue Chart</b>\n\nTotal: {total_rev} Stars\nDaily avg: {avg_rev} Stars",
             parse_mode="HTML"
         )
@@ -1963,7 +1778,7 @@ async def users_banned(callback: CallbackQuery):
 async def top_active(callback: CallbackQuery):
     """Топ активных пользователей"""
     try:
-        top_users = db.cursor.execute('''
+        top_users = await db.fetchall('''
             SELECT u.telegram_id, u.username, COUNT(v.id) as views_count
             FROM users u
             JOIN profiles p ON u.id = p.user_id
@@ -1971,7 +1786,7 @@ async def top_active(callback: CallbackQuery):
             GROUP BY u.id
             ORDER BY views_count DESC
             LIMIT 10
-        ''').fetchall()
+        ''')
         
         text = "👑 <b>Топ-10 активных пользователей</b>\n\n"
         
@@ -1997,33 +1812,13 @@ async def top_active(callback: CallbackQuery):
 async def sales_daily(callback: CallbackQuery):
     """Продажи по дням"""
     try:
-        stats_7_days = []
-        for i in range(6, -1, -1):
-            date = datetime.now() - timedelta(days=i)
-            start_of_day = int(date.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
-            end_of_day = start_of_day + 86400
-            
-            sales = db.cursor.execute(
-                "SELECT COUNT(*) FROM star_payments WHERE status = 'completed' AND created_at BETWEEN ? AND ?",
-                (start_of_day, end_of_day)
-            ).fetchone()[0]
-            
-            revenue = db.cursor.execute(
-                "SELECT SUM(stars_amount) FROM star_payments WHERE status = 'completed' AND created_at BETWEEN ? AND ?",
-                (start_of_day, end_of_day)
-            ).fetchone()[0] or 0
-            
-            stats_7_days.append({
-                'date': date.strftime('%a, %d.%m'),
-                'sales': sales,
-                'revenue': revenue
-            })
+        series = await get_daily_series(db, ['sales', 'revenue'], days=7)
         
         text = "💰 <b>Продажи по дням (7 дней)</b>\n\n<code>"
         text += "День         | Продажи | Выручка\n─────────────|─────────|─────────\n"
         
-        for stat in stats_7_days:
-            text += f"{stat['date']:12} | {stat['sales']:7} | {stat['revenue']:7} ⭐\n"
+        for date, sales, revenue in zip(series['dates'], series['sales'], series['revenue']):
+            text += f"{date.strftime('%a, %d.%m'):12} | {sales:7} | {revenue:7} ⭐\n"
         
         text += "</code>"
         
@@ -2047,7 +1842,7 @@ async def sales_daily(callback: CallbackQuery):
 async def sales_details(callback: CallbackQuery):
     """Детали продаж"""
     try:
-        products = db.cursor.execute('''
+        products = await db.fetchall('''
             SELECT 
                 product_type,
                 product_duration,
@@ -2057,7 +1852,7 @@ async def sales_details(callback: CallbackQuery):
             WHERE status = 'completed'
             GROUP BY product_type, product_duration
             ORDER BY revenue DESC
-        ''').fetchall()
+        ''')
         
         text = "📊 <b>Статистика продаж по типам</b>\n\n"
         
@@ -2090,14 +1885,14 @@ async def sales_details(callback: CallbackQuery):
 async def sales_list(callback: CallbackQuery):
     """Список платежей"""
     try:
-        payments = db.cursor.execute('''
+        payments = await db.fetchall('''
             SELECT sp.*, u.username, u.telegram_id
             FROM star_payments sp
             JOIN users u ON sp.user_id = u.id
             WHERE sp.status = 'completed'
             ORDER BY sp.created_at DESC
             LIMIT 15
-        ''').fetchall()
+        ''')
         
         if not payments:
             await callback.answer("❌ Платежи не найдены", show_alert=True)
@@ -2172,15 +1967,13 @@ async def send_like_notification(bot, from_profile: dict, to_profile: dict, to_t
     """Отправка уведомления о лайке"""
     try:
         # Получаем количество лайков у пользователя
-        db.cursor.execute('''
+        result = await db.fetchone('''
             SELECT COUNT(*) as like_count 
             FROM likes 
             WHERE to_profile_id = ? 
             AND like_type = 'like' 
             AND is_mutual = 0
         ''', (to_profile['id'],))
-        
-        result = db.cursor.fetchone()
         like_count = result['like_count'] if result else 0
         
         # Создаем текст уведомления
@@ -2214,11 +2007,11 @@ async def handle_mutual_match(message, user_id: int, user_profile: dict, liked_p
             f"💝 <b>Вы и {liked_profile['name']} понравились друг другу!</b>\n\n"
             f"💌 <b>Можете написать {liked_profile['name']}!</b>",
             parse_mode="HTML",
-            reply_markup=get_write_message_keyboard(db.get_telegram_id_by_profile_id(liked_profile['id']))
+            reply_markup=get_write_message_keyboard(await db.get_telegram_id_by_profile_id(liked_profile['id']))
         )
         
         # Отправляем уведомление второму пользователю
-        target_telegram_id = db.get_telegram_id_by_profile_id(liked_profile['id'])
+        target_telegram_id = await db.get_telegram_id_by_profile_id(liked_profile['id'])
         if target_telegram_id:
             try:
                 await message.bot.send_message(
@@ -2239,33 +2032,13 @@ async def handle_mutual_match(message, user_id: int, user_profile: dict, liked_p
 async def sales_daily(callback: CallbackQuery):
     """Продажи по дням"""
     try:
-        stats_7_days = []
-        for i in range(6, -1, -1):
-            date = datetime.now() - timedelta(days=i)
-            start_of_day = int(date.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
-            end_of_day = start_of_day + 86400
-            
-            sales = db.cursor.execute(
-                "SELECT COUNT(*) FROM star_payments WHERE status = 'completed' AND created_at BETWEEN ? AND ?",
-                (start_of_day, end_of_day)
-            ).fetchone()[0]
-            
-            revenue = db.cursor.execute(
-                "SELECT SUM(stars_amount) FROM star_payments WHERE status = 'completed' AND created_at BETWEEN ? AND ?",
-                (start_of_day, end_of_day)
-            ).fetchone()[0] or 0
-            
-            stats_7_days.append({
-                'date': date.strftime('%a, %d.%m'),
-                'sales': sales,
-                'revenue': revenue
-            })
+        series = await get_daily_series(db, ['sales', 'revenue'], days=7)
         
         text = "💰 <b>Продажи по дням (7 дней)</b>\n\n<code>"
         text += "День         | Продажи | Выручка\n─────────────|─────────|─────────\n"
         
-        for stat in stats_7_days:
-            text += f"{stat['date']:12} | {stat['sales']:7} | {stat['revenue']:7} ⭐\n"
+        for date, sales, revenue in zip(series['dates'], series['sales'], series['revenue']):
+            text += f"{date.strftime('%a, %d.%m'):12} | {sales:7} | {revenue:7} ⭐\n"
         
         text += "</code>"
         
@@ -2289,7 +2062,7 @@ async def sales_daily(callback: CallbackQuery):
 async def sales_details(callback: CallbackQuery):
     """Детали продаж"""
     try:
-        products = db.cursor.execute('''
+        products = await db.fetchall('''
             SELECT 
                 product_type,
                 product_duration,
@@ -2299,7 +2072,7 @@ async def sales_details(callback: CallbackQuery):
             WHERE status = 'completed'
             GROUP BY product_type, product_duration
             ORDER BY revenue DESC
-        ''').fetchall()
+        ''')
         
         text = "📊 <b>Статистика продаж по типам</b>\n\n"
         
@@ -2332,14 +2105,14 @@ async def sales_details(callback: CallbackQuery):
 async def sales_list(callback: CallbackQuery):
     """Список платежей"""
     try:
-        payments = db.cursor.execute('''
+        payments = await db.fetchall('''
             SELECT sp.*, u.username, u.telegram_id
             FROM star_payments sp
             JOIN users u ON sp.user_id = u.id
             WHERE sp.status = 'completed'
             ORDER BY sp.created_at DESC
             LIMIT 15
-        ''').fetchall()
+        ''')
         
         if not payments:
             await callback.answer("❌ Платежи не найдены", show_alert=True)
@@ -2414,15 +2187,13 @@ async def send_like_notification(bot, from_profile: dict, to_profile: dict, to_t
     """Отправка уведомления о лайке"""
     try:
         # Получаем количество лайков у пользователя
-        db.cursor.execute('''
+        result = await db.fetchone('''
             SELECT COUNT(*) as like_count 
             FROM likes 
             WHERE to_profile_id = ? 
             AND like_type = 'like' 
             AND is_mutual = 0
         ''', (to_profile['id'],))
-        
-        result = db.cursor.fetchone()
         like_count = result['like_count'] if result else 0
         
         # Создаем текст уведомления
@@ -2456,11 +2227,11 @@ async def handle_mutual_match(message, user_id: int, user_profile: dict, liked_p
             f"💝 <b>Вы и {liked_profile['name']} понравились друг другу!</b>\n\n"
             f"💌 <b>Можете написать {liked_profile['name']}!</b>",
             parse_mode="HTML",
-            reply_markup=get_write_message_keyboard(db.get_telegram_id_by_profile_id(liked_profile['id']))
+            reply_markup=get_write_message_keyboard(await db.get_telegram_id_by_profile_id(liked_profile['id']))
         )
         
         # Отправляем уведомление второму пользователю
-        target_telegram_id = db.get_telegram_id_by_profile_id(liked_profile['id'])
+        target_telegram_id = await db.get_telegram_id_by_profile_id(liked_profile['id'])
         if target_telegram_id:
             try:
                 await message.bot.send_message(
@@ -4,16 +4,18 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery, PreCheckoutQuery, LabeledPrice, SuccessfulPayment, InlineKeyboardMarkup, InlineKeyboardButton
 from datetime import datetime
+from typing import Optional
 import asyncio
 
 from handlers.profile_creation import ProfileCreation
-from models import Database
+from middlewares.user_context import UserContext
+from services.async_db import get_db
 from keyboards.replay import *
 from keyboards.inline_premium import *
 
 
 router = Router()
-db = Database()
+db = get_db()
 
 class PremiumStates(StatesGroup):
     """Состояния для премиум системы"""
@@ -21,16 +23,15 @@ class PremiumStates(StatesGroup):
     referral_program = State()
 
 @router.message(F.text == "⭐ Премиум")
-async def show_premium_menu(message: Message, state: FSMContext):
+async def show_premium_menu(message: Message, state: FSMContext, user_context: UserContext):
     """Показать меню премиум подписки"""
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    
+    user_id = user_context.user_id
     if not user_id:
         await message.answer("❌ <b>Сначала создайте анкету через /start!</b>", parse_mode="HTML")
         return
     
     # Проверяем статус премиум подписки
-    premium_status = db.get_user_premium_status(user_id)
+    premium_status = await user_context.premium_status()
     
     if premium_status:
         # Пользователь уже имеет премиум
@@ -56,10 +57,9 @@ async def show_premium_menu(message: Message, state: FSMContext):
         )
 
 @router.message(F.text == "🎁 Бесплатный премиум")
-async def show_free_premium(message: Message, state: FSMContext):
+async def show_free_premium(message: Message, state: FSMContext, user_context: UserContext):
     """Показать информацию о бесплатном премиуме"""
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    
+    user_id = user_context.user_id
     if not user_id:
         await message.answer("❌ <b>Сначала создайте анкету через /start!</b>", parse_mode="HTML")
         return
@@ -67,18 +67,18 @@ async def show_free_premium(message: Message, state: FSMContext):
     print(f"DEBUG: Показ бесплатного премиума для user_id={user_id}")
     
     # Получаем или создаем реферальный код
-    referral_info = db.get_referral_code(user_id)
+    referral_info = await db.get_referral_code(user_id)
     
     if not referral_info:
         print(f"DEBUG: Создаем новый реферальный код для user_id={user_id}")
         # Создаем реферальный код, если его нет
-        referral_code = db.create_referral_code(user_id)
-        referral_info = db.get_referral_code(user_id)
+        referral_code = await db.create_referral_code(user_id)
+        referral_info = await db.get_referral_code(user_id)
     else:
         print(f"DEBUG: Используем существующий код: {referral_info['code']}")
     
     # Получаем статистику по рефералам
-    referral_stats = db.get_referral_stats(user_id)
+    referral_stats = await user_context.referral_stats()
     print(f"DEBUG: Статистика рефералов: total={referral_stats['total']}, completed={referral_stats['completed']}")
     
     # Создаем реферальную ссылку
@@ -91,7 +91,7 @@ async def show_free_premium(message: Message, state: FSMContext):
         print(f"❌ Ошибка получения информации о боте: {e}")
         referral_link = f"Используйте код: {referral_info['code']}"
     
-    progress_bar = "▓" * referral_stats['completed'] + "░" * (10 - referral_stats['completed'])
+    progress_bar = "▓" * min(referral_stats['completed'], 10) + "░" * max(0, 10 - referral_stats['completed'])
     
     await message.answer(
         f"🎁 <b>Бесплатный премиум</b>\n\n"
@@ -152,10 +152,8 @@ async def show_premium_benefits(message: Message):
     )
 
 @router.message(F.text == "💰 Тарифы и оплата")
-async def show_premium_tariffs(message: Message, state: FSMContext):
+async def show_premium_tariffs(message: Message, state: FSMContext, user_id: Optional[int]):
     """Показать тарифы премиум подписки"""
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    
     if not user_id:
         await message.answer("❌ <b>Сначала создайте анкету через /start!</b>", parse_mode="HTML")
         return
@@ -200,10 +198,8 @@ async def show_premium_tariffs(message: Message, state: FSMContext):
     await state.set_state(PremiumStates.choosing_tariff)
 
 @router.message(PremiumStates.choosing_tariff, F.text.startswith("⭐ "))
-async def process_tariff_selection(message: Message, state: FSMContext):
+async def process_tariff_selection(message: Message, state: FSMContext, user_id: Optional[int]):
     """Обработка выбора тарифа"""
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    
     if not user_id:
         await message.answer("❌ <b>Сначала создайте анкету через /start!</b>", parse_mode="HTML")
         await state.clear()
@@ -237,7 +233,7 @@ async def process_tariff_selection(message: Message, state: FSMContext):
         return
     
     # Создаем запись о платеже
-    payment_id, payload = db.create_star_payment(
+    payment_id, payload = await db.create_star_payment(
         user_id, stars_amount, 'premium', duration_days
     )
     
@@ -270,29 +266,28 @@ async def process_tariff_selection(message: Message, state: FSMContext):
     )
 
 @router.message(F.text == "📢 Пригласить друзей")
-async def invite_friends(message: Message, state: FSMContext):
+async def invite_friends(message: Message, state: FSMContext, user_context: UserContext):
     """Пригласить друзей по реферальной ссылке"""
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    
+    user_id = user_context.user_id
     if not user_id:
         await message.answer("❌ <b>Сначала создайте анкету через /start!</b>", parse_mode="HTML")
         return
     
     # Получаем реферальный код
-    referral_info = db.get_referral_code(user_id)
+    referral_info = await db.get_referral_code(user_id)
     
     if not referral_info:
-        referral_code = db.create_referral_code(user_id)
-        referral_info = db.get_referral_code(user_id)
+        referral_code = await db.create_referral_code(user_id)
+        referral_info = await db.get_referral_code(user_id)
     
     # Создаем реферальную ссылку
     bot_username = (await message.bot.get_me()).username
     referral_link = f"https://t.me/{bot_username}?start={referral_info['code']}"
     
     # Получаем статистику
-    referral_stats = db.get_referral_stats(user_id)
+    referral_stats = await user_context.referral_stats()
     
-    progress_bar = "▓" * referral_stats['completed'] + "░" * (10 - referral_stats['completed'])
+    progress_bar = "▓" * min(referral_stats['completed'], 10) + "░" * max(0, 10 - referral_stats['completed'])
     
     invite_message = (
         f"📢 <b>Пригласите друзей и получите премиум БЕСПЛАТНО!</b>\n\n"
@@ -327,21 +322,20 @@ async def invite_friends(message: Message, state: FSMContext):
     )
 
 @router.message(F.text == "📊 Моя реферальная статистика")
-async def show_referral_stats(message: Message):
+async def show_referral_stats(message: Message, user_context: UserContext):
     """Показать реферальную статистику"""
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    
+    user_id = user_context.user_id
     if not user_id:
         await message.answer("❌ <b>Сначала создайте анкету через /start!</b>", parse_mode="HTML")
         return
     
-    referral_stats = db.get_referral_stats(user_id)
-    referral_info = db.get_referral_code(user_id)
+    referral_stats = await user_context.referral_stats()
+    referral_info = await db.get_referral_code(user_id)
     
     if not referral_info:
         referral_info = {'code': 'Нет кода', 'uses': 0, 'max_uses': 10}
     
-    progress_bar = "▓" * referral_stats['completed'] + "░" * (10 - referral_stats['completed'])
+    progress_bar = "▓" * min(referral_stats['completed'], 10) + "░" * max(0, 10 - referral_stats['completed'])
     
     stats_message = (
         f"📊 <b>Ваша реферальная статистика</b>\n\n"
@@ -351,8 +345,8 @@ async def show_referral_stats(message: Message):
         
         f"📈 <b>Статистика приглашений:</b>\n"
         f"👥 <b>Всего приглашено:</b> {referral_stats['total']}\n"
-        f"✅ <b>Создали анкеты:</b> {referral_stats['completed']}\n"
-        f"⏳ <b>В процессе:</b> {referral_stats['total'] - referral_stats['completed']}\n\n"
+        f"✅ <b>Создали анкеты:</b> {referral_stats['completed'] + referral_stats['rewarded']}\n"
+        f"⏳ <b>В процессе:</b> {referral_stats['total'] - referral_stats['completed'] - referral_stats['rewarded']}\n\n"
         
         f"🎯 <b>Прогресс к бесплатному премиуму:</b>\n"
         f"📋 <b>Необходимо:</b> 10 друзей с анкетами\n"
@@ -377,16 +371,15 @@ async def show_referral_stats(message: Message):
     )
 
 @router.message(F.text == "🎁 Получить награду")
-async def claim_referral_reward(message: Message):
+async def claim_referral_reward(message: Message, user_context: UserContext):
     """Получить награду за рефералов"""
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    
+    user_id = user_context.user_id
     if not user_id:
         await message.answer("❌ <b>Сначала создайте анкету через /start!</b>", parse_mode="HTML")
         return
     
     # Пытаемся получить награду
-    success = db.claim_referral_reward(user_id)
+    success = await db.claim_referral_reward(user_id)
     
     if success:
         await message.answer(
@@ -399,9 +392,9 @@ async def claim_referral_reward(message: Message):
             reply_markup=get_main_menu_keyboard()
         )
     else:
-        referral_stats = db.get_referral_stats(user_id)
+        referral_stats = await user_context.referral_stats()
         
-        progress_bar = "▓" * referral_stats['completed'] + "░" * (10 - referral_stats['completed'])
+        progress_bar = "▓" * min(referral_stats['completed'], 10) + "░" * max(0, 10 - referral_stats['completed'])
         
         await message.answer(
             f"❌ <b>Недостаточно приглашенных друзей</b>\n\n"
@@ -418,24 +411,19 @@ async def claim_referral_reward(message: Message):
         )
 
 @router.message(F.text == "📊 Моя статистика")
-async def show_user_stats(message: Message):
+async def show_user_stats(message: Message, user_context: UserContext):
     """Показать общую статистику пользователя"""
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    
+    user_id = user_context.user_id
     if not user_id:
         await message.answer("❌ <b>Сначала создайте анкету через /start!</b>", parse_mode="HTML")
         return
     
     # Получаем различные статистики
-    referral_stats = db.get_referral_stats(user_id)
-    premium_status = db.get_user_premium_status(user_id)
+    referral_stats = await user_context.referral_stats()
+    premium_status = await user_context.premium_status()
     
     # Получаем дату регистрации
-    db.cursor.execute('''
-        SELECT created_at FROM users WHERE id = ?
-    ''', (user_id,))
-    
-    user_data = db.cursor.fetchone()
+    user_data = await user_context.user()
     
     if user_data:
         reg_date = datetime.fromtimestamp(user_data['created_at']).strftime('%d.%m.%Y')
@@ -451,7 +439,7 @@ async def show_user_stats(message: Message):
         
         "👥 <b>Реферальная программа:</b>\n"
         f"📢 <b>Приглашено друзей:</b> {referral_stats['total']}\n"
-        f"✅ <b>Создали анкеты:</b> {referral_stats['completed']}\n"
+        f"✅ <b>Создали анкеты:</b> {referral_stats['completed'] + referral_stats['rewarded']}\n"
         f"🎯 <b>До награды:</b> {max(0, 10 - referral_stats['completed'])}\n\n"
     )
     
@@ -473,18 +461,18 @@ async def show_user_stats(message: Message):
         )
     
     # Добавляем мотивацию
-    if referral_stats['completed'] < 5:
+    if referral_stats['completed'] >= 5:
+        stats_message += (
+            "🎯 <b>Вы близки к цели!</b>\n"
+            f"✅ Осталось всего {max(0, 10 - referral_stats['completed'])} друзей!\n"
+            "💪 Продолжайте в том же духе!"
+        )
+    elif not referral_stats['rewarded']:
         stats_message += (
             "💡 <b>Совет:</b>\n"
             "📢 Пригласите еще друзей, чтобы получить бесплатный премиум!\n"
             "🌟 Это откроет вам все возможности бота."
         )
-    elif referral_stats['completed'] < 10:
-        stats_message += (
-            "🎯 <b>Вы близки к цели!</b>\n"
-            f"✅ Осталось всего {10 - referral_stats['completed']} друзей!\n"
-            "💪 Продолжайте в том же духе!"
-        )
     else:
         stats_message += (
             "🏆 <b>Поздравляем!</b>\n"
@@ -499,9 +487,9 @@ async def show_user_stats(message: Message):
     )
 
 @router.message(F.text == "🔙 Назад в премиум меню")
-async def back_to_premium_menu(message: Message, state: FSMContext):
+async def back_to_premium_menu(message: Message, state: FSMContext, user_context: UserContext):
     """Вернуться в меню премиума"""
-    await show_premium_menu(message, state)
+    await show_premium_menu(message, state, user_context)
 
 @router.message(F.text == "🏠 Главное меню")
 async def back_to_main_menu(message: Message, state: FSMContext):
@@ -528,12 +516,10 @@ async def start_with_referral(message: Message, state: FSMContext):
         print(f"DEBUG: Обнаружен реферальный код: {referral_code}")
         
         # Находим пользователя по реферальному коду
-        db.cursor.execute('''
+        result = await db.fetchone('''
             SELECT user_id FROM referral_codes WHERE code = ?
         ''', (referral_code,))
         
-        result = db.cursor.fetchone()
-        
         if result:
             referrer_id = result['user_id']
             referred_telegram_id = message.from_user.id
@@ -541,7 +527,7 @@ async def start_with_referral(message: Message, state: FSMContext):
             print(f"DEBUG: Найден реферер ID: {referrer_id} для кода: {referral_code}")
             
             # Проверяем, не приглашает ли пользователь сам себя
-            referrer_telegram_id = db.get_telegram_id_by_user_id(referrer_id)
+            referrer_telegram_id = await db.get_telegram_id_by_user_id(referrer_id)
             if referrer_telegram_id == referred_telegram_id:
                 print(f"DEBUG: Пользователь пытается использовать свою же ссылку")
                 referral_code = None
@@ -555,11 +541,11 @@ async def start_with_referral(message: Message, state: FSMContext):
         referral_code = None
     
     # Создаем пользователя если его нет
-    user_id = db.add_user(message.from_user.id, message.from_user.username)
+    user_id = await db.add_user(message.from_user.id, message.from_user.username)
     print(f"DEBUG: Создан/найден пользователь с ID: {user_id}")
     
     # Проверяем, есть ли уже анкета
-    profile = db.get_user_profile(message.from_user.id)
+    profile = await db.get_user_profile(message.from_user.id)
     
     if profile:
         # Если анкета есть, показываем главное меню
@@ -590,12 +576,10 @@ async def process_referral_code(message: Message, referral_code: str):
         print(f"DEBUG: Начало обработки реферального кода: {referral_code}")
         
         # Находим пользователя по реферальному коду
-        db.cursor.execute('''
+        result = await db.fetchone('''
             SELECT user_id FROM referral_codes WHERE code = ?
         ''', (referral_code,))
         
-        result = db.cursor.fetchone()
-        
         if not result:
             print(f"DEBUG: Реферальный код не найден в БД")
             return
@@ -604,7 +588,7 @@ async def process_referral_code(message: Message, referral_code: str):
         print(f"DEBUG: Найден реферер ID: {referrer_id}")
         
         # Получаем ID приглашенного пользователя
-        referred_user_id = db.get_user_id_by_telegram_id(message.from_user.id)
+        referred_user_id = await db.get_user_id_by_telegram_id(message.from_user.id)
         print(f"DEBUG: Приглашенный пользователь ID: {referred_user_id}")
         
         if not referred_user_id:
@@ -621,12 +605,10 @@ async def process_referral_code(message: Message, referral_code: str):
             return
         
         # Проверяем, не был ли уже добавлен этот реферал
-        db.cursor.execute('''
+        existing_referral = await db.fetchone('''
             SELECT id FROM referrals WHERE referrer_id = ? AND referred_id = ?
         ''', (referrer_id, referred_user_id))
         
-        existing_referral = db.cursor.fetchone()
-        
         if existing_referral:
             print(f"DEBUG: Реферал уже существует")
             await message.answer(
@@ -637,17 +619,17 @@ async def process_referral_code(message: Message, referral_code: str):
         
         print(f"DEBUG: Добавление реферала: {referrer_id} -> {referred_user_id}")
         # Добавляем реферала
-        success = db.add_referral(referrer_id, referred_user_id)
+        success = await db.add_referral(referrer_id, referred_user_id)
         
         if success:
             print(f"DEBUG: Реферал успешно добавлен")
             
             # Отправляем уведомление пригласившему
-            referrer_telegram_id = db.get_telegram_id_by_user_id(referrer_id)
+            referrer_telegram_id = await db.get_telegram_id_by_user_id(referrer_id)
             
             if referrer_telegram_id:
                 try:
-                    referral_stats = db.get_referral_stats(referrer_id)
+                    referral_stats = await db.get_referral_stats(referrer_id)
                     
                     await message.bot.send_message(
                         chat_id=referrer_telegram_id,
@@ -756,48 +738,60 @@ async def premium_back(callback: CallbackQuery):
 @router.pre_checkout_query()
 async def pre_checkout_query(pre_checkout_query: PreCheckoutQuery):
     """Обработка предварительного запроса на оплату"""
+    user_id = await db.get_user_id_by_telegram_id(pre_checkout_query.from_user.id)
+    
+    error = await db.pre_check_star_payment(
+        pre_checkout_query.invoice_payload,
+        user_id,
+        pre_checkout_query.total_amount,
+        pre_checkout_query.currency
+    )
+    
+    if error:
+        await pre_checkout_query.answer(ok=False, error_message=error)
+        return
+    
     await pre_checkout_query.answer(ok=True)
 
 @router.message(F.successful_payment)
-async def successful_payment(message: Message):
+async def successful_payment(message: Message, user_id: Optional[int]):
     """Обработка успешного платежа"""
     payment = message.successful_payment
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
     
     if not user_id:
         return
     
-    # Обрабатываем платеж
-    if payment.invoice_payload.startswith("payment_"):
-        try:
-            payment_id = int(payment.invoice_payload.split("_")[1])
-            
-            success = db.complete_star_payment(
-                payment_id,
-                payment.telegram_payment_charge_id,
-                payment.provider_payment_charge_id
-            )
-            
-            if success:
-                await message.answer(
-                    "✅ <b>Платеж успешно завершен!</b>\n\n"
-                    "🎉 Ваша премиум подписка активирована.\n"
-                    "🌟 Наслаждайтесь всеми преимуществами!",
-                    parse_mode="HTML",
-                    reply_markup=get_main_menu_keyboard()
-                )
-        except Exception as e:
-            print(f"❌ Ошибка обработки платежа: {e}")
-            await message.answer(
-                "⚠️ <b>Произошла ошибка при обработке платежа.</b>\n"
-                "Пожалуйста, свяжитесь с поддержкой.",
-                parse_mode="HTML"
-            )
+    result = await db.complete_star_payment(
+        payment.invoice_payload,
+        payment.telegram_payment_charge_id,
+        payment.provider_payment_charge_id,
+        user_id,
+        payment.total_amount
+    )
+    
+    # Повторная доставка уже учтенного платежа
+    if result == 'duplicate':
+        return
+    
+    if result == 'completed':
+        await message.answer(
+            "✅ <b>Платеж успешно завершен!</b>\n\n"
+            "🎉 Ваша премиум подписка активирована.\n"
+            "🌟 Наслаждайтесь всеми преимуществами!",
+            parse_mode="HTML",
+            reply_markup=get_main_menu_keyboard()
+        )
+    else:
+        await message.answer(
+            "⚠️ <b>Произошла ошибка при обработке платежа.</b>\n"
+            "Пожалуйста, свяжитесь с поддержкой.",
+            parse_mode="HTML"
+        )
 
 @router.message(Command("referral"))
-async def referral_command(message: Message):
+async def referral_command(message: Message, user_context: UserContext):
     """Команда для работы с реферальной системой"""
-    await show_free_premium(message, None)
+    await show_free_premium(message, None, user_context)
 
 @router.callback_query(F.data == "how_to_write_message")
 async def how_to_write_message(callback: CallbackQuery):
@@ -4,15 +4,17 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery, FSInputFile, PhotoSize
 from aiogram.types.input_media_photo import InputMediaPhoto
-from typing import List
+from typing import List, Optional
 import re
 
-from models import Database
+from middlewares.user_context import UserContext
+from services.async_db import get_db
+from services.geo import normalize_city
 from keyboards.replay import *
 from keyboards.inline import *
 
 router = Router()
-db = Database()
+db = get_db()
 
 class ProfileCreation(StatesGroup):
     """Состояния для создания анкеты"""
@@ -30,10 +32,10 @@ async def start_command(message: Message, state: FSMContext):
     """Обработчик команды /start"""
     
     # Добавляем пользователя в базу
-    db.add_user(message.from_user.id, message.from_user.username)
+    await db.add_user(message.from_user.id, message.from_user.username)
     
     # Проверяем, есть ли уже анкета
-    profile = db.get_user_profile(message.from_user.id)
+    profile = await db.get_user_profile(message.from_user.id)
     
     if profile:
         # Если анкета есть, показываем главное меню
@@ -206,7 +208,7 @@ async def process_city(message: Message, state: FSMContext):
         )
         return
     
-    await state.update_data(city=message.text.title())
+    await state.update_data(city=normalize_city(message.text))
     
     # Переходим к выбору интересов
     await message.answer(
@@ -363,16 +365,16 @@ async def finish_registration(message: Message, state: FSMContext):
         return
     
     # Создаем анкету в базе данных
-    user_id = db.add_user(message.from_user.id, message.from_user.username)
-    profile_id = db.create_profile(user_id, data)
+    user_id = await db.add_user(message.from_user.id, message.from_user.username)
+    profile_id = await db.create_profile(user_id, data)
     
     if profile_id:
         # Сохраняем фотографии
         for i, photo in enumerate(photos):
-            db.add_photo(profile_id, photo['file_id'], photo['file_unique_id'], i)
+            await db.add_photo(profile_id, photo['file_id'], photo['file_unique_id'], i)
         
         # Получаем созданную анкету для показа
-        profile = db.get_user_profile(message.from_user.id)
+        profile = await db.get_user_profile(message.from_user.id)
         
         # Формируем сообщение с анкетой
         profile_text = format_profile_text(profile)
@@ -457,18 +459,18 @@ def format_profile_text(profile: dict) -> str:
 # ========== ОБРАБОТЧИКИ ГЛАВНОГО МЕНЮ ==========
 
 @router.message(F.text == "👤 Моя анкета")
-async def show_my_profile(message: Message, state: FSMContext):
+async def show_my_profile(message: Message, state: FSMContext, user_id: Optional[int]):
     """Показ своей анкеты - теперь перенаправляет в profile_management"""
     # Импортируем здесь, чтобы избежать циклического импорта
     from handlers.profile_management import my_profile_menu
-    await my_profile_menu(message, state)
+    await my_profile_menu(message, state, user_id)
 
 @router.message(F.text == "🔍 Смотреть анкеты")
-async def show_profiles(message: Message, state: FSMContext):
+async def show_profiles(message: Message, state: FSMContext, user_context: UserContext):
     """Показ анкет других пользователей - теперь перенаправляет в profile_view"""
     # Импортируем здесь, чтобы избежать циклического импорта
     from handlers.profile_view import start_viewing_profiles
-    await start_viewing_profiles(message, state)
+    await start_viewing_profiles(message, state, user_context)
 
 # ========== ОБРАБОТЧИК ДЛЯ КОМАНДЫ HELP ==========
 
@@ -7,12 +7,15 @@ from typing import List, Optional
 import asyncio
 from datetime import datetime
 
-from models import Database
+from services.async_db import get_db
+from services.geo import normalize_city
+from services.prefetch import get_prefetcher
 from keyboards.replay import *
 from keyboards.inline import get_interests_keyboard
 
 router = Router()
-db = Database()
+db = get_db()
+prefetcher = get_prefetcher()
 
 class EditProfileStates(StatesGroup):
     """Состояния для редактирования анкеты"""
@@ -28,10 +31,8 @@ class EditProfileStates(StatesGroup):
     confirm_delete = State()
 
 @router.message(F.text == "👤 Моя анкета")
-async def my_profile_menu(message: Message, state: FSMContext):
+async def my_profile_menu(message: Message, state: FSMContext, user_id: Optional[int]):
     """Меню работы с анкетой"""
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    
     if not user_id:
         await message.answer(
             "У вас еще нет анкеты. Создайте её через команду /start",
@@ -39,7 +40,7 @@ async def my_profile_menu(message: Message, state: FSMContext):
         )
         return
     
-    profile_exists = db.is_profile_exists(user_id)
+    profile_exists = await db.is_profile_exists(user_id)
     
     if not profile_exists:
         await message.answer(
@@ -58,7 +59,7 @@ async def my_profile_menu(message: Message, state: FSMContext):
 @router.message(F.text == "👀 Посмотреть анкету")
 async def view_my_profile(message: Message):
     """Просмотр своей анкеты"""
-    profile = db.get_user_profile(message.from_user.id)
+    profile = await db.get_user_profile(message.from_user.id)
     
     if not profile:
         await message.answer(
@@ -116,10 +117,8 @@ async def view_my_profile(message: Message):
         )
 
 @router.message(F.text == "✏️ Редактировать анкету")
-async def edit_profile_menu(message: Message, state: FSMContext):
+async def edit_profile_menu(message: Message, state: FSMContext, user_id: Optional[int]):
     """Меню редактирования анкеты"""
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    
     if not user_id:
         await message.answer(
             "У вас еще нет анкеты. Создайте её через команду /start",
@@ -127,7 +126,7 @@ async def edit_profile_menu(message: Message, state: FSMContext):
         )
         return
     
-    profile_exists = db.is_profile_exists(user_id)
+    profile_exists = await db.is_profile_exists(user_id)
     
     if not profile_exists:
         await message.answer(
@@ -155,7 +154,7 @@ async def edit_name_start(message: Message, state: FSMContext):
     await state.set_state(EditProfileStates.edit_name)
 
 @router.message(EditProfileStates.edit_name)
-async def edit_name_process(message: Message, state: FSMContext):
+async def edit_name_process(message: Message, state: FSMContext, user_id: Optional[int]):
     """Обработка изменения имени"""
     if message.text == "❌ Отмена":
         await state.clear()
@@ -172,11 +171,10 @@ async def edit_name_process(message: Message, state: FSMContext):
         )
         return
     
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    profile = db.get_user_profile_by_user_id(user_id)
+    profile = await db.get_user_profile_by_user_id(user_id)
     
     if profile:
-        success = db.update_profile(profile['id'], 'name', message.text)
+        success = await db.update_profile(profile['id'], 'name', message.text)
         
         if success:
             await message.answer(
@@ -208,7 +206,7 @@ async def edit_age_start(message: Message, state: FSMContext):
     await state.set_state(EditProfileStates.edit_age)
 
 @router.message(EditProfileStates.edit_age)
-async def edit_age_process(message: Message, state: FSMContext):
+async def edit_age_process(message: Message, state: FSMContext, user_id: Optional[int]):
     """Обработка изменения возраста"""
     if message.text == "❌ Отмена":
         await state.clear()
@@ -241,13 +239,13 @@ async def edit_age_process(message: Message, state: FSMContext):
         )
         return
     
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    profile = db.get_user_profile_by_user_id(user_id)
+    profile = await db.get_user_profile_by_user_id(user_id)
     
     if profile:
-        success = db.update_profile(profile['id'], 'age', str(age))
+        success = await db.update_profile(profile['id'], 'age', str(age))
         
         if success:
+            prefetcher.discard(user_id)
             await message.answer(
                 f"✅ Возраст успешно изменен на: {age}",
                 reply_markup=get_edit_profile_keyboard()
@@ -275,7 +273,7 @@ async def edit_gender_start(message: Message, state: FSMContext):
     await state.set_state(EditProfileStates.edit_gender)
 
 @router.message(EditProfileStates.edit_gender, F.text.in_(["👨 Мужчина", "👩 Женщина", "🧑 Другой"]))
-async def edit_gender_process(message: Message, state: FSMContext):
+async def edit_gender_process(message: Message, state: FSMContext, user_id: Optional[int]):
     """Обработка изменения пола"""
     gender_map = {
         "👨 Мужчина": "Мужчина",
@@ -285,13 +283,13 @@ async def edit_gender_process(message: Message, state: FSMContext):
     
     gender = gender_map[message.text]
     
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    profile = db.get_user_profile_by_user_id(user_id)
+    profile = await db.get_user_profile_by_user_id(user_id)
     
     if profile:
-        success = db.update_profile(profile['id'], 'gender', gender)
+        success = await db.update_profile(profile['id'], 'gender', gender)
         
         if success:
+            prefetcher.discard(user_id)
             await message.answer(
                 f"✅ Пол успешно изменен на: {gender}",
                 reply_markup=get_edit_profile_keyboard()
@@ -327,7 +325,7 @@ async def edit_looking_for_start(message: Message, state: FSMContext):
     await state.set_state(EditProfileStates.edit_looking_for)
 
 @router.message(EditProfileStates.edit_looking_for, F.text.in_(["👨 Парня", "👩 Девушку", "👥 Оба"]))
-async def edit_looking_for_process(message: Message, state: FSMContext):
+async def edit_looking_for_process(message: Message, state: FSMContext, user_id: Optional[int]):
     """Обработка изменения кого ищет"""
     looking_map = {
         "👨 Парня": "Парня",
@@ -337,13 +335,13 @@ async def edit_looking_for_process(message: Message, state: FSMContext):
     
     looking_for = looking_map[message.text]
     
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    profile = db.get_user_profile_by_user_id(user_id)
+    profile = await db.get_user_profile_by_user_id(user_id)
     
     if profile:
-        success = db.update_profile(profile['id'], 'looking_for', looking_for)
+        success = await db.update_profile(profile['id'], 'looking_for', looking_for)
         
         if success:
+            prefetcher.discard(user_id)
             await message.answer(
                 f"✅ Теперь вы ищете: {looking_for}",
                 reply_markup=get_edit_profile_keyboard()
@@ -379,7 +377,7 @@ async def edit_city_start(message: Message, state: FSMContext):
     await state.set_state(EditProfileStates.edit_city)
 
 @router.message(EditProfileStates.edit_city)
-async def edit_city_process(message: Message, state: FSMContext):
+async def edit_city_process(message: Message, state: FSMContext, user_id: Optional[int]):
     """Обработка изменения города"""
     if message.text == "❌ Отмена":
         await state.clear()
@@ -396,15 +394,16 @@ async def edit_city_process(message: Message, state: FSMContext):
         )
         return
     
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    profile = db.get_user_profile_by_user_id(user_id)
+    profile = await db.get_user_profile_by_user_id(user_id)
     
     if profile:
-        success = db.update_profile(profile['id'], 'city', message.text.title())
+        city = normalize_city(message.text)
+        success = await db.update_profile(profile['id'], 'city', city)
         
         if success:
+            prefetcher.discard(user_id)
             await message.answer(
-                f"✅ Город успешно изменен на: {message.text.title()}",
+                f"✅ Город успешно изменен на: {city}",
                 reply_markup=get_edit_profile_keyboard()
             )
         else:
@@ -421,10 +420,9 @@ async def edit_city_process(message: Message, state: FSMContext):
     await state.clear()
 
 @router.message(F.text == "✏️ Изменить интересы")
-async def edit_interests_start(message: Message, state: FSMContext):
+async def edit_interests_start(message: Message, state: FSMContext, user_id: Optional[int]):
     """Начало изменения интересов"""
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    profile = db.get_user_profile_by_user_id(user_id)
+    profile = await db.get_user_profile_by_user_id(user_id)
     
     if not profile:
         await message.answer(
@@ -464,7 +462,7 @@ async def edit_interest_selection(callback: CallbackQuery, state: FSMContext):
     await callback.answer()
 
 @router.callback_query(EditProfileStates.edit_interests, F.data == "interests_done")
-async def edit_interests_done(callback: CallbackQuery, state: FSMContext):
+async def edit_interests_done(callback: CallbackQuery, state: FSMContext, user_id: Optional[int]):
     """Завершение выбора интересов при редактировании"""
     data = await state.get_data()
     current_interests = data.get('current_interests', [])
@@ -473,13 +471,13 @@ async def edit_interests_done(callback: CallbackQuery, state: FSMContext):
         await callback.answer("Выберите хотя бы один интерес!")
         return
     
-    user_id = db.get_user_id_by_telegram_id(callback.from_user.id)
-    profile = db.get_user_profile_by_user_id(user_id)
+    profile = await db.get_user_profile_by_user_id(user_id)
     
     if profile:
-        success = db.update_profile_interests(profile['id'], current_interests)
+        success = await db.update_profile_interests(profile['id'], current_interests)
         
         if success:
+            prefetcher.discard(user_id)
             await callback.message.delete()
             await callback.message.answer(
                 f"✅ Интересы успешно обновлены!\n\n"
@@ -514,7 +512,7 @@ async def edit_about_start(message: Message, state: FSMContext):
     await state.set_state(EditProfileStates.edit_about)
 
 @router.message(EditProfileStates.edit_about)
-async def edit_about_process(message: Message, state: FSMContext):
+async def edit_about_process(message: Message, state: FSMContext, user_id: Optional[int]):
     """Обработка изменения описания"""
     if message.text == "❌ Отмена":
         await state.clear()
@@ -533,12 +531,12 @@ async def edit_about_process(message: Message, state: FSMContext):
         )
         return
     
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    profile = db.get_user_profile_by_user_id(user_id)
+    profile = await db.get_user_profile_by_user_id(user_id)
     
     if profile:
-        success = db.update_profile(profile['id'], 'about', about)
+        success = await db.update_profile(profile['id'], 'about', about)
         
+        # Описание не входит в критерии подбора, предзагрузку не сбрасываем
         if success:
             await message.answer(
                 f"✅ Описание успешно обновлено!",
@@ -615,7 +613,7 @@ async def edit_photos_process(message: Message, state: FSMContext):
         )
 
 @router.message(EditProfileStates.edit_photos, F.text == "✅ Завершить")
-async def edit_photos_finish(message: Message, state: FSMContext):
+async def edit_photos_finish(message: Message, state: FSMContext, user_id: Optional[int]):
     """Завершение изменения фотографий"""
     data = await state.get_data()
     new_photos = data.get('new_photos', [])
@@ -627,17 +625,16 @@ async def edit_photos_finish(message: Message, state: FSMContext):
         )
         return
     
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    profile = db.get_user_profile_by_user_id(user_id)
+    profile = await db.get_user_profile_by_user_id(user_id)
     
     if profile:
         # Удаляем старые фото
-        db.delete_profile_photos(profile['id'])
+        await db.delete_profile_photos(profile['id'])
         
         # Добавляем новые фото
         success_count = 0
         for i, photo in enumerate(new_photos):
-            success = db.add_photo(
+            success = await db.add_photo(
                 profile['id'], 
                 photo['file_id'], 
                 photo['file_unique_id'], 
@@ -693,15 +690,14 @@ async def delete_profile_start(message: Message, state: FSMContext):
     await state.set_state(EditProfileStates.confirm_delete)
 
 @router.message(EditProfileStates.confirm_delete)
-async def delete_profile_confirm(message: Message, state: FSMContext):
+async def delete_profile_confirm(message: Message, state: FSMContext, user_id: Optional[int]):
     """Подтверждение удаления анкеты"""
     if message.text == "ДА, УДАЛИТЬ АНКЕТУ":
-        user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-        
         if user_id:
-            success = db.delete_profile(user_id)
+            success = await db.delete_profile(user_id)
             
             if success:
+                prefetcher.discard(user_id)
                 await message.answer(
                     "✅ Ваша анкета успешно удалена.\n\n"
                     "Вы можете создать новую анкету через команду /start",
@@ -726,10 +722,10 @@ async def delete_profile_confirm(message: Message, state: FSMContext):
     await state.clear()
 
 @router.message(F.text == "🔙 Назад к анкете")
-async def back_to_profile_menu(message: Message, state: FSMContext):
+async def back_to_profile_menu(message: Message, state: FSMContext, user_id: Optional[int]):
     """Возврат к меню анкеты"""
     await state.clear()
-    await my_profile_menu(message, state)
+    await my_profile_menu(message, state, user_id)
 
 @router.message(F.text == "🔙 Назад в меню")
 async def back_to_main_menu_from_profile(message: Message, state: FSMContext):
@@ -750,8 +746,8 @@ async def back_to_main_menu(message: Message, state: FSMContext):
     )
 
 @router.message(Command("profile"))
-async def profile_command(message: Message, state: FSMContext):
+async def profile_command(message: Message, state: FSMContext, user_id: Optional[int]):
     """Обработчик команды /profile"""
     # Просто перенаправляем на обработчик "Моя анкета"
     from handlers.profile_management import my_profile_menu
-    await my_profile_menu(message, state)
\ No newline at end of file
+    await my_profile_menu(message, state, user_id)
\ No newline at end of file
@@ -5,17 +5,19 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery, InputMediaPhoto, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from typing import Optional
-import asyncio
 from datetime import datetime
 
-from models import Database
+from middlewares.user_context import UserContext
+from services.async_db import get_db
+from services.prefetch import get_prefetcher
 from keyboards.replay import *
 from keyboards.inline_premium import get_write_message_keyboard
 from keyboards.inline import InlineKeyboardBuilder
 from handlers.admin import send_like_notification, handle_mutual_match
 
 router = Router()
-db = Database()
+db = get_db()
+prefetcher = get_prefetcher()
 
 class ViewingStates(StatesGroup):
     """Состояния для просмотра анкет"""
@@ -100,29 +102,28 @@ async def send_profile_with_photos(message: Message, profile: dict, caption: str
             reply_markup=keyboard
         )
 
-async def get_current_user_data(message: Message) -> tuple:
+async def get_current_user_data(message: Message, user_context: UserContext) -> tuple:
     """Получение данных текущего пользователя"""
-    user_id = db.get_user_id_by_telegram_id(message.from_user.id)
-    if not user_id:
+    if not user_context.user_id:
         await message.answer("❌ <b>Сначала создайте анкету через /start!</b>", parse_mode="HTML")
         return None, None
     
-    user_profile = db.get_user_profile_by_user_id(user_id)
+    user_profile = await user_context.profile()
     if not user_profile:
         await message.answer("❌ <b>Сначала создайте анкету через /start!</b>", parse_mode="HTML")
         return None, None
     
-    return user_id, user_profile
+    return user_context.user_id, user_profile
 
 @router.message(F.text == "🔍 Смотреть анкеты")
-async def start_viewing_profiles(message: Message, state: FSMContext):
+async def start_viewing_profiles(message: Message, state: FSMContext, user_context: UserContext):
     """Начало просмотра анкет"""
-    user_id, user_profile = await get_current_user_data(message)
+    user_id, user_profile = await get_current_user_data(message, user_context)
     if not user_id:
         return
     
     # Проверяем наличие уведомлений о лайках
-    pending_likes = db.get_pending_likes(user_profile['id'])
+    pending_likes = await db.get_pending_likes(user_profile['id'])
     if pending_likes:
         # Создаем клавиатуру с двумя кнопками
         builder = ReplyKeyboardBuilder()
@@ -146,10 +147,10 @@ async def start_viewing_profiles(message: Message, state: FSMContext):
     # Показываем первую анкету
     await show_next_profile(message, state, user_id)
 
-@router.message(F.text == "🔍 Продолжить просмотр")
-async def continue_viewing(message: Message, state: FSMContext):
+@router.message(F.text == "🔍 Продолжить просмотр", flags={'throttling': 'swipe'})
+async def continue_viewing(message: Message, state: FSMContext, user_context: UserContext):
     """Продолжить просмотр анкет"""
-    user_id, user_profile = await get_current_user_data(message)
+    user_id, user_profile = await get_current_user_data(message, user_context)
     if not user_id:
         return
     
@@ -163,15 +164,15 @@ async def continue_viewing(message: Message, state: FSMContext):
 async def show_next_profile(message: Message, state: FSMContext, user_id: int = None):
     """Показать следующую анкету"""
     if not user_id:
-        user_id = db.get_user_id_by_telegram_id(message.from_user.id)
+        user_id = await db.get_user_id_by_telegram_id(message.from_user.id)
     
     if not user_id:
         await message.answer("❌ <b>Пользователь не найден!</b>", parse_mode="HTML")
         await state.clear()
         return
     
-    # Получаем следующую анкету
-    next_profile = db.get_next_profile(user_id)
+    # Получаем следующую анкету (обычно уже подобранную в фоне)
+    next_profile = await prefetcher.next_profile(user_id)
     
     if not next_profile:
         await message.answer(
@@ -189,7 +190,10 @@ async def show_next_profile(message: Message, state: FSMContext, user_id: int =
     await state.set_state(ViewingStates.viewing_profile)
     
     # Добавляем запись о просмотре
-    db.add_view(user_id, next_profile['id'])
+    await db.add_view(user_id, next_profile['id'])
+    
+    # Пока пользователь смотрит анкету, подбираем следующую
+    prefetcher.schedule(user_id)
     
     # Отправляем анкету
     profile_text = format_profile_preview(next_profile)
@@ -220,10 +224,10 @@ async def show_next_profile(message: Message, state: FSMContext, user_id: int =
             reply_markup=get_profile_view_keyboard()
         )
 
-@router.message(ViewingStates.viewing_profile, F.text == "❤️")
-async def process_like(message: Message, state: FSMContext):
+@router.message(ViewingStates.viewing_profile, F.text == "❤️", flags={'throttling': 'swipe'})
+async def process_like(message: Message, state: FSMContext, user_context: UserContext):
     """Обработка лайка"""
-    user_id, user_profile = await get_current_user_data(message)
+    user_id, user_profile = await get_current_user_data(message, user_context)
     if not user_id:
         await state.clear()
         return
@@ -237,7 +241,7 @@ async def process_like(message: Message, state: FSMContext):
         return
     
     # Добавляем лайк
-    result = db.add_like(user_id, current_profile['id'], 'like')
+    result = await db.add_like(user_id, current_profile['id'], 'like')
     
     if result.get('success') and result.get('is_mutual'):
         # Взаимная симпатия!
@@ -251,18 +255,17 @@ async def process_like(message: Message, state: FSMContext):
         )
         
         # Отправляем уведомление владельцу анкеты, если это не бот
-        target_telegram_id = db.get_telegram_id_by_profile_id(current_profile['id'])
+        target_telegram_id = await db.get_telegram_id_by_profile_id(current_profile['id'])
         if target_telegram_id:
             await send_like_notification(message.bot, user_profile, current_profile, target_telegram_id)
     
     # Показываем следующую анкету
-    await asyncio.sleep(1)
     await show_next_profile(message, state, user_id)
 
-@router.message(ViewingStates.viewing_profile, F.text == "👎")
-async def process_dislike(message: Message, state: FSMContext):
+@router.message(ViewingStates.viewing_profile, F.text == "👎", flags={'throttling': 'swipe'})
+async def process_dislike(message: Message, state: FSMContext, user_context: UserContext):
     """Обработка дизлайка"""
-    user_id, _ = await get_current_user_data(message)
+    user_id, _ = await get_current_user_data(message, user_context)
     if not user_id:
         await state.clear()
         return
@@ -276,18 +279,17 @@ async def process_dislike(message: Message, state: FSMContext):
         return
     
     # Добавляем дизлайк
-    db.add_like(user_id, current_profile['id'], 'dislike')
+    await db.add_like(user_id, current_profile['id'], 'dislike')
     
     await message.answer("👎 <b>Отметка сохранена</b>", parse_mode="HTML")
     
     # Показываем следующую анкету
-    await asyncio.sleep(0.5)
     await show_next_profile(message, state, user_id)
 
 @router.message(ViewingStates.viewing_profile, F.text == "🚫 Пожаловаться")
-async def start_report(message: Message, state: FSMContext):
+async def start_report(message: Message, state: FSMContext, user_context: UserContext):
     """Начало процесса жалобы"""
-    user_id, user_profile = await get_current_user_data(message)
+    user_id, user_profile = await get_current_user_data(message, user_context)
     if not user_id:
         await state.clear()
         return
@@ -321,8 +323,8 @@ async def start_report(message: Message, state: FSMContext):
     
     await state.set_state(ViewingStates.report_reason)
 
-@router.callback_query(ViewingStates.report_reason, F.data.startswith("report_"))
-async def process_report_reason(callback: CallbackQuery, state: FSMContext):
+@router.callback_query(ViewingStates.report_reason, F.data.startswith("report_"), flags={'throttling': 'report'})
+async def process_report_reason(callback: CallbackQuery, state: FSMContext, user_id: Optional[int]):
     """Обработка выбора причины жалобы"""
     reason_map = {
         "report_fake": "🤥 Фейковый профиль",
@@ -375,9 +377,7 @@ async def process_report_reason(callback: CallbackQuery, state: FSMContext):
     )
     
     # Показываем следующую анкету
-    user_id = db.get_user_id_by_telegram_id(callback.from_user.id)
     if user_id:
-        await asyncio.sleep(2)
         await show_next_profile(callback.message, state, user_id)
     
     await callback.answer()
@@ -389,10 +389,10 @@ async def send_report_to_admins(bot, reporter_id: int, target_profile: dict, rea
         admin_ids = [8383742459]  # Замените на реальные ID админов
         
         # Получаем информацию о жалобщике
-        reporter_user = db.cursor.execute(
+        reporter_user = await db.fetchone(
             "SELECT username FROM users WHERE telegram_id = ?",
             (reporter_id,)
-        ).fetchone()
+        )
         
         reporter_username = f"@{reporter_user['username']}" if reporter_user and reporter_user['username'] else f"ID: {reporter_id}"
         
@@ -413,15 +413,12 @@ async def send_report_to_admins(bot, reporter_id: int, target_profile: dict, rea
         )
         
         # Создаем запись о жалобе в БД
-        db.cursor.execute('''
+        report_id = await db.execute('''
             INSERT INTO reports 
             (reporter_id, reported_profile_id, reason, status, created_at)
             VALUES (?, ?, ?, 'pending', ?)
         ''', (reporter_id, target_profile['id'], reason, datetime.now().timestamp()))
         
-        report_id = db.cursor.lastrowid
-        db.connection.commit()
-        
         # Отправляем всем админам
         for admin_id in admin_ids:
             try:
@@ -459,11 +456,11 @@ async def back_to_menu_from_view(message: Message, state: FSMContext):
 # ========== ОБРАБОТЧИКИ УВЕДОМЛЕНИЙ О ЛАЙКАХ ==========
 
 @router.message(F.text == "💌 Мои уведомления")
-async def show_notifications(message: Message, state: FSMContext):
+async def show_notifications(message: Message, state: FSMContext, user_context: UserContext):
     """Показать уведомления о лайках - ПОЛНЫЕ АНКЕТЫ"""
     print(f"DEBUG: show_notifications вызвана для user_id={message.from_user.id}")
     
-    user_id, user_profile = await get_current_user_data(message)
+    user_id, user_profile = await get_current_user_data(message, user_context)
     
     if not user_id:
         print(f"DEBUG: user_id не найден")
@@ -481,7 +478,7 @@ async def show_notifications(message: Message, state: FSMContext):
     
     print(f"DEBUG: Анкета найдена, profile_id={user_profile['id']}")
     
-    pending_likes = db.get_pending_likes(user_profile['id'])
+    pending_likes = await db.get_pending_likes(user_profile['id'])
     
     if not pending_likes or len(pending_likes) == 0:
         print(f"DEBUG: Нет pending_likes или пустой список")
@@ -527,30 +524,29 @@ async def show_next_like_notification(message: Message, state: FSMContext):
     print(f"DEBUG: Обработка лайка {current_index}: {like_data}")
     
     # Получаем ПОЛНЫЙ профиль пользователя, который поставил лайк
-    from_user_id = db.get_user_id_by_telegram_id(like_data['telegram_id'])
+    from_user_id = await db.get_user_id_by_telegram_id(like_data['telegram_id'])
     if from_user_id:
-        from_profile = db.get_user_profile_by_user_id(from_user_id)
+        from_profile = await db.get_user_profile_by_user_id(from_user_id)
         
         if from_profile:
             print(f"DEBUG: Найден профиль: {from_profile['name']}")
             
             # Проверяем, не является ли это ботом
-            is_bot = db.cursor.execute(
+            is_bot = await db.fetchone(
                 "SELECT 1 FROM bot_profiles WHERE profile_id = ?",
                 (from_profile['id'],)
-            ).fetchone()
+            )
             
             if is_bot:
                 # Помечаем лайк от бота как отвеченный (дизлайк)
                 try:
-                    db.mark_like_responded(like_data['like_id'], 'dislike')
+                    await db.mark_like_responded(like_data['like_id'], 'dislike')
                     print(f"INFO: Лайк от бота {like_data['name']} автоматически отклонен")
                 except Exception as e:
                     print(f"❌ Ошибка отметки лайка от бота: {e}")
                 
                 # Пропускаем бота и переходим к следующему
                 await state.update_data(current_like_index=current_index + 1)
-                await asyncio.sleep(0.3)
                 await show_next_like_notification(message, state)
                 return
             
@@ -631,10 +627,10 @@ async def show_next_like_notification(message: Message, state: FSMContext):
         current_liker_profile=None
     )
 
-@router.message(ViewingStates.pending_like_response, F.text == "❤️ Ответить лайком")
-async def respond_to_like_with_like(message: Message, state: FSMContext):
+@router.message(ViewingStates.pending_like_response, F.text == "❤️ Ответить лайком", flags={'throttling': 'likes'})
+async def respond_to_like_with_like(message: Message, state: FSMContext, user_context: UserContext):
     """Ответить на лайк взаимностью"""
-    user_id, user_profile = await get_current_user_data(message)
+    user_id, user_profile = await get_current_user_data(message, user_context)
     if not user_id:
         await state.clear()
         return
@@ -653,22 +649,21 @@ async def respond_to_like_with_like(message: Message, state: FSMContext):
         return
     
     # Отмечаем лайк как отвеченный
-    db.mark_like_responded(current_like_id, 'like')
+    await db.mark_like_responded(current_like_id, 'like')
     
     # Получаем ID пользователя, который поставил лайк
-    liker_user_id = db.get_user_id_by_telegram_id(liker_telegram_id)
+    liker_user_id = await db.get_user_id_by_telegram_id(liker_telegram_id)
     
     if liker_user_id and liker_profile:
         # Проверяем, не является ли это ботом
-        is_bot = db.cursor.execute(
+        is_bot = await db.fetchone(
             "SELECT 1 FROM bot_profiles WHERE profile_id = ?",
             (liker_profile['id'],)
-        ).fetchone()
+        )
         
         if is_bot:
             # Для ботов просто удаляем лайк
-            db.cursor.execute("DELETE FROM likes WHERE id = ?", (current_like_id,))
-            db.connection.commit()
+            await db.execute("DELETE FROM likes WHERE id = ?", (current_like_id,))
             
             await message.answer(
                 "❤️ <b>Ответ отправлен!</b>",
@@ -676,7 +671,7 @@ async def respond_to_like_with_like(message: Message, state: FSMContext):
             )
         else:
             # Ставим взаимный лайк
-            result = db.add_like(user_id, liker_profile['id'], 'like')
+            result = await db.add_like(user_id, liker_profile['id'], 'like')
             
             if result.get('success'):
                 if result.get('is_mutual'):
@@ -684,11 +679,9 @@ async def respond_to_like_with_like(message: Message, state: FSMContext):
                     from keyboards.inline_premium import get_write_message_keyboard, get_write_message_fallback_keyboard
                     
                     # Получаем username пользователя, который поставил лайк
-                    db.cursor.execute('''
+                    result_username = await db.fetchone('''
                         SELECT username FROM users WHERE id = ?
                     ''', (liker_profile['user_id'],))
-                    
-                    result_username = db.cursor.fetchone()
                     liker_username = result_username['username'] if result_username and result_username['username'] else None
                     
                     await message.answer(
@@ -735,10 +728,9 @@ async def respond_to_like_with_like(message: Message, state: FSMContext):
     current_index = data.get('current_like_index', 0)
     await state.update_data(current_like_index=current_index + 1)
     
-    await asyncio.sleep(1)
     await show_next_like_notification(message, state)
 
-@router.message(ViewingStates.pending_like_response, F.text == "👎 Отказать")
+@router.message(ViewingStates.pending_like_response, F.text == "👎 Отказать", flags={'throttling': 'likes'})
 async def respond_to_like_with_dislike(message: Message, state: FSMContext):
     """Отказать в ответ на лайк"""
     data = await state.get_data()
@@ -750,7 +742,7 @@ async def respond_to_like_with_dislike(message: Message, state: FSMContext):
         return
     
     # Отмечаем как отказано
-    db.mark_like_responded(current_like_id, 'dislike')
+    await db.mark_like_responded(current_like_id, 'dislike')
     
     await message.answer(
         "👎 <b>Вы отказали пользователю.</b>",
@@ -761,7 +753,6 @@ async def respond_to_like_with_dislike(message: Message, state: FSMContext):
     current_index = data.get('current_like_index', 0)
     await state.update_data(current_like_index=current_index + 1)
     
-    await asyncio.sleep(0.5)
     await show_next_like_notification(message, state)
 
 @router.message(ViewingStates.pending_like_response, F.text == "🚫 Пожаловаться")
@@ -792,14 +783,13 @@ async def report_from_notification(message: Message, state: FSMContext):
     
     await state.set_state(ViewingStates.report_reason)
 
-@router.message(ViewingStates.pending_like_response, F.text == "⏭️ Следующий")
+@router.message(ViewingStates.pending_like_response, F.text == "⏭️ Следующий", flags={'throttling': 'likes'})
 async def skip_like_notification(message: Message, state: FSMContext):
     """Пропустить уведомление о лайке"""
     data = await state.get_data()
     current_index = data.get('current_like_index', 0)
     await state.update_data(current_like_index=current_index + 1)
     
-    await asyncio.sleep(0.3)
     await show_next_like_notification(message, state)
 
 @router.message(ViewingStates.pending_like_response, F.text == "🏠 Главное меню")
@@ -814,14 +804,14 @@ async def back_to_menu_from_notifications(message: Message, state: FSMContext):
 
 # Команды для управления
 @router.message(Command("likes"))
-async def check_likes_command(message: Message, state: FSMContext):
+async def check_likes_command(message: Message, state: FSMContext, user_context: UserContext):
     """Команда для проверки лайков"""
-    await show_notifications(message, state)
+    await show_notifications(message, state, user_context)
 
-@router.message(Command("next"))
-async def next_profile_command(message: Message, state: FSMContext):
+@router.message(Command("next"), flags={'throttling': 'swipe'})
+async def next_profile_command(message: Message, state: FSMContext, user_context: UserContext):
     """Команда для показа следующей анкеты"""
-    user_id, _ = await get_current_user_data(message)
+    user_id, _ = await get_current_user_data(message, user_context)
     if user_id:
         await show_next_profile(message, state, user_id)
 
@@ -896,15 +886,13 @@ async def send_like_notification(bot, from_profile: dict, to_profile: dict, to_t
     """Отправка уведомления о лайке"""
     try:
         # Получаем количество лайков у пользователя
-        db.cursor.execute('''
+        result = await db.fetchone('''
             SELECT COUNT(*) as like_count 
             FROM likes 
             WHERE to_profile_id = ? 
             AND like_type = 'like' 
             AND is_mutual = 0
         ''', (to_profile['id'],))
-        
-        result = db.cursor.fetchone()
         like_count = result['like_count'] if result else 0
         
         # Создаем текст уведомления
@@ -933,15 +921,13 @@ async def handle_mutual_match(message, user_id: int, user_profile: dict, liked_p
         from keyboards.inline_premium import get_write_message_keyboard, get_write_message_fallback_keyboard
         
         # Получаем username пользователя, который поставил лайк
-        db.cursor.execute('''
+        result = await db.fetchone('''
             SELECT username FROM users WHERE id = ?
         ''', (liked_profile['user_id'],))
-        
-        result = db.cursor.fetchone()
         liked_username = result['username'] if result and result['username'] else None
         
         # Отправляем сообщение текущему пользователю
-        target_telegram_id = db.get_telegram_id_by_profile_id(liked_profile['id'])
+        target_telegram_id = await db.get_telegram_id_by_profile_id(liked_profile['id'])
         await message.answer(
             "🎉 <b>Взаимная симпатия!</b>\n\n"
             f"💝 <b>Вы и {liked_profile['name']} понравились друг другу!</b>\n\n"
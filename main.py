@@ -1,12 +1,15 @@
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 import os
 from dotenv import load_dotenv
-from models import Database
+from services.async_db import get_db
+from services.charts import get_renderer
+from services.fsm_storage import SQLiteStorage
+from middlewares.identity import IdentityMiddleware
+from middlewares.throttling import ThrottlingMiddleware
+from middlewares.user_context import UserContextMiddleware
 
-from handlers import profile_creation, profile_view, premium, profile_management, admin
 import utils
 
 # Загрузка переменных окружения
@@ -26,19 +29,48 @@ if not BOT_TOKEN:
     logger.error("❌ BOT_TOKEN не найден в переменных окружения")
     exit(1)
 
-async def on_startup(bot: Bot):
+# Режим вебхука включается, если задан WEBHOOK_URL (иначе - polling)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+
+async def on_startup(bot: Bot, primary: bool = True):
     """Действия при запуске бота"""
     logger.info("🚀 Бот запущен")
     
+    # В режиме нескольких воркеров общие действия выполняет только первый
+    if not primary:
+        return
+    
     # Инициализируем систему автолайков
     try:
-        from handlers.admin import init_auto_like_system, auto_like_system
+        from handlers.admin import init_auto_like_system
+        auto_like_system = init_auto_like_system(get_db(), bot)
         if auto_like_system:
             await auto_like_system.start_auto_likes()
             logger.info("🤖 Система автолайков запущена")
     except Exception as e:
         logger.error(f"⚠️ Ошибка запуска системы автолайков: {e}")
     
+    # Продолжаем рассылки, прерванные остановкой бота
+    try:
+        from handlers.admin import send_broadcast_report
+        from services.broadcast import resume_broadcasts
+        await resume_broadcasts(bot, get_db(), send_broadcast_report)
+    except Exception as e:
+        logger.error(f"⚠️ Ошибка возобновления рассылок: {e}")
+    
+    # Периодическая очистка старых просмотров
+    from services.retention import start_compaction
+    start_compaction(get_db())
+    
+    # Периодическая деактивация истекших премиум подписок
+    from services.premium_cache import start_expiry_sweeper
+    start_expiry_sweeper(get_db())
+    
     # Устанавливаем команды бота
     commands = [
         {
@@ -89,34 +121,54 @@ async def on_startup(bot: Bot):
     except:
         pass
 
-async def on_shutdown(bot: Bot):
+async def on_shutdown(bot: Bot, primary: bool = True):
     """Действия при остановке бота"""
     logger.info("🛑 Бот остановлен")
     
     # Останавливаем систему автолайков
     try:
         from handlers.admin import auto_like_system
-        if auto_like_system:
+        if primary and auto_like_system:
             await auto_like_system.stop_auto_likes()
             logger.info("🤖 Система автолайков остановлена")
     except Exception as e:
         logger.error(f"⚠️ Ошибка остановки системы автолайков: {e}")
     
-    from models import Database
-    db = Database()
-    db.close()
+    if primary:
+        from services.premium_cache import stop_expiry_sweeper
+        from services.retention import stop_compaction
+        stop_compaction()
+        stop_expiry_sweeper()
+    
+    get_renderer().close()
+    await get_db().close()
 
-async def main():
-    """Основная функция запуска бота"""
+def create_bot() -> Bot:
+    """Создание экземпляра бота"""
+    return Bot(token=BOT_TOKEN)
+
+def create_dispatcher() -> Dispatcher:
+    """Создание диспетчера с роутерами и обработчиками событий"""
+    # Роутеры импортируются здесь, а не при импорте main: при импорте они
+    # открывают базу, а дочерние процессы spawn (графики, воркеры вебхука)
+    # заново выполняют модуль main
+    from handlers import profile_creation, profile_view, premium, profile_management, admin
     
-    # Инициализация бота и диспетчера
-    bot = Bot(token=BOT_TOKEN)
-    storage = MemoryStorage()
+    storage = SQLiteStorage(get_db())
     dp = Dispatcher(storage=storage)
     
-    # Инициализация системы автолайков
-    from handlers.admin import init_auto_like_system
-    init_auto_like_system(Database(), bot)
+    # Ограничение частоты запросов (до обращения к базе)
+    throttling = ThrottlingMiddleware()
+    dp.message.middleware(throttling)
+    dp.callback_query.middleware(throttling)
+    
+    # user_id и лениво загружаемые данные отправителя для обработчиков
+    identity = IdentityMiddleware(get_db())
+    dp.message.middleware(identity)
+    dp.callback_query.middleware(identity)
+    user_context = UserContextMiddleware(get_db())
+    dp.message.middleware(user_context)
+    dp.callback_query.middleware(user_context)
     
     # Регистрация роутеров
     dp.include_router(profile_creation.router)
@@ -129,14 +181,36 @@ async def main():
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
     
+    return dp
+
+async def main():
+    """Основная функция запуска бота"""
+    
+    # Инициализация бота и диспетчера
+    bot = create_bot()
+    dp = create_dispatcher()
+    
     # Запуск бота
     try:
-        logger.info("🔄 Запуск polling...")
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if WEBHOOK_URL:
+            from webhook import run_webhook
+            
+            logger.info("🔄 Запуск webhook...")
+            await run_webhook(
+                bot, dp, WEBHOOK_URL,
+                path=WEBHOOK_PATH,
+                secret=WEBHOOK_SECRET,
+                host=WEBHOOK_HOST,
+                port=WEBHOOK_PORT,
+                workers=WEBHOOK_WORKERS
+            )
+        else:
+            logger.info("🔄 Запуск polling...")
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     except Exception as e:
         logger.error(f"💥 Критическая ошибка при запуске бота: {e}")
     finally:
         await bot.session.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,3 @@
+from . import identity, throttling, user_context
+
+__all__ = ['identity', 'throttling', 'user_context']
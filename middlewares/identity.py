@@ -0,0 +1,27 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+
+class IdentityMiddleware(BaseMiddleware):
+    """Определение user_id отправителя один раз на апдейт
+
+    Обработчики получают готовый user_id аргументом (None, если
+    пользователь еще не зарегистрирован) вместо отдельного запроса
+    get_user_id_by_telegram_id. Известные пользователи берутся из
+    IdentityMap без обращения к базе.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        data['user_id'] = await self.db.get_user_id_by_telegram_id(user.id) if user else None
+        return await handler(event, data)
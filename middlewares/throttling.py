@@ -0,0 +1,126 @@
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+# Группа обработчиков -> (токенов в секунду, размер всплеска)
+DEFAULT_LIMITS = {
+    'default': (3.0, 10),
+    'swipe': (2.0, 5),
+    'likes': (2.0, 5),
+    'report': (0.2, 2),
+}
+
+THROTTLED_TEXT = "⏳ Не так быстро! Подождите немного."
+
+
+class BucketTable:
+    """Таблица token bucket'ов фиксированного размера
+
+    Состояние корзин хранится в плоских массивах, а ключ (пользователь, группа)
+    указывает на слот. Когда таблица заполнена, слот давно не активного
+    пользователя переиспользуется: его корзина все равно успела бы заполниться.
+    """
+
+    def __init__(self, capacity: int = 50000):
+        self.capacity = capacity
+        self._tokens = array('d', bytes(8 * capacity))
+        self._updated = array('d', bytes(8 * capacity))
+        self._warned = bytearray(capacity)
+        self._slots = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _slot(self, key: Tuple[int, str], burst: float, now: float) -> int:
+        slot = self._slots.get(key)
+        if slot is not None:
+            self._slots.move_to_end(key)
+            return slot
+
+        if len(self._slots) < self.capacity:
+            slot = len(self._slots)
+        else:
+            _, slot = self._slots.popitem(last=False)
+
+        self._slots[key] = slot
+        self._tokens[slot] = burst
+        self._updated[slot] = now
+        self._warned[slot] = 0
+        return slot
+
+    def consume(self, key: Tuple[int, str], rate: float, burst: float,
+                now: Optional[float] = None) -> Tuple[bool, bool]:
+        """Списание токена
+
+        Возвращает (разрешено, нужно_предупредить): предупреждение
+        отправляется только на первый отклоненный апдейт всплеска.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        slot = self._slot(key, burst, now)
+        tokens = min(burst, self._tokens[slot] + (now - self._updated[slot]) * rate)
+        self._updated[slot] = now
+
+        if tokens >= 1:
+            self._tokens[slot] = tokens - 1
+            self._warned[slot] = 0
+            return True, False
+
+        self._tokens[slot] = tokens
+        warn = not self._warned[slot]
+        self._warned[slot] = 1
+        return False, warn
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Ограничение частоты апдейтов от одного пользователя
+
+    Группа обработчика задается флагом: flags={'throttling': 'swipe'}.
+    Обработчики без флага попадают в группу 'default'. Апдейты сверх лимита
+    отбрасываются до обращения к базе данных.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 capacity: int = 50000):
+        self.limits = dict(DEFAULT_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        self.table = BucketTable(capacity)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+
+        group = get_flag(data, 'throttling', default='default')
+        rate, burst = self.limits.get(group, self.limits['default'])
+        allowed, warn = self.table.consume((user.id, group), rate, burst)
+
+        if allowed:
+            return await handler(event, data)
+
+        await self._reject(event, warn)
+        return None
+
+    @staticmethod
+    async def _reject(event: TelegramObject, warn: bool):
+        """Ответ на отброшенный апдейт"""
+        try:
+            if isinstance(event, CallbackQuery):
+                # На callback отвечаем всегда, иначе кнопка "зависнет"
+                await event.answer(THROTTLED_TEXT if warn else None)
+            elif isinstance(event, Message) and warn:
+                await event.answer(THROTTLED_TEXT)
+        except Exception as e:
+            print(f"❌ Ошибка ответа на отброшенный апдейт: {e}")
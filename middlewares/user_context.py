@@ -0,0 +1,78 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+
+class UserContext:
+    """Данные отправителя апдейта с ленивой загрузкой
+
+    Каждая часть (строка users, анкета, премиум подписка, статистика
+    рефералов) запрашивается из базы только при первом обращении и не
+    больше одного раза за апдейт. После изменения данных обработчик
+    сбрасывает устаревшую часть через invalidate().
+    """
+
+    def __init__(self, db, telegram_id: Optional[int], user_id: Optional[int]):
+        self.db = db
+        self.telegram_id = telegram_id
+        self.user_id = user_id
+        self._cache = {}
+
+    async def user(self) -> Optional[dict]:
+        """Строка пользователя из таблицы users"""
+        return await self._load('user', self.db.get_user_by_telegram_id, self.telegram_id)
+
+    async def profile(self) -> Optional[dict]:
+        """Анкета пользователя с фото и интересами"""
+        return await self._load('profile', self.db.get_user_profile_by_user_id, self.user_id)
+
+    async def premium_status(self) -> Optional[dict]:
+        """Активная премиум подписка"""
+        return await self._load('premium_status', self.db.get_user_premium_status, self.user_id)
+
+    async def is_premium(self) -> bool:
+        return bool(await self.premium_status())
+
+    async def referral_stats(self) -> dict:
+        """Число приглашенных и выполнивших условие рефералов"""
+        return await self._load('referral_stats', self.db.get_referral_stats, self.user_id)
+
+    def invalidate(self, *names: str):
+        """Сброс загруженных частей (без аргументов - всех)"""
+        if not names:
+            self._cache.clear()
+        for name in names:
+            self._cache.pop(name, None)
+
+    async def _load(self, name: str, loader, key):
+        if key is None:
+            return None
+
+        # Храним задачу, а не результат: одновременные обращения ждут один запрос
+        task = self._cache.get(name)
+        if task is None:
+            task = self._cache[name] = asyncio.ensure_future(loader(key))
+        return await task
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """Создание UserContext для каждого апдейта
+
+    Обработчики получают его аргументом user_context. Подключается после
+    IdentityMiddleware, от которой берет user_id.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        data['user_context'] = UserContext(self.db, user.id if user else None, data.get('user_id'))
+        return await handler(event, data)
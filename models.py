@@ -5,12 +5,59 @@ import math
 import secrets
 import string
 
+from services.candidate_pool import CandidatePool
+from services.connection import ConnectionManager
+from services.identity import IdentityMap
+from services.migrations import migrate
+from services.premium_cache import PremiumCache
+from services.profile_cache import ProfileCache
+from services.referral_counters import REWARD_THRESHOLD
+from services.retention import RESHOW_AFTER_DAYS, reshow_old_views
+from services.scoring import interests_mask
+from services.seen_set import SeenSetCache
+
 class Database:
     def __init__(self, db_name: str = 'dating_bot.db'):
-        self.connection = sqlite3.connect(db_name, check_same_thread=False)
-        self.connection.row_factory = sqlite3.Row
-        self.cursor = self.connection.cursor()
-        self.create_tables()
+        self.manager = ConnectionManager.get(db_name)
+        
+        # Схема создается один раз на файл базы
+        with self.manager.schema_lock:
+            if not self.manager.schema_ready:
+                self.create_tables()
+                self.manager.schema_ready = True
+        
+        self.identity = IdentityMap()
+        self.profile_cache = ProfileCache()
+        self.premium_cache = PremiumCache()
+        self.candidate_pool = CandidatePool(self)
+        self.seen_sets = SeenSetCache(self, reshow_days=RESHOW_AFTER_DAYS)
+    
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока"""
+        return self.manager.connection
+    
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        """Курсор текущего потока"""
+        return self.manager.cursor
+    
+    def _write(self, operation, wait: bool = True):
+        """Выполнение записи в общем потоке-писателе
+        
+        operation(cursor) выполняется внутри пакетной транзакции.
+        При wait=False запись выполняется в фоне, ошибки только логируются.
+        """
+        future = self.manager.submit_write(operation)
+        if not wait:
+            future.add_done_callback(self._report_write_error)
+            return None
+        return future.result()
+    
+    @staticmethod
+    def _report_write_error(future):
+        if future.exception():
+            print(f"❌ Ошибка фоновой записи: {future.exception()}")
     
     def create_tables(self):
         """Создание таблиц базы данных"""
@@ -257,6 +304,9 @@ class Database:
             )
         
         self.connection.commit()
+        
+        # Индексы и прочие изменения схемы
+        migrate(self.connection)
     
     def update_profile(self, profile_id: int, field: str, value: str) -> bool:
         """Обновление поля анкеты"""
@@ -267,9 +317,11 @@ class Database:
             
             # Используем параметризованный запрос для безопасности
             query = f"UPDATE profiles SET {field} = ?, updated_at = ? WHERE id = ?"
-            self.cursor.execute(query, (value, datetime.now().timestamp(), profile_id))
-            
-            self.connection.commit()
+            self._write(lambda cursor: cursor.execute(
+                query, (value, datetime.now().timestamp(), profile_id)
+            ))
+            self.profile_cache.invalidate(profile_id)
+            self.candidate_pool.profile_changed()
             return True
         except Exception as e:
             print(f"❌ Ошибка обновления анкеты: {e}")
@@ -277,40 +329,54 @@ class Database:
     
     def update_profile_interests(self, profile_id: int, interests: list) -> bool:
         """Обновление интересов анкеты"""
-        try:
+        def write(cursor):
             # Удаляем старые интересы
-            self.cursor.execute(
+            cursor.execute(
                 "DELETE FROM profile_interests WHERE profile_id = ?",
                 (profile_id,)
             )
             
             # Добавляем новые интересы
-            for interest_name in interests:
-                self.cursor.execute(
-                    "SELECT id FROM interests WHERE name = ?",
-                    (interest_name,)
-                )
-                interest = self.cursor.fetchone()
-                if interest:
-                    self.cursor.execute(
-                        "INSERT INTO profile_interests (profile_id, interest_id) VALUES (?, ?)",
-                        (profile_id, interest['id'])
-                    )
-            
-            self.connection.commit()
+            self._insert_profile_interests(cursor, profile_id, interests)
+        
+        try:
+            self._write(write)
+            self.profile_cache.invalidate(profile_id)
+            self.candidate_pool.profile_changed()
             return True
         except Exception as e:
             print(f"❌ Ошибка обновления интересов: {e}")
             return False
     
+    def _insert_profile_interests(self, cursor, profile_id: int, interests: list):
+        """Привязка интересов к анкете по названиям и обновление маски интересов"""
+        interest_ids = []
+        for interest_name in interests:
+            cursor.execute(
+                "SELECT id FROM interests WHERE name = ?",
+                (interest_name,)
+            )
+            interest = cursor.fetchone()
+            if interest:
+                cursor.execute(
+                    "INSERT INTO profile_interests (profile_id, interest_id) VALUES (?, ?)",
+                    (profile_id, interest['id'])
+                )
+                interest_ids.append(interest['id'])
+        
+        cursor.execute(
+            "UPDATE profiles SET interests_mask = ? WHERE id = ?",
+            (interests_mask(interest_ids), profile_id)
+        )
+    
     def delete_profile_photos(self, profile_id: int) -> bool:
         """Удаление всех фото анкеты"""
         try:
-            self.cursor.execute(
+            self._write(lambda cursor: cursor.execute(
                 "DELETE FROM photos WHERE profile_id = ?",
                 (profile_id,)
-            )
-            self.connection.commit()
+            ))
+            self.profile_cache.invalidate(profile_id)
             return True
         except Exception as e:
             print(f"❌ Ошибка удаления фото: {e}")
@@ -318,13 +384,13 @@ class Database:
     
     def delete_profile(self, user_id: int) -> bool:
         """Удаление анкеты пользователя"""
-        try:
+        def write(cursor):
             # Получаем profile_id
-            self.cursor.execute(
+            cursor.execute(
                 "SELECT id FROM profiles WHERE user_id = ?",
                 (user_id,)
             )
-            profile = self.cursor.fetchone()
+            profile = cursor.fetchone()
             
             if not profile:
                 return False
@@ -332,17 +398,21 @@ class Database:
             profile_id = profile['id']
             
             # Удаляем связанные данные
-            self.cursor.execute("DELETE FROM profile_interests WHERE profile_id = ?", (profile_id,))
-            self.cursor.execute("DELETE FROM photos WHERE profile_id = ?", (profile_id,))
-            self.cursor.execute("DELETE FROM likes WHERE to_profile_id = ?", (profile_id,))
-            self.cursor.execute("DELETE FROM views WHERE viewed_profile_id = ?", (profile_id,))
-            self.cursor.execute("DELETE FROM bot_profiles WHERE profile_id = ?", (profile_id,))
+            cursor.execute("DELETE FROM profile_interests WHERE profile_id = ?", (profile_id,))
+            cursor.execute("DELETE FROM photos WHERE profile_id = ?", (profile_id,))
+            cursor.execute("DELETE FROM likes WHERE to_profile_id = ?", (profile_id,))
+            cursor.execute("DELETE FROM views WHERE viewed_profile_id = ?", (profile_id,))
+            cursor.execute("DELETE FROM bot_profiles WHERE profile_id = ?", (profile_id,))
             
             # Удаляем анкету
-            self.cursor.execute("DELETE FROM profiles WHERE id = ?", (profile_id,))
-            
-            self.connection.commit()
+            cursor.execute("DELETE FROM profiles WHERE id = ?", (profile_id,))
             return True
+        
+        try:
+            deleted = self._write(write)
+            self.profile_cache.invalidate(user_id=user_id)
+            self.identity.forget_profile(user_id)
+            return deleted
         except Exception as e:
             print(f"❌ Ошибка удаления анкеты: {e}")
             return False
@@ -368,41 +438,65 @@ class Database:
 
     def add_user(self, telegram_id: int, username: str = None) -> Optional[int]:
         """Добавление нового пользователя"""
-        try:
-            self.cursor.execute(
+        def write(cursor):
+            cursor.execute(
                 "INSERT OR IGNORE INTO users (telegram_id, username) VALUES (?, ?)",
                 (telegram_id, username)
             )
-            self.connection.commit()
+            # Пользователь снова пишет боту - значит, больше не блокирует его
+            cursor.execute(
+                "UPDATE users SET is_blocked = 0, blocked_at = NULL WHERE telegram_id = ? AND is_blocked = 1",
+                (telegram_id,)
+            )
             
             # Получаем ID созданного пользователя
-            self.cursor.execute(
+            cursor.execute(
                 "SELECT id FROM users WHERE telegram_id = ?",
                 (telegram_id,)
             )
-            result = self.cursor.fetchone()
+            result = cursor.fetchone()
             return result['id'] if result else None
+        
+        try:
+            user_id = self._write(write)
+            if user_id:
+                self.identity.remember_user(telegram_id, user_id)
+            return user_id
         except Exception as e:
             print(f"❌ Ошибка добавления пользователя: {e}")
             return None
     
     def get_user_id_by_telegram_id(self, telegram_id: int) -> Optional[int]:
         """Получение user_id по telegram_id"""
+        user_id = self.identity.user_id(telegram_id)
+        if user_id is not None:
+            return user_id
+        
         self.cursor.execute(
             "SELECT id FROM users WHERE telegram_id = ?",
             (telegram_id,)
         )
         result = self.cursor.fetchone()
-        return result['id'] if result else None
+        if not result:
+            return None
+        self.identity.remember_user(telegram_id, result['id'])
+        return result['id']
     
     def get_telegram_id_by_user_id(self, user_id: int) -> Optional[int]:
         """Получение telegram_id по user_id"""
+        telegram_id = self.identity.telegram_id(user_id)
+        if telegram_id is not None:
+            return telegram_id
+        
         self.cursor.execute(
             "SELECT telegram_id FROM users WHERE id = ?",
             (user_id,)
         )
         result = self.cursor.fetchone()
-        return result['telegram_id'] if result else None
+        if not result:
+            return None
+        self.identity.remember_user(result['telegram_id'], user_id)
+        return result['telegram_id']
     
     # ========== МЕТОДЫ ДЛЯ АНКЕТ ==========
     
@@ -411,40 +505,35 @@ class Database:
         try:
             print(f"DEBUG: Создание анкеты для user_id={user_id}")
             
-            self.cursor.execute('''
-                INSERT INTO profiles 
-                (user_id, name, age, gender, looking_for, city, about)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                user_id,
-                data.get('name'),
-                data.get('age'),
-                data.get('gender'),
-                data.get('looking_for'),
-                data.get('city'),
-                data.get('about', '')
-            ))
+            def write(cursor):
+                cursor.execute('''
+                    INSERT INTO profiles 
+                    (user_id, name, age, gender, looking_for, city, about)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    user_id,
+                    data.get('name'),
+                    data.get('age'),
+                    data.get('gender'),
+                    data.get('looking_for'),
+                    data.get('city'),
+                    data.get('about', '')
+                ))
+                
+                profile_id = cursor.lastrowid
+                
+                # Добавляем интересы
+                if 'interests' in data:
+                    print(f"DEBUG: Добавление интересов: {data['interests']}")
+                    self._insert_profile_interests(cursor, profile_id, data['interests'])
+                
+                return profile_id
             
-            profile_id = self.cursor.lastrowid
+            profile_id = self._write(write)
+            self.identity.remember_profile(user_id, profile_id)
+            self.candidate_pool.profile_changed()
             print(f"DEBUG: Создана анкета с ID={profile_id}")
             
-            # Добавляем интересы
-            if 'interests' in data:
-                print(f"DEBUG: Добавление интересов: {data['interests']}")
-                for interest_name in data['interests']:
-                    self.cursor.execute(
-                        "SELECT id FROM interests WHERE name = ?",
-                        (interest_name,)
-                    )
-                    interest = self.cursor.fetchone()
-                    if interest:
-                        self.cursor.execute(
-                            "INSERT INTO profile_interests (profile_id, interest_id) VALUES (?, ?)",
-                            (profile_id, interest['id'])
-                        )
-            
-            self.connection.commit()
-            
             # Помечаем реферала как выполнившего условие
             print(f"DEBUG: Помечаем реферала как выполнившего условие: {user_id}")
             self.mark_referral_completed(user_id)
@@ -457,11 +546,11 @@ class Database:
     def add_photo(self, profile_id: int, file_id: str, file_unique_id: str, position: int = 0) -> bool:
         """Добавление фото к анкете"""
         try:
-            self.cursor.execute('''
+            self._write(lambda cursor: cursor.execute('''
                 INSERT INTO photos (profile_id, file_id, file_unique_id, position)
                 VALUES (?, ?, ?, ?)
-            ''', (profile_id, file_id, file_unique_id, position))
-            self.connection.commit()
+            ''', (profile_id, file_id, file_unique_id, position)))
+            self.profile_cache.invalidate(profile_id)
             return True
         except Exception as e:
             print(f"❌ Ошибка добавления фото: {e}")
@@ -489,33 +578,20 @@ class Database:
                 AND p.is_active = 1
             ''', (user_profile['id'], user_id))
             
+            rows = self.cursor.fetchall()
+            
             matches = []
-            for row in self.cursor.fetchall():
-                self.cursor.execute(
-                    "SELECT file_id FROM photos WHERE profile_id = ? ORDER BY position",
-                    (row['id'],)
-                )
-                photos = [photo['file_id'] for photo in self.cursor.fetchall()]
-                
-                # Получаем интересы
-                self.cursor.execute('''
-                    SELECT i.name FROM interests i
-                    JOIN profile_interests pi ON i.id = pi.interest_id
-                    WHERE pi.profile_id = ?
-                ''', (row['id'],))
-                
-                interests = [interest['name'] for interest in self.cursor.fetchall()]
-                
+            for profile in self._hydrate_profiles(rows):
                 matches.append({
-                    'id': row['id'],
-                    'name': row['name'],
-                    'age': row['age'],
-                    'gender': row['gender'],
-                    'looking_for': row['looking_for'],
-                    'city': row['city'],
-                    'about': row['about'],
-                    'interests': interests,
-                    'photos': photos
+                    'id': profile['id'],
+                    'name': profile['name'],
+                    'age': profile['age'],
+                    'gender': profile['gender'],
+                    'looking_for': profile['looking_for'],
+                    'city': profile['city'],
+                    'about': profile['about'],
+                    'interests': profile['interests'],
+                    'photos': profile['photos']
                 })
             
             return matches
@@ -533,39 +609,16 @@ class Database:
         
         profile = self.cursor.fetchone()
         if profile:
-            # Получаем фото
-            self.cursor.execute(
-                "SELECT file_id FROM photos WHERE profile_id = ? ORDER BY position",
-                (profile['id'],)
-            )
-            photos = [row['file_id'] for row in self.cursor.fetchall()]
-            
-            # Получаем интересы
-            self.cursor.execute('''
-                SELECT i.name FROM interests i
-                JOIN profile_interests pi ON i.id = pi.interest_id
-                WHERE pi.profile_id = ?
-            ''', (profile['id'],))
-            
-            interests = [row['name'] for row in self.cursor.fetchall()]
-            
-            return {
-                'id': profile['id'],
-                'user_id': profile['user_id'],
-                'name': profile['name'],
-                'age': profile['age'],
-                'gender': profile['gender'],
-                'looking_for': profile['looking_for'],
-                'city': profile['city'],
-                'about': profile['about'],
-                'is_active': bool(profile['is_active']),
-                'interests': interests,
-                'photos': photos
-            }
+            return self._hydrate_profiles([profile])[0]
         return None
     
     def get_user_profile_by_user_id(self, user_id: int) -> Optional[dict]:
         """Получение анкеты пользователя по user_id"""
+        cached = self.profile_cache.get_by_user(user_id)
+        if cached:
+            return cached
+        
+        generation = self.profile_cache.generation()
         self.cursor.execute('''
             SELECT p.* 
             FROM profiles p
@@ -574,77 +627,102 @@ class Database:
         
         profile = self.cursor.fetchone()
         if profile:
-            # Получаем фото
-            self.cursor.execute(
-                "SELECT file_id FROM photos WHERE profile_id = ? ORDER BY position",
-                (profile['id'],)
-            )
-            photos = [row['file_id'] for row in self.cursor.fetchall()]
-            
-            # Получаем интересы
-            self.cursor.execute('''
-                SELECT i.name FROM interests i
-                JOIN profile_interests pi ON i.id = pi.interest_id
-                WHERE pi.profile_id = ?
-            ''', (profile['id'],))
-            
-            interests = [row['name'] for row in self.cursor.fetchall()]
-            
-            return {
-                'id': profile['id'],
-                'user_id': profile['user_id'],
-                'name': profile['name'],
-                'age': profile['age'],
-                'gender': profile['gender'],
-                'looking_for': profile['looking_for'],
-                'city': profile['city'],
-                'about': profile['about'],
-                'is_active': bool(profile['is_active']),
-                'interests': interests,
-                'photos': photos
-            }
+            profile = self._hydrate_profiles([profile])[0]
+            self.profile_cache.put(profile, generation)
+            return profile
         return None
     
     def get_profile_by_id(self, profile_id: int) -> Optional[dict]:
         """Получение анкеты по ID"""
-        self.cursor.execute('''
-            SELECT p.* 
-            FROM profiles p
-            WHERE p.id = ?
-        ''', (profile_id,))
+        return self.get_profiles_bulk([profile_id]).get(profile_id)
+    
+    def get_profiles_bulk(self, profile_ids: list) -> Dict[int, dict]:
+        """Получение анкет по списку ID (profile_id -> анкета)"""
+        result = {}
+        missing = []
+        for profile_id in dict.fromkeys(profile_ids):
+            cached = self.profile_cache.get(profile_id)
+            if cached:
+                result[profile_id] = cached
+            else:
+                missing.append(profile_id)
         
-        profile = self.cursor.fetchone()
-        if profile:
+        if not missing:
+            return result
+        
+        generation = self.profile_cache.generation()
+        rows = []
+        for chunk in self._chunks(missing):
+            self.cursor.execute(
+                "SELECT p.* FROM profiles p WHERE p.id IN ({})".format(
+                    ','.join(['?' for _ in chunk])
+                ),
+                chunk
+            )
+            rows.extend(self.cursor.fetchall())
+        
+        for profile in self._hydrate_profiles(rows):
+            self.profile_cache.put(profile, generation)
+            result[profile['id']] = profile
+        return result
+    
+    def _hydrate_profiles(self, rows: list) -> List[dict]:
+        """Дозагрузка фото и интересов для строк анкет (фиксированное число запросов)"""
+        profile_ids = [row['id'] for row in rows]
+        photos = {profile_id: [] for profile_id in profile_ids}
+        interests = {profile_id: [] for profile_id in profile_ids}
+        
+        for chunk in self._chunks(profile_ids):
+            placeholders = ','.join(['?' for _ in chunk])
+            
             # Получаем фото
             self.cursor.execute(
-                "SELECT file_id FROM photos WHERE profile_id = ? ORDER BY position",
-                (profile['id'],)
+                "SELECT profile_id, file_id FROM photos "
+                "WHERE profile_id IN ({}) ORDER BY profile_id, position, id".format(placeholders),
+                chunk
             )
-            photos = [row['file_id'] for row in self.cursor.fetchall()]
+            for row in self.cursor.fetchall():
+                photos[row['profile_id']].append(row['file_id'])
             
             # Получаем интересы
             self.cursor.execute('''
-                SELECT i.name FROM interests i
-                JOIN profile_interests pi ON i.id = pi.interest_id
-                WHERE pi.profile_id = ?
-            ''', (profile['id'],))
-            
-            interests = [row['name'] for row in self.cursor.fetchall()]
-            
-            return {
-                'id': profile['id'],
-                'user_id': profile['user_id'],
-                'name': profile['name'],
-                'age': profile['age'],
-                'gender': profile['gender'],
-                'looking_for': profile['looking_for'],
-                'city': profile['city'],
-                'about': profile['about'],
-                'is_active': bool(profile['is_active']),
-                'interests': interests,
-                'photos': photos
+                SELECT pi.profile_id, i.name FROM profile_interests pi
+                JOIN interests i ON i.id = pi.interest_id
+                WHERE pi.profile_id IN ({})
+                ORDER BY pi.profile_id, pi.rowid
+            '''.format(placeholders), chunk)
+            for row in self.cursor.fetchall():
+                interests[row['profile_id']].append(row['name'])
+        
+        return [
+            {
+                'id': row['id'],
+                'user_id': row['user_id'],
+                'name': row['name'],
+                'age': row['age'],
+                'gender': row['gender'],
+                'looking_for': row['looking_for'],
+                'city': row['city'],
+                'about': row['about'],
+                'is_active': bool(row['is_active']),
+                'interests': interests[row['id']],
+                'interests_mask': row['interests_mask'],
+                'photos': photos[row['id']]
             }
-        return None
+            for row in rows
+        ]
+    
+    @staticmethod
+    def _chunks(items: list, size: int = 900):
+        """Разбиение списка на части (лимит параметров SQLite)"""
+        for i in range(0, len(items), size):
+            yield items[i:i + size]
+    
+    def is_profile_active(self, profile_id: int) -> bool:
+        """Проверка, что анкета существует и не скрыта"""
+        self.cursor.execute("SELECT is_active FROM profiles WHERE id = ?", (profile_id,))
+        row = self.cursor.fetchone()
+        return bool(row and row['is_active'])
     
     def get_profile_count(self) -> int:
         """Получение количества анкет"""
@@ -662,93 +740,40 @@ class Database:
             if not user_profile:
                 return None
             
-            looking_for = user_profile['looking_for']
-            user_gender = user_profile['gender']
-            
-            # Определяем какой пол ищем
-            gender_filter = self._get_gender_filter(looking_for, user_gender)
-            
-            # Базовый запрос
-            query = '''
-                SELECT DISTINCT p.*
-                FROM profiles p
-                WHERE p.user_id != ?
-                AND p.is_active = 1
-                AND p.gender IN ({})
-                AND p.looking_for IN ({})
-                AND NOT EXISTS (
-                    SELECT 1 FROM views v 
-                    WHERE v.viewer_id = ? AND v.viewed_profile_id = p.id
-                )
-                AND NOT EXISTS (
-                    SELECT 1 FROM likes l 
-                    WHERE l.from_user_id = ? AND l.to_profile_id = p.id
-                )
-            '''.format(
-                ','.join(['?' for _ in gender_filter['target_genders']]),
-                ','.join(['?' for _ in gender_filter['looking_for_genders']])
-            )
-            
-            params = [user_id, *gender_filter['target_genders'], 
-                     *gender_filter['looking_for_genders'], user_id, user_id]
-            
-            # Добавляем фильтр по городу
-            query += " AND p.city = ?"
-            params.append(user_profile['city'])
-            
-            # Добавляем фильтр по возрасту (+- 5 лет)
-            query += " AND p.age BETWEEN ? AND ?"
-            age_min = max(18, user_profile['age'] - 5)
-            age_max = user_profile['age'] + 5
-            params.extend([age_min, age_max])
+            criteria = self._get_candidate_criteria(user_profile)
             
-            query += " ORDER BY RANDOM() LIMIT 1"
-            
-            self.cursor.execute(query, params)
-            result = self.cursor.fetchone()
-            
-            if result:
-                return self._format_profile_result(result)
-            
-            # Если не нашли, ищем без фильтра по городу
-            query = '''
-                SELECT DISTINCT p.*
-                FROM profiles p
-                WHERE p.user_id != ?
-                AND p.is_active = 1
-                AND p.gender IN ({})
-                AND p.looking_for IN ({})
-                AND NOT EXISTS (
-                    SELECT 1 FROM views v 
-                    WHERE v.viewer_id = ? AND v.viewed_profile_id = p.id
-                )
-                AND NOT EXISTS (
-                    SELECT 1 FROM likes l 
-                    WHERE l.from_user_id = ? AND l.to_profile_id = p.id
-                )
-                AND p.age BETWEEN ? AND ?
-                ORDER BY RANDOM() LIMIT 1
-            '''.format(
-                ','.join(['?' for _ in gender_filter['target_genders']]),
-                ','.join(['?' for _ in gender_filter['looking_for_genders']])
-            )
-            
-            params = [user_id, *gender_filter['target_genders'], 
-                     *gender_filter['looking_for_genders'], user_id, user_id,
-                     age_min, age_max]
-            
-            self.cursor.execute(query, params)
-            result = self.cursor.fetchone()
+            # Сначала анкеты из города пользователя, затем из остальных
+            profile = self.candidate_pool.next_profile(user_id, criteria)
             
-            if result:
-                return self._format_profile_result(result)
+            # Новых анкет не осталось - возвращаем в подбор давно просмотренные
+            if profile is None and reshow_old_views(self, user_id):
+                profile = self.candidate_pool.next_profile(user_id, criteria)
             
-            return None
+            return profile
             
         except Exception as e:
             print(f"❌ Ошибка поиска следующей анкеты: {e}")
             return None
     
+    def _get_candidate_criteria(self, user_profile: dict) -> dict:
+        """Критерии подбора анкет для пользователя"""
+        gender_filter = self._get_gender_filter(user_profile['looking_for'], user_profile['gender'])
+        
+        # Фильтр по возрасту (+- 5 лет)
+        return {
+            'target_genders': gender_filter['target_genders'],
+            'looking_for_genders': gender_filter['looking_for_genders'],
+            'city': user_profile['city'],
+            'age_min': max(18, user_profile['age'] - 5),
+            'age_max': user_profile['age'] + 5,
+            'age': user_profile['age'],
+            'interests_mask': user_profile['interests_mask']
+        }
+    
+    def is_profile_seen(self, viewer_id: int, profile_id: int) -> bool:
+        """Проверка, просматривал или оценивал ли пользователь анкету"""
+        return self.seen_sets.contains(viewer_id, profile_id)
+    
     def _get_gender_filter(self, looking_for: str, user_gender: str) -> dict:
         """Определение фильтров по полу"""
         looking_for_map = {
@@ -775,48 +800,19 @@ class Database:
     
     def _format_profile_result(self, result) -> dict:
         """Форматирование результата запроса профиля"""
-        profile_id = result['id']
-        
-        # Получаем фото
-        self.cursor.execute(
-            "SELECT file_id FROM photos WHERE profile_id = ? ORDER BY position",
-            (profile_id,)
-        )
-        photos = [row['file_id'] for row in self.cursor.fetchall()]
-        
-        # Получаем интересы
-        self.cursor.execute('''
-            SELECT i.name FROM interests i
-            JOIN profile_interests pi ON i.id = pi.interest_id
-            WHERE pi.profile_id = ?
-        ''', (profile_id,))
-        
-        interests = [row['name'] for row in self.cursor.fetchall()]
-        
-        return {
-            'id': result['id'],
-            'user_id': result['user_id'],
-            'name': result['name'],
-            'age': result['age'],
-            'gender': result['gender'],
-            'looking_for': result['looking_for'],
-            'city': result['city'],
-            'about': result['about'],
-            'is_active': bool(result['is_active']),
-            'interests': interests,
-            'photos': photos
-        }
+        return self._hydrate_profiles([result])[0]
     
     # ========== МЕТОДЫ ДЛЯ ЛАЙКОВ И ПРОСМОТРОВ ==========
     
     def add_view(self, viewer_id: int, profile_id: int) -> bool:
         """Добавление записи о просмотре анкеты"""
         try:
-            self.cursor.execute(
+            self.seen_sets.add(viewer_id, profile_id)
+            # Результат записи не нужен, поэтому не ждем коммита
+            self._write(lambda cursor: cursor.execute(
                 "INSERT OR IGNORE INTO views (viewer_id, viewed_profile_id) VALUES (?, ?)",
                 (viewer_id, profile_id)
-            )
-            self.connection.commit()
+            ), wait=False)
             return True
         except Exception as e:
             print(f"❌ Ошибка добавления просмотра: {e}")
@@ -824,9 +820,9 @@ class Database:
     
     def add_like(self, from_user_id: int, to_profile_id: int, like_type: str = 'like') -> dict:
         """Добавление лайка/дизлайка"""
-        try:
+        def write(cursor):
             # Проверяем взаимность
-            self.cursor.execute('''
+            cursor.execute('''
                 SELECT 1 FROM likes 
                 WHERE from_user_id = (
                     SELECT user_id FROM profiles WHERE id = ?
@@ -835,17 +831,18 @@ class Database:
                 ) AND like_type = 'like'
             ''', (to_profile_id, from_user_id))
             
-            is_mutual = self.cursor.fetchone() is not None
+            is_mutual = cursor.fetchone() is not None
             
             # Добавляем лайк
-            self.cursor.execute('''
+            cursor.execute('''
                 INSERT OR REPLACE INTO likes (from_user_id, to_profile_id, like_type, is_mutual)
                 VALUES (?, ?, ?, ?)
             ''', (from_user_id, to_profile_id, like_type, is_mutual))
+            like_id = cursor.lastrowid
             
             # Если это взаимный лайк, обновляем существующую запись
             if like_type == 'like' and is_mutual:
-                self.cursor.execute('''
+                cursor.execute('''
                     UPDATE likes SET is_mutual = 1 
                     WHERE from_user_id = (
                         SELECT user_id FROM profiles WHERE id = ?
@@ -854,9 +851,11 @@ class Database:
                     )
                 ''', (to_profile_id, from_user_id))
             
-            self.connection.commit()
-            
-            return {'success': True, 'is_mutual': is_mutual, 'like_id': self.cursor.lastrowid}
+            return {'success': True, 'is_mutual': is_mutual, 'like_id': like_id}
+        
+        try:
+            self.seen_sets.add(from_user_id, to_profile_id)
+            return self._write(write)
             
         except Exception as e:
             print(f"❌ Ошибка добавления лайка: {e}")
@@ -867,9 +866,9 @@ class Database:
         try:
             print(f"DEBUG: Поиск лайков для profile_id={profile_id}")
             
-            # Сначала удаляем старые лайки от ботов
-            self.cursor.execute('''
-                DELETE FROM likes 
+            # Сначала удаляем старые лайки от ботов. Запись идет через поток-писатель
+            # и только если такие лайки есть: список открывают намного чаще
+            bot_likes_condition = '''
                 WHERE to_profile_id = ?
                 AND from_user_id IN (
                     SELECT p.user_id 
@@ -877,12 +876,13 @@ class Database:
                     JOIN bot_profiles bp ON p.id = bp.profile_id
                 )
                 AND (is_mutual = 0 OR like_type = 'like')
-            ''', (profile_id,))
-            
-            if self.cursor.rowcount > 0:
-                print(f"DEBUG: Удалено {self.cursor.rowcount} старых лайков от ботов")
-            
-            self.connection.commit()
+            '''
+            self.cursor.execute(f"SELECT EXISTS (SELECT 1 FROM likes {bot_likes_condition})", (profile_id,))
+            if self.cursor.fetchone()[0]:
+                deleted = self._write(lambda cursor: cursor.execute(
+                    f"DELETE FROM likes {bot_likes_condition}", (profile_id,)
+                ).rowcount)
+                print(f"DEBUG: Удалено {deleted} старых лайков от ботов")
             
             # Теперь получаем только лайки от реальных пользователей
             self.cursor.execute('''
@@ -934,19 +934,18 @@ class Database:
             
             # Если это отказ, то полностью удаляем запись, чтобы больше не показывать
             if response == 'dislike':
-                self.cursor.execute(
+                self._write(lambda cursor: cursor.execute(
                     "DELETE FROM likes WHERE id = ?",
                     (like_id,)
-                )
+                ))
                 print(f"DEBUG: Лайк {like_id} удален (dislike)")
             else:
-                self.cursor.execute(
+                self._write(lambda cursor: cursor.execute(
                     "UPDATE likes SET like_type = ? WHERE id = ?",
                     (response, like_id)
-                )
+                ))
                 print(f"DEBUG: Лайк {like_id} обновлен на {response}")
             
-            self.connection.commit()
             return True
         except Exception as e:
             print(f"❌ Ошибка отметки лайка: {e}")
@@ -954,16 +953,26 @@ class Database:
     
     def get_telegram_id_by_profile_id(self, profile_id: int) -> Optional[int]:
         """Получение telegram_id по profile_id"""
+        user_id = self.identity.user_id_by_profile(profile_id)
+        if user_id is not None:
+            telegram_id = self.identity.telegram_id(user_id)
+            if telegram_id is not None:
+                return telegram_id
+        
         try:
             self.cursor.execute('''
-                SELECT u.telegram_id 
+                SELECT u.id, u.telegram_id 
                 FROM users u
                 JOIN profiles p ON p.user_id = u.id
                 WHERE p.id = ?
             ''', (profile_id,))
             
             result = self.cursor.fetchone()
-            return result['telegram_id'] if result else None
+            if not result:
+                return None
+            self.identity.remember_user(result['telegram_id'], result['id'])
+            self.identity.remember_profile(result['id'], profile_id)
+            return result['telegram_id']
         except Exception as e:
             print(f"❌ Ошибка получения telegram_id: {e}")
             return None
@@ -972,18 +981,26 @@ class Database:
     
     def get_user_premium_status(self, user_id: int) -> Optional[dict]:
         """Получение статуса премиум подписки пользователя"""
+        found, status = self.premium_cache.get(user_id)
+        if found:
+            return status
+        
+        generation = self.premium_cache.generation()
         try:
+            # Истекшие подписки деактивирует фоновая задача, здесь достаточно
+            # проверить срок у самой поздней из активных
             self.cursor.execute('''
                 SELECT * FROM premium_subscriptions 
-                WHERE user_id = ? AND is_active = 1 AND expires_at > ?
+                WHERE user_id = ? AND is_active = 1
                 ORDER BY expires_at DESC
                 LIMIT 1
-            ''', (user_id, datetime.now().timestamp()))
+            ''', (user_id,))
             
             subscription = self.cursor.fetchone()
             
-            if subscription:
-                return {
+            status = None
+            if subscription and subscription['expires_at'] > datetime.now().timestamp():
+                status = {
                     'id': subscription['id'],
                     'user_id': subscription['user_id'],
                     'plan_type': subscription['plan_type'],
@@ -993,7 +1010,8 @@ class Database:
                     'is_active': bool(subscription['is_active']),
                     'payment_id': subscription['payment_id']
                 }
-            return None
+            self.premium_cache.put(user_id, status, generation)
+            return status
         except Exception as e:
             print(f"❌ Ошибка получения статуса премиума: {e}")
             return None
@@ -1008,22 +1026,39 @@ class Database:
                                    payment_id: str = None) -> Optional[int]:
         """Создание премиум подписки"""
         try:
-            starts_at = datetime.now().timestamp()
-            expires_at = starts_at + (duration_days * 86400)
-            
-            self.cursor.execute('''
-                INSERT INTO premium_subscriptions 
-                (user_id, plan_type, stars_amount, starts_at, expires_at, payment_id)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, plan_type, stars_amount, starts_at, expires_at, payment_id))
-            
-            subscription_id = self.cursor.lastrowid
-            self.connection.commit()
-            return subscription_id
+            subscription = self._write(lambda cursor: self._insert_premium_subscription(
+                cursor, user_id, plan_type, duration_days, stars_amount, payment_id
+            ))
+            self.premium_cache.update(user_id, subscription)
+            return subscription['id']
         except Exception as e:
             print(f"❌ Ошибка создания премиум подписки: {e}")
             return None
     
+    @staticmethod
+    def _insert_premium_subscription(cursor, user_id: int, plan_type: str, duration_days: int,
+                                     stars_amount: int, payment_id: Optional[str]) -> dict:
+        """Добавление подписки в текущей транзакции, возвращает ее статус"""
+        starts_at = datetime.now().timestamp()
+        expires_at = starts_at + (duration_days * 86400)
+        
+        cursor.execute('''
+            INSERT INTO premium_subscriptions 
+            (user_id, plan_type, stars_amount, starts_at, expires_at, payment_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (user_id, plan_type, stars_amount, starts_at, expires_at, payment_id))
+        
+        return {
+            'id': cursor.lastrowid,
+            'user_id': user_id,
+            'plan_type': plan_type,
+            'stars_amount': stars_amount,
+            'starts_at': starts_at,
+            'expires_at': expires_at,
+            'is_active': True,
+            'payment_id': payment_id
+        }
+    
     # ========== МЕТОДЫ ДЛЯ РЕФЕРАЛЬНОЙ СИСТЕМЫ ==========
     
     def get_referral_code(self, user_id: int) -> Optional[dict]:
@@ -1062,12 +1097,11 @@ class Database:
             code = ''.join(secrets.choice(alphabet) for _ in range(8))
         
         try:
-            self.cursor.execute('''
+            self._write(lambda cursor: cursor.execute('''
                 INSERT OR IGNORE INTO referral_codes (user_id, code)
                 VALUES (?, ?)
-            ''', (user_id, code))
+            ''', (user_id, code)))
             
-            self.connection.commit()
             print(f"DEBUG: Создан реферальный код {code} для пользователя {user_id}")
             return code
         except Exception as e:
@@ -1077,19 +1111,17 @@ class Database:
     
     def add_referral(self, referrer_id: int, referred_id: int) -> bool:
 
-        try:
-            print(f"DEBUG: Добавление реферала: {referrer_id} -> {referred_id}")
-            
+        def write(cursor):
             # Проверяем, нет ли уже такой записи
-            self.cursor.execute('''
+            cursor.execute('''
                 SELECT id FROM referrals WHERE referrer_id = ? AND referred_id = ?
             ''', (referrer_id, referred_id))
             
-            if self.cursor.fetchone():
+            if cursor.fetchone():
                 print(f"DEBUG: Реферал уже существует")
                 return False
             
-            self.cursor.execute('''
+            cursor.execute('''
                 INSERT INTO referrals (referrer_id, referred_id)
                 VALUES (?, ?)
             ''', (referrer_id, referred_id))
@@ -1097,158 +1129,228 @@ class Database:
             print(f"DEBUG: Реферал добавлен в таблицу")
             
             # Увеличиваем счетчик использования кода
-            self.cursor.execute('''
+            cursor.execute('''
                 UPDATE referral_codes 
                 SET uses = uses + 1 
                 WHERE user_id = ?
             ''', (referrer_id,))
             
             print(f"DEBUG: Счетчик кода обновлен")
-            
-            self.connection.commit()
-            print(f"DEBUG: Транзакция закоммичена")
             return True
+        
+        try:
+            print(f"DEBUG: Добавление реферала: {referrer_id} -> {referred_id}")
+            return self._write(write)
         except Exception as e:
             print(f"❌ Ошибка добавления реферала: {e}")
             return False
     
     def mark_referral_completed(self, referred_id: int) -> bool:
-
-        try:
-            print(f"DEBUG: Отметка реферала как выполнившего условие: {referred_id}")
-            
-            self.cursor.execute('''
+        """Отметка реферала как выполнившего условие (создал анкету)
+        
+        Счетчики реферера обновляет триггер, награда за каждые
+        REWARD_THRESHOLD рефералов выдается в той же транзакции.
+        """
+        def write(cursor):
+            cursor.execute('''
                 UPDATE referrals 
                 SET is_completed = 1 
-                WHERE referred_id = ?
+                WHERE referred_id = ? AND is_completed = 0
+                RETURNING referrer_id
             ''', (referred_id,))
+            referral = cursor.fetchone()
             
-            affected_rows = self.cursor.rowcount
-            self.connection.commit()
-            
-            print(f"DEBUG: Обновлено строк: {affected_rows}")
-            
-            if affected_rows > 0:
-                # Проверяем, достиг ли реферер 10 выполненных рефералов
-                self.cursor.execute('''
-                    SELECT COUNT(*) as completed_count
-                    FROM referrals 
-                    WHERE referrer_id = (
-                        SELECT referrer_id FROM referrals WHERE referred_id = ? LIMIT 1
-                    ) AND is_completed = 1
-                ''', (referred_id,))
-                
-                result = self.cursor.fetchone()
-                completed_count = result['completed_count'] if result else 0
-                
-                print(f"DEBUG: Выполненных рефералов у реферера: {completed_count}")
-                
-                if completed_count >= 10:
-                    # Автоматически выдаем награду
-                    referrer_id_result = self.cursor.execute(
-                        "SELECT referrer_id FROM referrals WHERE referred_id = ? LIMIT 1",
-                        (referred_id,)
-                    ).fetchone()
-                    
-                    if referrer_id_result:
-                        referrer_id = referrer_id_result['referrer_id']
-                        print(f"DEBUG: Реферер достиг 10 рефералов: {referrer_id}")
-                        
-                        # Проверяем, не получал ли уже награду
-                        self.cursor.execute('''
-                            SELECT reward_claimed FROM referrals 
-                            WHERE referrer_id = ? AND is_completed = 1 
-                            LIMIT 1
-                        ''', (referrer_id,))
-                        
-                        reward_check = self.cursor.fetchone()
-                        if reward_check and not reward_check['reward_claimed']:
-                            print(f"DEBUG: Выдаем награду рефереру {referrer_id}")
-                            self.claim_referral_reward(referrer_id)
-            
+            if not referral:
+                return None
+            return self._claim_referral_reward(cursor, referral['referrer_id'])
+        
+        try:
+            subscription = self._write(write)
+            if subscription:
+                print(f"DEBUG: Выдана награда рефереру {subscription['user_id']}")
+                self.premium_cache.update(subscription['user_id'], subscription)
             return True
         except Exception as e:
             print(f"❌ Ошибка отметки реферала: {e}")
             return False
     
     def get_referral_stats(self, user_id: int) -> dict:
-        """Получение статистики по рефералам"""
+        """Получение статистики по рефералам
+        
+        completed - выполнившие условие рефералы, за которых награда еще не
+        выдана (прогресс к следующей награде), rewarded - уже вознагражденные.
+        """
         try:
             self.cursor.execute('''
-                SELECT 
-                    COUNT(*) as total_referrals,
-                    SUM(CASE WHEN is_completed = 1 THEN 1 ELSE 0 END) as completed_referrals
-                FROM referrals 
-                WHERE referrer_id = ?
+                SELECT total_referrals, completed_referrals, rewarded_referrals
+                FROM referral_counters 
+                WHERE user_id = ?
             ''', (user_id,))
             
             result = self.cursor.fetchone()
+            if not result:
+                return {'total': 0, 'completed': 0, 'rewarded': 0}
+            
+            rewarded = min(result['rewarded_referrals'], result['completed_referrals'])
             return {
-                'total': result['total_referrals'] if result and result['total_referrals'] else 0,
-                'completed': result['completed_referrals'] if result and result['completed_referrals'] else 0
+                'total': result['total_referrals'],
+                'completed': result['completed_referrals'] - rewarded,
+                'rewarded': rewarded
             }
         except Exception as e:
             print(f"❌ Ошибка получения статистики рефералов: {e}")
-            return {'total': 0, 'completed': 0}
+            return {'total': 0, 'completed': 0, 'rewarded': 0}
     
     def claim_referral_reward(self, user_id: int) -> bool:
         """Получение награды за рефералов"""
         try:
-            stats = self.get_referral_stats(user_id)
-            
-            if stats['completed'] >= 10:
-                subscription_id = self.create_premium_subscription(
-                    user_id, 'referral', 1, 0, 'referral_reward'
-                )
-                
-                if subscription_id:
-                    self.cursor.execute('''
-                        UPDATE referrals 
-                        SET reward_claimed = 1 
-                        WHERE referrer_id = ? AND is_completed = 1 AND reward_claimed = 0
-                    ''', (user_id,))
-                    
-                    self.connection.commit()
-                    return True
+            subscription = self._write(lambda cursor: self._claim_referral_reward(cursor, user_id))
+            if not subscription:
+                return False
             
-            return False
+            self.premium_cache.update(user_id, subscription)
+            return True
         except Exception as e:
             print(f"❌ Ошибка получения награды: {e}")
             return False
     
+    def _claim_referral_reward(self, cursor, user_id: int) -> Optional[dict]:
+        """Выдача награды в текущей транзакции, возвращает статус подписки или None"""
+        # Проверка порога и списание рефералов - один запрос, повторная
+        # выдача за тех же рефералов невозможна
+        cursor.execute('''
+            UPDATE referral_counters
+            SET rewarded_referrals = rewarded_referrals + ?
+            WHERE user_id = ? AND completed_referrals - rewarded_referrals >= ?
+            RETURNING rewarded_referrals
+        ''', (REWARD_THRESHOLD, user_id, REWARD_THRESHOLD))
+        
+        if not cursor.fetchone():
+            return None
+        
+        cursor.execute('''
+            UPDATE referrals 
+            SET reward_claimed = 1 
+            WHERE referrer_id = ? AND is_completed = 1 AND reward_claimed = 0
+        ''', (user_id,))
+        
+        return self._insert_premium_subscription(cursor, user_id, 'referral', 1, 0, 'referral_reward')
+    
     # ========== МЕТОДЫ ДЛЯ ПЛАТЕЖЕЙ ==========
     
     def create_star_payment(self, user_id: int, stars_amount: int, 
                            product_type: str, product_duration: int = None) -> tuple:
         """Создание записи о платеже"""
-        try:
-            self.cursor.execute('''
+        def write(cursor):
+            cursor.execute('''
                 INSERT INTO star_payments 
                 (user_id, stars_amount, product_type, product_duration, status)
                 VALUES (?, ?, ?, ?, ?)
             ''', (user_id, stars_amount, product_type, product_duration, 'pending'))
             
-            payment_id = self.cursor.lastrowid
+            payment_id = cursor.lastrowid
             payload = f"payment_{payment_id}_{user_id}"
             
-            self.cursor.execute('''
+            cursor.execute('''
                 UPDATE star_payments 
                 SET invoice_payload = ? 
                 WHERE id = ?
             ''', (payload, payment_id))
-            
-            self.connection.commit()
             return payment_id, payload
+        
+        try:
+            return self._write(write)
         except Exception as e:
             print(f"❌ Ошибка создания платежа: {e}")
             return None, None
     
-    def complete_star_payment(self, payment_id: int, 
-                             telegram_payment_charge_id: str,
-                             provider_payment_charge_id: str) -> bool:
-        """Завершение успешного платежа"""
+    @staticmethod
+    def _parse_invoice_payload(payload: str) -> Optional[Tuple[int, int]]:
+        """(payment_id, user_id) из payload вида payment_{payment_id}_{user_id}"""
+        parts = (payload or '').split('_')
+        if len(parts) != 3 or parts[0] != 'payment' or not (parts[1].isdigit() and parts[2].isdigit()):
+            return None
+        return int(parts[1]), int(parts[2])
+    
+    def pre_check_star_payment(self, payload: str, user_id: int,
+                               total_amount: int, currency: str = 'XTR') -> Optional[str]:
+        """Проверка платежа перед оплатой (pending -> pre_checked)
+        
+        Возвращает None, если платеж можно принять, иначе текст ошибки
+        для пользователя.
+        """
+        parsed = self._parse_invoice_payload(payload)
+        if not parsed or parsed[1] != user_id:
+            return "Платеж не найден"
+        if currency != 'XTR':
+            return "Неверная валюта платежа"
+        
+        def write(cursor):
+            cursor.execute('''
+                SELECT user_id, stars_amount, invoice_payload, status
+                FROM star_payments
+                WHERE id = ?
+            ''', (parsed[0],))
+            payment = cursor.fetchone()
+            
+            if not payment or payment['user_id'] != user_id or payment['invoice_payload'] != payload:
+                return "Платеж не найден"
+            if payment['status'] == 'completed':
+                return "Платеж уже оплачен"
+            if payment['stars_amount'] != total_amount:
+                return "Неверная сумма платежа"
+            
+            cursor.execute(
+                "UPDATE star_payments SET status = 'pre_checked' WHERE id = ? AND status = 'pending'",
+                (parsed[0],)
+            )
+            return None
+        
         try:
-            self.cursor.execute('''
+            return self._write(write)
+        except Exception as e:
+            print(f"❌ Ошибка проверки платежа: {e}")
+            return "Не удалось проверить платеж, попробуйте позже"
+    
+    def complete_star_payment(self, payload: str,
+                             telegram_payment_charge_id: str,
+                             provider_payment_charge_id: str,
+                             user_id: int, total_amount: int) -> Optional[str]:
+        """Завершение успешного платежа (pre_checked -> completed)
+        
+        Отметка платежа и выдача подписки выполняются одной транзакцией.
+        Повторная доставка того же платежа (тот же telegram_payment_charge_id)
+        ничего не меняет. Возвращает 'completed', 'duplicate' или None,
+        если платеж не прошел проверку.
+        """
+        parsed = self._parse_invoice_payload(payload)
+        if not parsed or parsed[1] != user_id:
+            print(f"❌ Неизвестный платеж: {payload}")
+            return None
+        payment_id = parsed[0]
+        
+        def write(cursor):
+            cursor.execute(
+                "SELECT id FROM star_payments WHERE telegram_payment_charge_id = ?",
+                (telegram_payment_charge_id,)
+            )
+            if cursor.fetchone():
+                return 'duplicate', None
+            
+            cursor.execute('''
+                SELECT user_id, stars_amount, product_type, product_duration, status
+                FROM star_payments 
+                WHERE id = ?
+            ''', (payment_id,))
+            payment = cursor.fetchone()
+            
+            # Платежи, проверенные до появления статуса pre_checked, остаются в pending
+            if (not payment or payment['user_id'] != user_id
+                    or payment['status'] not in ('pending', 'pre_checked')
+                    or payment['stars_amount'] != total_amount):
+                return None, None
+            
+            cursor.execute('''
                 UPDATE star_payments 
                 SET status = 'completed',
                     telegram_payment_charge_id = ?,
@@ -1256,37 +1358,38 @@ class Database:
                 WHERE id = ?
             ''', (telegram_payment_charge_id, provider_payment_charge_id, payment_id))
             
-            self.cursor.execute('''
-                SELECT user_id, product_type, product_duration 
-                FROM star_payments 
-                WHERE id = ?
-            ''', (payment_id,))
-            
-            payment = self.cursor.fetchone()
-            if payment and payment['product_type'] == 'premium' and payment['product_duration']:
-                self.create_premium_subscription(
-                    payment['user_id'], 'paid', payment['product_duration'], 
-                    payment['product_duration'] * 100,
-                    f"stars_payment_{payment_id}"
+            subscription = None
+            if payment['product_type'] == 'premium' and payment['product_duration']:
+                subscription = self._insert_premium_subscription(
+                    cursor, user_id, 'paid', payment['product_duration'],
+                    payment['stars_amount'], f"stars_payment_{payment_id}"
                 )
-            
-            self.connection.commit()
-            return True
+            return 'completed', subscription
+        
+        try:
+            result, subscription = self._write(write)
+        except sqlite3.IntegrityError:
+            # Тот же платеж успел завершить другой процесс
+            return 'duplicate'
         except Exception as e:
             print(f"❌ Ошибка завершения платежа: {e}")
-            return False
+            return None
+        
+        if result is None:
+            print(f"❌ Платеж {payment_id} не прошел проверку")
+        if subscription:
+            self.premium_cache.update(user_id, subscription)
+        return result
     
     # ========== МЕТОДЫ ДЛЯ АФФИЛИАТОВ (ИСПРАВЛЕНЫ) ==========
     
     def add_affiliate(self, user_id: int, commission_rate: int = 10) -> bool:
         """Добавление аффилиата"""
         try:
-            self.cursor.execute('''
+            self._write(lambda cursor: cursor.execute('''
                 INSERT OR REPLACE INTO affiliates (user_id, commission_rate, is_active)
                 VALUES (?, ?, 1)
-            ''', (user_id, commission_rate))
-            
-            self.connection.commit()
+            ''', (user_id, commission_rate)))
             return True
         except Exception as e:
             print(f"❌ Ошибка добавления аффилиата: {e}")
@@ -1310,11 +1413,9 @@ class Database:
             
             # Получаем статистику по рефералам
             self.cursor.execute('''
-                SELECT 
-                    COUNT(*) as total_referrals,
-                    SUM(CASE WHEN is_completed = 1 THEN 1 ELSE 0 END) as completed_referrals
-                FROM referrals 
-                WHERE referrer_id = ?
+                SELECT total_referrals, completed_referrals
+                FROM referral_counters 
+                WHERE user_id = ?
             ''', (affiliate['user_id'],))
             
             referrals_stats = self.cursor.fetchone()
@@ -1377,14 +1478,10 @@ class Database:
     def create_affiliate_payout(self, affiliate_id: int, amount: int) -> Optional[int]:
         """Создание запроса на выплату аффилиату"""
         try:
-            self.cursor.execute('''
+            return self._write(lambda cursor: cursor.execute('''
                 INSERT INTO affiliate_payouts (affiliate_id, amount, status)
                 VALUES (?, ?, 'pending')
-            ''', (affiliate_id, amount))
-            
-            payout_id = self.cursor.lastrowid
-            self.connection.commit()
-            return payout_id
+            ''', (affiliate_id, amount)).lastrowid)
         except Exception as e:
             print(f"❌ Ошибка создания выплаты: {e}")
             return None
@@ -1392,5 +1489,6 @@ class Database:
     # ========== ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ ==========
     
     def close(self):
-        """Закрытие соединения с базой данных"""
-        self.connection.close()
\ No newline at end of file
+        """Закрытие соединений с базой данных"""
+        self.seen_sets.flush()
+        self.manager.close()
\ No newline at end of file
@@ -0,0 +1 @@
+__all__ = ['async_db', 'broadcast', 'candidate_pool', 'charts', 'connection', 'export', 'fsm_storage', 'geo', 'identity', 'metrics', 'migrations', 'prefetch', 'premium_cache', 'profile_cache', 'referral_counters', 'retention', 'scoring', 'seen_set', 'stats', 'write_queue']
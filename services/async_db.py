@@ -0,0 +1,157 @@
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabase:
+    """Асинхронная обертка над Database
+
+    Повторяет методы Database, но каждый вызов выполняется в отдельном пуле
+    потоков и возвращает корутину, поэтому запросы не блокируют цикл событий.
+    Число одновременно ожидающих вызовов ограничено, а медленные вызовы
+    пишутся в лог.
+    """
+
+    def __init__(self, db_name: str = 'dating_bot.db', max_workers: int = 8,
+                 max_pending: int = 64, slow_call_ms: float = 200):
+        # Импортируем здесь, чтобы избежать циклического импорта
+        from models import Database
+
+        self.db = Database(db_name)
+        self.slow_call_ms = slow_call_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='db')
+        self._max_pending = max_pending
+        self._semaphore = None
+        self._stats = {}
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+
+        # Кэшируем обертку, чтобы не создавать ее при каждом вызове
+        setattr(self, name, wrapper)
+        return wrapper
+
+    async def run(self, func, *args, **kwargs):
+        """Выполнение синхронной функции в пуле потоков базы"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_pending)
+
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            try:
+                return await loop.run_in_executor(
+                    self._executor, functools.partial(func, *args, **kwargs)
+                )
+            finally:
+                self._track(getattr(func, '__name__', 'query'), time.perf_counter() - started)
+
+    def _track(self, name: str, elapsed: float):
+        """Учет времени выполнения вызова"""
+        stats = self._stats.setdefault(name, {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        elapsed_ms = elapsed * 1000
+        stats['calls'] += 1
+        stats['total_ms'] += elapsed_ms
+        stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+        if elapsed_ms >= self.slow_call_ms:
+            logger.warning(f"🐢 Медленный запрос к БД {name}: {elapsed_ms:.0f} мс")
+
+    def get_call_stats(self) -> dict:
+        """Статистика вызовов: имя -> calls, total_ms, max_ms"""
+        return {name: dict(stats) for name, stats in self._stats.items()}
+
+    # ========== ИДЕНТИФИКАТОРЫ ==========
+    # Известные связи берутся из памяти без перехода в пул потоков
+
+    async def get_user_id_by_telegram_id(self, telegram_id: int) -> Optional[int]:
+        user_id = self.db.identity.user_id(telegram_id)
+        if user_id is not None:
+            return user_id
+        return await self.run(self.db.get_user_id_by_telegram_id, telegram_id)
+
+    async def get_telegram_id_by_user_id(self, user_id: int) -> Optional[int]:
+        telegram_id = self.db.identity.telegram_id(user_id)
+        if telegram_id is not None:
+            return telegram_id
+        return await self.run(self.db.get_telegram_id_by_user_id, user_id)
+
+    async def get_telegram_id_by_profile_id(self, profile_id: int) -> Optional[int]:
+        user_id = self.db.identity.user_id_by_profile(profile_id)
+        telegram_id = self.db.identity.telegram_id(user_id) if user_id is not None else None
+        if telegram_id is not None:
+            return telegram_id
+        return await self.run(self.db.get_telegram_id_by_profile_id, profile_id)
+
+    # ========== ПРЕМИУМ ==========
+
+    async def get_user_premium_status(self, user_id: int) -> Optional[dict]:
+        found, status = self.db.premium_cache.get(user_id)
+        if found:
+            return status
+        return await self.run(self.db.get_user_premium_status, user_id)
+
+    async def has_active_premium(self, user_id: int) -> bool:
+        return await self.get_user_premium_status(user_id) is not None
+
+    # ========== ПРОИЗВОЛЬНЫЕ ЗАПРОСЫ ==========
+
+    def _fetchone(self, query: str, params=()):
+        return self.db.cursor.execute(query, params).fetchone()
+
+    def _fetchall(self, query: str, params=()):
+        return self.db.cursor.execute(query, params).fetchall()
+
+    async def fetchone(self, query: str, params=()):
+        """Первая строка результата запроса"""
+        return await self.run(self._fetchone, query, params)
+
+    async def fetchall(self, query: str, params=()) -> list:
+        """Все строки результата запроса"""
+        return await self.run(self._fetchall, query, params)
+
+    async def fetchval(self, query: str, params=()):
+        """Первое значение первой строки результата запроса"""
+        row = await self.fetchone(query, params)
+        return row[0] if row else None
+
+    async def execute(self, query: str, params=()) -> Optional[int]:
+        """Выполнение изменяющего запроса с коммитом, возвращает lastrowid"""
+        return await self.write(lambda cursor: cursor.execute(query, params).lastrowid, 'execute')
+
+    async def write(self, operation, name: str = 'write'):
+        """Выполнение operation(cursor) в потоке-писателе (см. Database._write)"""
+        # Запись уходит в поток-писатель, поток пула не занимаем
+        started = time.perf_counter()
+        future = self.db.manager.submit_write(operation)
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            self._track(name, time.perf_counter() - started)
+
+    async def close(self):
+        """Закрытие соединений и остановка пула потоков"""
+        await self.run(self.db.close)
+        self._executor.shutdown(wait=False)
+
+
+_shared_db = None
+
+
+def get_db() -> AsyncDatabase:
+    """Общий экземпляр AsyncDatabase для всех роутеров"""
+    global _shared_db
+    if _shared_db is None:
+        _shared_db = AsyncDatabase()
+    return _shared_db
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Статусы доставки в broadcast_deliveries
+DELIVERED = 'sent'
+BLOCKED = 'blocked'
+FAILED = 'failed'
+
+# Запущенные в этом процессе рассылки: broadcast_id -> задача
+_running = {}
+
+
+class RateLimiter:
+    """Общий token bucket на отправку сообщений
+
+    Telegram допускает около 30 сообщений в секунду на бота. После
+    RetryAfter ждут все отправители, а не только получивший ошибку.
+    """
+
+    def __init__(self, rate: float = 30, burst: float = 30):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Остановка всех отправок на seconds секунд"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+class BroadcastEngine:
+    """Отправка одной рассылки
+
+    Получатели читаются порциями по users.id (keyset-пагинация) и
+    раздаются workers задачам-отправителям. Результат по каждому
+    получателю пишется в broadcast_deliveries, поэтому прерванная
+    рассылка при повторном запуске продолжается с неотправленных.
+    Заблокировавшие бота пользователи помечаются users.is_blocked
+    и в следующие рассылки не попадают.
+    """
+
+    def __init__(self, bot, db, broadcast_id: int, rate: float = 30,
+                 workers: int = 8, chunk_size: int = 500, max_retries: int = 3):
+        self.bot = bot
+        self.db = db
+        self.broadcast_id = broadcast_id
+        self.limiter = RateLimiter(rate)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.broadcast = None
+
+    async def run(self) -> dict:
+        """Отправка всем оставшимся получателям, возвращает итоговую статистику"""
+        self.broadcast = await self.db.fetchone(
+            "SELECT id, message_text, media_type, media_file_id, total_count "
+            "FROM broadcasts WHERE id = ?",
+            (self.broadcast_id,)
+        )
+        if not self.broadcast:
+            raise ValueError(f"Рассылка {self.broadcast_id} не найдена")
+
+        if not self.broadcast['total_count']:
+            await self.db.execute('''
+                UPDATE broadcasts
+                SET total_count = (SELECT COUNT(*) FROM users WHERE is_blocked = 0)
+                WHERE id = ?
+            ''', (self.broadcast_id,))
+        await self.db.execute(
+            "UPDATE broadcasts SET status = 'sending' WHERE id = ?",
+            (self.broadcast_id,)
+        )
+
+        recipients = asyncio.Queue(maxsize=self.workers * 2)
+        senders = [asyncio.create_task(self._sender(recipients)) for _ in range(self.workers)]
+
+        try:
+            async for user_id, telegram_id in self._iter_recipients():
+                await recipients.put((user_id, telegram_id))
+            for _ in senders:
+                await recipients.put(None)
+            await asyncio.gather(*senders)
+        except BaseException:
+            for sender in senders:
+                sender.cancel()
+            raise
+
+        await self.db.execute(
+            "UPDATE broadcasts SET status = 'completed' WHERE id = ?",
+            (self.broadcast_id,)
+        )
+        return await self.get_stats()
+
+    async def _iter_recipients(self):
+        """Получатели без записи о доставке, порциями по возрастанию users.id"""
+        last_id = 0
+        while True:
+            rows = await self.db.fetchall('''
+                SELECT u.id, u.telegram_id FROM users u
+                WHERE u.id > ? AND u.is_blocked = 0
+                AND NOT EXISTS (
+                    SELECT 1 FROM broadcast_deliveries d
+                    WHERE d.broadcast_id = ? AND d.user_id = u.id
+                )
+                ORDER BY u.id
+                LIMIT ?
+            ''', (last_id, self.broadcast_id, self.chunk_size))
+
+            if not rows:
+                return
+            for row in rows:
+                yield row['id'], row['telegram_id']
+            last_id = rows[-1]['id']
+
+    async def _sender(self, recipients: asyncio.Queue):
+        while True:
+            item = await recipients.get()
+            if item is None:
+                return
+
+            user_id, telegram_id = item
+            status, error = await self._deliver(telegram_id)
+            try:
+                await self.db.write(
+                    lambda cursor: self._record(cursor, user_id, status, error),
+                    'broadcast_delivery'
+                )
+            except Exception as e:
+                logger.error(f"❌ Ошибка записи доставки рассылки {self.broadcast_id}: {e}")
+
+    async def _deliver(self, telegram_id: int) -> tuple:
+        """Отправка одному получателю: (статус, текст ошибки)"""
+        for _ in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            try:
+                await self._send(telegram_id)
+                return DELIVERED, None
+            except TelegramRetryAfter as e:
+                logger.warning(f"⏳ Рассылка {self.broadcast_id}: RetryAfter {e.retry_after} с")
+                self.limiter.pause(e.retry_after)
+            except TelegramForbiddenError as e:
+                return BLOCKED, str(e)
+            except TelegramBadRequest as e:
+                return FAILED, str(e)
+            except Exception as e:
+                logger.error(f"❌ Ошибка отправки пользователю {telegram_id}: {e}")
+                return FAILED, str(e)
+
+        return FAILED, 'retry limit exceeded'
+
+    async def _send(self, telegram_id: int):
+        text = self.broadcast['message_text']
+        media_type = self.broadcast['media_type']
+        media_file_id = self.broadcast['media_file_id']
+
+        if media_type == 'photo':
+            await self.bot.send_photo(chat_id=telegram_id, photo=media_file_id,
+                                      caption=text, parse_mode="HTML")
+        elif media_type == 'video':
+            await self.bot.send_video(chat_id=telegram_id, video=media_file_id,
+                                      caption=text, parse_mode="HTML")
+        elif media_type == 'document':
+            await self.bot.send_document(chat_id=telegram_id, document=media_file_id,
+                                         caption=text, parse_mode="HTML")
+        else:
+            await self.bot.send_message(chat_id=telegram_id, text=text, parse_mode="HTML")
+
+    def _record(self, cursor, user_id: int, status: str, error: Optional[str]):
+        """Запись результата доставки и счетчиков рассылки (в потоке-писателе)"""
+        cursor.execute('''
+            INSERT OR IGNORE INTO broadcast_deliveries (broadcast_id, user_id, status, error)
+            VALUES (?, ?, ?, ?)
+        ''', (self.broadcast_id, user_id, status, error))
+        if not cursor.rowcount:
+            return
+
+        if status == DELIVERED:
+            cursor.execute(
+                "UPDATE broadcasts SET sent_count = sent_count + 1 WHERE id = ?",
+                (self.broadcast_id,)
+            )
+        else:
+            cursor.execute(
+                "UPDATE broadcasts SET failed_count = failed_count + 1 WHERE id = ?",
+                (self.broadcast_id,)
+            )
+
+        if status == BLOCKED:
+            cursor.execute(
+                "UPDATE users SET is_blocked = 1, blocked_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (user_id,)
+            )
+
+    async def get_stats(self) -> dict:
+        """Число получателей по статусам доставки"""
+        rows = await self.db.fetchall('''
+            SELECT status, COUNT(*) AS count FROM broadcast_deliveries
+            WHERE broadcast_id = ?
+            GROUP BY status
+        ''', (self.broadcast_id,))
+
+        stats = {DELIVERED: 0, BLOCKED: 0, FAILED: 0}
+        for row in rows:
+            stats[row['status']] = row['count']
+        stats['total'] = sum(stats.values())
+        return stats
+
+
+def start_broadcast(bot, db, broadcast_id: int, on_done=None, **kwargs) -> asyncio.Task:
+    """Запуск рассылки в фоне (повторный запуск уже идущей ничего не делает)
+
+    on_done(bot, broadcast_id, stats) вызывается после завершения рассылки.
+    """
+    task = _running.get(broadcast_id)
+    if task is not None and not task.done():
+        return task
+
+    async def run():
+        try:
+            stats = await BroadcastEngine(bot, db, broadcast_id, **kwargs).run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Критическая ошибка рассылки {broadcast_id}: {e}")
+            await db.execute(
+                "UPDATE broadcasts SET status = 'failed' WHERE id = ?",
+                (broadcast_id,)
+            )
+            return
+        finally:
+            _running.pop(broadcast_id, None)
+
+        if on_done is not None:
+            await on_done(bot, broadcast_id, stats)
+
+    task = asyncio.create_task(run())
+    _running[broadcast_id] = task
+    return task
+
+
+async def resume_broadcasts(bot, db, on_done=None) -> list:
+    """Продолжение рассылок, прерванных остановкой бота"""
+    rows = await db.fetchall(
+        "SELECT id FROM broadcasts WHERE status IN ('pending', 'sending') ORDER BY id"
+    )
+    for row in rows:
+        logger.info(f"📢 Продолжаем рассылку #{row['id']}")
+        start_broadcast(bot, db, row['id'], on_done)
+    return [row['id'] for row in rows]
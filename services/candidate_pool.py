@@ -0,0 +1,254 @@
+import heapq
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from services.geo import city_rings
+from services.scoring import score_candidates
+
+
+class CandidatePool:
+    """Пул заранее отобранных кандидатов для просмотра анкет
+
+    Для каждого зрителя строится очередь id анкет, подходящих по полу,
+    кого ищут, городу и возрасту. Сначала выдаются анкеты из города
+    пользователя, затем - из соседних городов кольцами по расстоянию
+    (services.geo), и только потом - из остальных городов.
+
+    Очередь сегмента заполняется по совместимости (общие интересы и разница
+    в возрасте, см. services.scoring): читаются (id, маска интересов, возраст)
+    всех кандидатов сегмента по покрывающему индексу, просмотренные
+    отсеиваются по битовой карте зрителя (services.seen_set), и в очередь
+    попадают batch_size лучших. Следующая анкета берется из очереди за O(1),
+    а очередь дозаполняется, когда в ней остается мало кандидатов.
+
+    Если в очередь попали все кандидаты сегмента, он помечается исчерпанным
+    и больше не запрашивается, пока анкеты не изменятся (profile_changed)
+    или не пройдет rescan_interval секунд.
+    """
+
+    def __init__(self, db, batch_size: int = 200, low_watermark: int = 10,
+                 max_viewers: int = 5000, rescan_interval: float = 600,
+                 min_rescan_interval: float = 30):
+        self.db = db
+        self.batch_size = batch_size
+        self.low_watermark = low_watermark
+        self.max_viewers = max_viewers
+        self.rescan_interval = rescan_interval
+        self.min_rescan_interval = min_rescan_interval
+        self._pools = OrderedDict()
+        self._lock = threading.Lock()
+        self._revision = 0
+
+    # ========== ПУБЛИЧНЫЕ МЕТОДЫ ==========
+
+    def next_profile(self, viewer_id: int, criteria: dict) -> Optional[dict]:
+        """Следующая анкета из пула зрителя"""
+        pool = self._get_pool(viewer_id, criteria)
+
+        with pool['lock']:
+            for segment in pool['segments']:
+                profile = self._pop_valid(pool, segment, viewer_id, criteria)
+                if profile:
+                    return profile
+        return None
+
+    def profile_changed(self):
+        """Анкеты изменились: исчерпанные сегменты будут перечитаны"""
+        with self._lock:
+            self._revision += 1
+
+    def discard(self, viewer_id: int):
+        """Сброс пула зрителя"""
+        with self._lock:
+            self._pools.pop(viewer_id, None)
+
+    def clear(self):
+        """Сброс всех пулов"""
+        with self._lock:
+            self._pools.clear()
+
+    # ========== ВНУТРЕННИЕ МЕТОДЫ ==========
+
+    def _get_pool(self, viewer_id: int, criteria: dict) -> dict:
+        """Получение пула зрителя (пересоздается при смене критериев)"""
+        key = self._criteria_key(criteria)
+
+        with self._lock:
+            pool = self._pools.get(viewer_id)
+            if pool is None or pool['key'] != key:
+                segments = self._make_segments(criteria['city'])
+                pool = {
+                    'key': key,
+                    'lock': threading.Lock(),
+                    'segments': segments,
+                    'queues': {segment: deque() for segment in segments},
+                    'scores': {segment: {} for segment in segments},
+                    'exhausted': {},
+                    # Выданные анкеты: в очередь повторно не попадают, даже
+                    # если просмотр еще не записан
+                    'served': set(),
+                }
+                self._pools[viewer_id] = pool
+
+            self._pools.move_to_end(viewer_id)
+            while len(self._pools) > self.max_viewers:
+                self._pools.popitem(last=False)
+
+            return pool
+
+    @staticmethod
+    def _make_segments(city: str) -> list:
+        """Сегменты поиска: (включить города, исключить города)
+
+        Город пользователя, кольца соседних городов и последний сегмент -
+        все города, кроме уже перечисленных.
+        """
+        segments = [((city,), ())]
+        nearby = [city]
+        for ring in city_rings(city):
+            segments.append((ring, ()))
+            nearby.extend(ring)
+        segments.append(((), tuple(nearby)))
+        return segments
+
+    def _pop_valid(self, pool: dict, segment: tuple, viewer_id: int, criteria: dict) -> Optional[dict]:
+        """Извлечение первого актуального кандидата из сегмента"""
+        queue = pool['queues'][segment]
+
+        while True:
+            if len(queue) < self.low_watermark:
+                self._refill(pool, segment, viewer_id, criteria)
+
+            if not queue:
+                return None
+
+            profile_id = queue.popleft()
+            pool['scores'][segment].pop(profile_id, None)
+            pool['served'].add(profile_id)
+
+            # Поля фильтра читаются из базы: в ProfileCache анкета может быть
+            # устаревшей до ttl секунд (например, после правки в другом процессе)
+            row = self._fetch_filter_fields(profile_id)
+            if not row or not self._is_still_candidate(row, segment, viewer_id, criteria):
+                continue
+
+            profile = self.db.get_profile_by_id(profile_id)
+            if profile and any(profile[key] != row[key] for key in row.keys()):
+                self.db.profile_cache.invalidate(profile_id)
+                profile = self.db.get_profile_by_id(profile_id)
+            if profile:
+                return profile
+
+    def _refill(self, pool: dict, segment: tuple, viewer_id: int, criteria: dict):
+        """Дозаполнение очереди сегмента самыми совместимыми кандидатами"""
+        exhausted = pool['exhausted'].get(segment)
+        if exhausted is not None:
+            if not self._should_rescan(*exhausted):
+                return
+            # Анкеты могли стать подходящими после правки города, возраста и т.п.
+            del pool['exhausted'][segment]
+
+        seen = self.db.seen_sets.get(viewer_id)
+        scores = pool['scores'][segment]
+        served = pool['served']
+        revision = self._revision
+
+        ids, masks, ages = [], [], []
+        for profile_id, age, mask in self._fetch_candidates(segment, viewer_id, criteria):
+            if profile_id in seen or profile_id in scores or profile_id in served:
+                continue
+            ids.append(profile_id)
+            masks.append(mask)
+            ages.append(age)
+
+        if len(ids) <= self.batch_size:
+            pool['exhausted'][segment] = (time.monotonic(), revision)
+
+        # batch_size лучших по всему сегменту. Ключ - (совместимость, случайное
+        # число): при равенстве порядок случайный и не зависит от id анкеты
+        # и от того, при каком дозаполнении она прочитана
+        new_scores = score_candidates(criteria['interests_mask'], criteria['age'], masks, ages)
+        keys = [(score, random.random()) for score in new_scores]
+        for index in heapq.nlargest(self.batch_size, range(len(ids)), key=keys.__getitem__):
+            scores[ids[index]] = keys[index]
+
+        queue = pool['queues'][segment]
+        queue.clear()
+        queue.extend(sorted(scores, key=scores.get, reverse=True))
+
+    def _should_rescan(self, exhausted_at: float, revision: int) -> bool:
+        """Пора ли перечитать исчерпанный сегмент"""
+        elapsed = time.monotonic() - exhausted_at
+        if elapsed >= self.rescan_interval:
+            return True
+        return revision != self._revision and elapsed >= self.min_rescan_interval
+
+    def _fetch_candidates(self, segment: tuple, viewer_id: int, criteria: dict):
+        """Все кандидаты сегмента: курсор по (id, age, interests_mask)"""
+        query = '''
+            SELECT p.id, p.age, p.interests_mask
+            FROM profiles p
+            WHERE p.user_id != ?
+            AND p.is_active = 1
+            AND p.gender IN ({})
+            AND p.looking_for IN ({})
+            AND p.age BETWEEN ? AND ?
+        '''.format(
+            ','.join(['?' for _ in criteria['target_genders']]),
+            ','.join(['?' for _ in criteria['looking_for_genders']])
+        )
+
+        params = [viewer_id, *criteria['target_genders'], *criteria['looking_for_genders'],
+                  criteria['age_min'], criteria['age_max']]
+
+        # Списки городов сегмента - IN по покрывающему индексу idx_profiles_candidates
+        include, exclude = segment
+        if include:
+            query += " AND p.city IN ({})".format(','.join(['?' for _ in include]))
+            params.extend(include)
+        else:
+            query += " AND p.city NOT IN ({})".format(','.join(['?' for _ in exclude]))
+            params.extend(exclude)
+
+        # Отдельный курсор: строки читаются по мере обхода
+        return self.db.connection.execute(query, params)
+
+    def _fetch_filter_fields(self, profile_id: int):
+        """Актуальные поля анкеты, по которым отбираются кандидаты"""
+        return self.db.cursor.execute('''
+            SELECT id, user_id, is_active, gender, looking_for, age, city
+            FROM profiles WHERE id = ?
+        ''', (profile_id,)).fetchone()
+
+    def _is_still_candidate(self, profile: dict, segment: tuple, viewer_id: int, criteria: dict) -> bool:
+        """Проверка, что анкета из очереди все еще подходит зрителю"""
+        if not profile['is_active'] or profile['user_id'] == viewer_id:
+            return False
+        if profile['gender'] not in criteria['target_genders']:
+            return False
+        if profile['looking_for'] not in criteria['looking_for_genders']:
+            return False
+        if not criteria['age_min'] <= profile['age'] <= criteria['age_max']:
+            return False
+        include, exclude = segment
+        if include and profile['city'] not in include:
+            return False
+        if profile['city'] in exclude:
+            return False
+
+        return profile['id'] not in self.db.seen_sets.get(viewer_id)
+
+    @staticmethod
+    def _criteria_key(criteria: dict) -> tuple:
+        return (
+            tuple(criteria['target_genders']),
+            tuple(criteria['looking_for_genders']),
+            criteria['city'],
+            criteria['age_min'],
+            criteria['age_max'],
+            criteria['age'],
+            criteria['interests_mask'],
+        )
@@ -0,0 +1,133 @@
+from io import BytesIO
+
+# Точка входа процессов отрисовки графиков (services.charts.ChartRenderer).
+# Модуль не импортирует aiogram, базу данных и обработчики: процессам пула
+# нужны только он и matplotlib.
+
+
+def initialize():
+    """Инициализатор процесса пула: matplotlib загружается один раз при запуске"""
+    _pyplot()
+
+
+# ========== ОТРИСОВКА ==========
+
+def _pyplot():
+    """matplotlib импортируется только в процессе отрисовки"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _draw_growth(plt, data: dict):
+    fig, ax = plt.subplots(figsize=(12, 6))
+    dates = data['dates']
+    ax.plot(dates[::3], data['users'][::3], marker='o', label='👥 Пользователи', linewidth=2.5, markersize=8)
+    ax.plot(dates[::3], data['profiles'][::3], marker='s', label='📝 Анкеты', linewidth=2.5, markersize=8)
+    ax.set_xlabel('📅 Дата', fontsize=12, fontweight='bold')
+    ax.set_ylabel('📊 Количество', fontsize=12, fontweight='bold')
+    ax.set_title('📈 Рост пользователей и анкет за 30 дней', fontsize=14, fontweight='bold')
+    ax.legend(fontsize=11, loc='upper left')
+    ax.grid(True, alpha=0.3)
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    return fig
+
+
+def _draw_gender(plt, data: dict):
+    labels = data['labels']
+    colors = ['#FF69B4', '#4169E1', '#FFD700']
+
+    fig, ax = plt.subplots(figsize=(10, 8))
+    wedges, texts, autotexts = ax.pie(data['counts'], labels=labels, autopct='%1.1f%%',
+                                      colors=colors[:len(labels)], startangle=90)
+
+    for autotext in autotexts:
+        autotext.set_color('white')
+        autotext.set_fontweight('bold')
+        autotext.set_fontsize(12)
+
+    for text in texts:
+        text.set_fontsize(14)
+        text.set_fontweight('bold')
+
+    ax.set_title('👫 Распределение пользователей по полу', fontsize=16, fontweight='bold', pad=20)
+    return fig
+
+
+def _draw_daily(plt, data: dict):
+    fig, ax = plt.subplots(figsize=(12, 5))
+    bars = ax.bar(data['dates'][::3], data['users'][::3], color='#FF69B4', alpha=0.7,
+                  edgecolor='#FF1493', linewidth=2)
+
+    ax.set_xlabel('📅 Дата', fontsize=11, fontweight='bold')
+    ax.set_ylabel('👥 Новых пользователей', fontsize=11, fontweight='bold')
+    ax.set_title('📈 Статистика новых пользователей за 30 дней', fontsize=12, fontweight='bold')
+    ax.grid(True, alpha=0.3, axis='y')
+
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width() / 2., height, f'{int(height)}',
+                ha='center', va='bottom', fontweight='bold')
+
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    return fig
+
+
+def _draw_activity(plt, data: dict):
+    hours = data['hours']
+    activity = data['views']
+
+    fig, ax = plt.subplots(figsize=(12, 5))
+    ax.plot(hours, activity, marker='o', linewidth=2.5, markersize=8, color='#FF69B4')
+    ax.fill_between(hours, activity, alpha=0.3, color='#FF69B4')
+
+    ax.set_xlabel('Hour', fontsize=11, fontweight='bold')
+    ax.set_ylabel('Views', fontsize=11, fontweight='bold')
+    ax.set_title('Activity by Hour', fontsize=12, fontweight='bold')
+    ax.grid(True, alpha=0.3)
+    ax.set_xticks(range(0, 24, 2))
+
+    plt.tight_layout()
+    return fig
+
+
+def _draw_sales(plt, data: dict):
+    dates = data['dates'][::3]
+    revenue = data['revenue'][::3]
+
+    fig, ax = plt.subplots(figsize=(12, 5))
+    ax.plot(dates, revenue, marker='o', linewidth=2.5, markersize=8, color='#FFD700')
+    ax.fill_between(range(len(dates)), revenue, alpha=0.3, color='#FFD700')
+
+    ax.set_xlabel('Date', fontsize=11, fontweight='bold')
+    ax.set_ylabel('Revenue (Stars)', fontsize=11, fontweight='bold')
+    ax.set_title('Revenue Chart (30 days)', fontsize=12, fontweight='bold')
+    ax.grid(True, alpha=0.3, axis='y')
+
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    return fig
+
+
+CHARTS = {
+    'growth': _draw_growth,
+    'gender': _draw_gender,
+    'daily': _draw_daily,
+    'activity': _draw_activity,
+    'sales': _draw_sales,
+}
+
+
+def render_png(chart: str, data: dict) -> bytes:
+    """Отрисовка графика в PNG"""
+    plt = _pyplot()
+    fig = CHARTS[chart](plt, data)
+    try:
+        buf = BytesIO()
+        fig.savefig(buf, format='png', dpi=100, bbox_inches='tight')
+        return buf.getvalue()
+    finally:
+        plt.close(fig)
@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from aiogram.types import BufferedInputFile
+
+from services.chart_worker import initialize, render_png
+
+logger = logging.getLogger(__name__)
+
+
+# ========== СЕРВИС ГРАФИКОВ ==========
+
+class ChartRenderer:
+    """Отрисовка графиков в отдельном процессе с кэшем результатов
+
+    Ключ кэша - (тип графика, хэш данных). Для уже отправленного графика
+    хранится file_id Telegram, и повторная отправка не требует ни
+    отрисовки, ни загрузки файла.
+    """
+
+    def __init__(self, max_workers: int = 1, max_cached: int = 64):
+        self.max_workers = max_workers
+        self.max_cached = max_cached
+        self._executor = None
+        self._cache = OrderedDict()
+
+    @staticmethod
+    def _make_key(chart: str, data: dict) -> tuple:
+        payload = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+        return chart, hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: форк процесса с потоками базы данных небезопасен.
+            # Процессы выполняют только services.chart_worker
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=initialize
+            )
+        return self._executor
+
+    def _remember(self, key: tuple, **fields) -> dict:
+        entry = self._cache.setdefault(key, {'png': None, 'file_id': None})
+        entry.update(fields)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        return entry
+
+    async def render(self, chart: str, data: dict) -> bytes:
+        """PNG графика (из кэша или отрисованный в пуле процессов)"""
+        key = self._make_key(chart, data)
+        entry = self._cache.get(key)
+        if entry and entry['png']:
+            self._cache.move_to_end(key)
+            return entry['png']
+
+        loop = asyncio.get_running_loop()
+        png = await loop.run_in_executor(self._get_executor(), render_png, chart, data)
+        self._remember(key, png=png)
+        return png
+
+    async def send(self, message, chart: str, data: dict, filename: str, **kwargs):
+        """Отправка графика фотографией в чат message"""
+        key = self._make_key(chart, data)
+        entry = self._cache.get(key)
+
+        if entry and entry['file_id']:
+            try:
+                return await message.answer_photo(entry['file_id'], **kwargs)
+            except Exception as e:
+                logger.warning(f"⚠️ file_id графика {chart} недействителен: {e}")
+                entry['file_id'] = None
+
+        png = await self.render(chart, data)
+        sent = await message.answer_photo(BufferedInputFile(png, filename=filename), **kwargs)
+        if sent and sent.photo:
+            self._remember(key, file_id=sent.photo[-1].file_id)
+        return sent
+
+    def close(self):
+        """Остановка процессов отрисовки"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_shared_renderer = None
+
+
+def get_renderer() -> ChartRenderer:
+    """Общий экземпляр ChartRenderer"""
+    global _shared_renderer
+    if _shared_renderer is None:
+        _shared_renderer = ChartRenderer()
+    return _shared_renderer
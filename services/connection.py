@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+from services.write_queue import WriteQueue
+
+
+class ConnectionManager:
+    """Общие соединения с базой данных
+
+    Один менеджер на файл базы: все экземпляры Database с тем же путем
+    используют его. Каждый поток получает собственное соединение и курсор,
+    база работает в режиме WAL, поэтому чтение не блокируется записью.
+    """
+
+    PRAGMAS = (
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA mmap_size = 268435456",
+        "PRAGMA cache_size = -65536",
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA busy_timeout = 5000",
+    )
+
+    _managers = {}
+    _managers_lock = threading.Lock()
+
+    def __init__(self, db_name: str):
+        self.db_name = db_name
+        self.schema_ready = False
+        self.schema_lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.RLock()
+        self.write_queue = WriteQueue(self.open_connection)
+        # In-memory база существует только в рамках одного соединения
+        self._shared = self.open_connection() if db_name == ':memory:' else None
+
+    @classmethod
+    def get(cls, db_name: str) -> 'ConnectionManager':
+        """Менеджер для файла базы данных"""
+        key = db_name if db_name == ':memory:' else os.path.abspath(db_name)
+
+        with cls._managers_lock:
+            manager = cls._managers.get(key)
+            if manager is None or db_name == ':memory:':
+                manager = cls(db_name)
+                cls._managers[key] = manager
+            return manager
+
+    def open_connection(self) -> sqlite3.Connection:
+        """Открытие и настройка нового соединения"""
+        connection = sqlite3.connect(self.db_name, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        for pragma in self.PRAGMAS:
+            connection.execute(pragma)
+
+        with self._lock:
+            self._connections.append(connection)
+        return connection
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока"""
+        if self._shared is not None:
+            return self._shared
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self.open_connection()
+            self._local.connection = connection
+        return connection
+
+    @property
+    def cursor(self) -> sqlite3.Cursor:
+        """Курсор текущего потока"""
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None or cursor.connection is not self.connection:
+            cursor = self.connection.cursor()
+            self._local.cursor = cursor
+        return cursor
+
+    def submit_write(self, operation) -> Future:
+        """Запись через общий поток-писатель (см. WriteQueue)"""
+        if self._shared is None:
+            return self.write_queue.submit(operation)
+
+        # In-memory база доступна только через общее соединение
+        future = Future()
+        with self._lock:
+            try:
+                result = operation(self._shared.cursor())
+                self._shared.commit()
+                future.set_result(result)
+            except Exception as e:
+                self._shared.rollback()
+                future.set_exception(e)
+        return future
+
+    def close(self):
+        """Закрытие всех соединений"""
+        self.write_queue.close()
+
+        with self._lock:
+            connections, self._connections = self._connections, []
+
+        for connection in connections:
+            try:
+                connection.close()
+            except sqlite3.Error:
+                pass
+
+        self._local = threading.local()
+        if self._shared is not None:
+            self._shared = self.open_connection()
+            self.schema_ready = False
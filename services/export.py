@@ -0,0 +1,177 @@
+import asyncio
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+from typing import Callable, List, Optional
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Выгружаемые наборы данных -> таблица
+EXPORT_TABLES = {
+    'users': 'users',
+    'profiles': 'profiles',
+    'likes': 'likes',
+    'views': 'views',
+    'payments': 'star_payments',
+}
+
+# Бот может отправить файл не больше 50 МБ. Выгрузка делится на части
+# с запасом: размер проверяется после каждой записанной порции строк
+TELEGRAM_FILE_LIMIT = 50 * 1024 * 1024
+MAX_PART_SIZE = 45 * 1024 * 1024
+
+
+def get_formats() -> list:
+    """Доступные форматы выгрузки (parquet - если установлен pyarrow)"""
+    formats = ['csv', 'jsonl']
+    if pyarrow is not None:
+        formats.append('parquet')
+    return formats
+
+
+def file_suffix(fmt: str) -> str:
+    """Расширение файла выгрузки"""
+    return '.parquet' if fmt == 'parquet' else f'.{fmt}.gz'
+
+
+def _write_csv(path: str, columns: list, chunks):
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for rows in chunks:
+            writer.writerows(rows)
+
+
+def _write_jsonl(path: str, columns: list, chunks):
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for rows in chunks:
+            for row in rows:
+                f.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str))
+                f.write('\n')
+
+
+def _write_parquet(path: str, columns: list, chunks):
+    writer = None
+    try:
+        for rows in chunks:
+            # Каждая порция - отдельная группа строк, в памяти только она
+            table = pyarrow.Table.from_pydict({
+                column: [row[index] for row in rows] for index, column in enumerate(columns)
+            })
+            if writer is None:
+                writer = pyarrow.parquet.ParquetWriter(path, table.schema, compression='zstd')
+            elif table.schema != writer.schema:
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+WRITERS = {
+    'csv': _write_csv,
+    'jsonl': _write_jsonl,
+    'parquet': _write_parquet,
+}
+
+
+def export_table(connection, dataset: str, fmt: str = 'csv', chunk_size: int = 5000,
+                 progress: Optional[Callable[[int, int], None]] = None,
+                 max_part_size: Optional[int] = MAX_PART_SIZE) -> List[str]:
+    """Потоковая выгрузка таблицы во временные файлы, возвращает пути к ним
+
+    Строки читаются курсором порциями по chunk_size, поэтому расход памяти
+    не зависит от размера таблицы. Когда файл дорастает до max_part_size
+    байт, следующие строки пишутся в новый файл; каждая часть - отдельный
+    полноценный файл формата. progress(выгружено, всего) вызывается
+    после каждой порции. Файлы удаляет вызывающая сторона.
+    """
+    table = EXPORT_TABLES[dataset]
+    if fmt not in get_formats():
+        raise ValueError(f"Формат {fmt} недоступен")
+
+    total = connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    cursor = connection.execute(f"SELECT * FROM {table} ORDER BY rowid")
+    columns = [description[0] for description in cursor.description]
+
+    def chunks():
+        done = 0
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield [tuple(row) for row in rows]
+            done += len(rows)
+            if progress is not None:
+                progress(done, total)
+
+    source = chunks()
+    pending = next(source, None)
+
+    def part_chunks(path: str):
+        # Следующая порция читается, когда предыдущая уже записана в файл
+        nonlocal pending
+        while pending is not None:
+            yield pending
+            pending = next(source, None)
+            if max_part_size and os.path.getsize(path) >= max_part_size:
+                return
+
+    paths = []
+    try:
+        while pending is not None or not paths:
+            fd, path = tempfile.mkstemp(prefix=f'export_{dataset}_', suffix=file_suffix(fmt))
+            os.close(fd)
+            paths.append(path)
+            WRITERS[fmt](path, columns, part_chunks(path))
+    except Exception:
+        for path in paths:
+            os.remove(path)
+        raise
+    finally:
+        cursor.close()
+    return paths
+
+
+async def export(db, dataset: str, fmt: str = 'csv', on_progress=None,
+                 progress_interval: float = 3.0) -> List[str]:
+    """Выгрузка в отдельном потоке с отдельным соединением, возвращает пути частей
+
+    on_progress(выгружено, всего) - корутина, вызывается не чаще
+    раза в progress_interval секунд.
+    """
+    state = {'done': 0, 'total': 0}
+
+    def progress(done: int, total: int):
+        state['done'] = done
+        state['total'] = total
+
+    def run() -> List[str]:
+        # Отдельное соединение только для чтения: в WAL-режиме длинное
+        # чтение не мешает записи
+        connection = sqlite3.connect(db.db.manager.db_name)
+        connection.execute("PRAGMA query_only = 1")
+        try:
+            return export_table(connection, dataset, fmt, progress=progress)
+        finally:
+            connection.close()
+
+    task = asyncio.ensure_future(asyncio.to_thread(run))
+    reported = 0
+    while True:
+        done, _ = await asyncio.wait([task], timeout=progress_interval)
+        if done:
+            return task.result()
+        if on_progress is not None and state['done'] != reported:
+            reported = state['done']
+            try:
+                await on_progress(state['done'], state['total'])
+            except Exception as e:
+                print(f"❌ Ошибка отображения прогресса выгрузки: {e}")
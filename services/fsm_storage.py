@@ -0,0 +1,204 @@
+import asyncio
+import copy
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+
+def pack_data(data: dict) -> bytes:
+    """Сериализация данных состояния
+
+    msgpack - зависимость бота (requirements.txt). JSON остается запасным
+    вариантом для окружений без него; по префиксу читаются оба формата.
+    """
+    if msgpack is not None:
+        return b'm' + msgpack.packb(data, use_bin_type=True)
+    return b'j' + json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def unpack_data(blob: Optional[bytes]) -> dict:
+    """Десериализация данных состояния"""
+    if not blob:
+        return {}
+
+    blob = bytes(blob)
+    if blob[:1] == b'm':
+        if msgpack is None:
+            raise RuntimeError("Данные FSM сохранены в msgpack, но пакет msgpack не установлен")
+        return msgpack.unpackb(blob[1:], raw=False)
+    return json.loads(blob[1:].decode('utf-8'))
+
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище состояний FSM в базе бота вместо MemoryStorage
+
+    Состояния и данные переживают перезапуск. Чтение идет из кэша в памяти,
+    а изменения копятся и записываются одной транзакцией раз в flush_interval
+    секунд, поэтому серия update_data в одном обработчике дает одну запись.
+    Записи, которые не менялись дольше ttl секунд, удаляются.
+    """
+
+    def __init__(self, db=None, ttl: int = 7 * 86400, flush_interval: float = 0.5,
+                 sweep_interval: int = 600, max_cached: int = 10000):
+        if db is None:
+            # Импортируем здесь, чтобы избежать циклического импорта
+            from services.async_db import get_db
+            db = get_db()
+
+        self.db = db
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.sweep_interval = sweep_interval
+        self.max_cached = max_cached
+        self._cache = OrderedDict()
+        self._dirty = set()
+        self._flush_task = None
+        self._last_sweep = time.time()
+
+    # ========== ИНТЕРФЕЙС BaseStorage ==========
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get_record(key)
+        record['state'] = state.state if isinstance(state, State) else state
+        self._mark_dirty(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._get_record(key)
+        return record['state']
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        record = await self._get_record(key)
+        record['data'] = copy.deepcopy(dict(data))
+        self._mark_dirty(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self._get_record(key)
+        return copy.deepcopy(record['data'])
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        record = await self._get_record(key)
+        record['data'].update(copy.deepcopy(dict(data)))
+        self._mark_dirty(key)
+        return copy.deepcopy(record['data'])
+
+    async def close(self) -> None:
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+
+    # ========== КЭШ И ЗАПИСЬ ==========
+
+    @staticmethod
+    def _make_key(key: StorageKey) -> str:
+        return ':'.join(str(part) for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id,
+            getattr(key, 'business_connection_id', None), key.destiny
+        ))
+
+    async def _get_record(self, key: StorageKey) -> dict:
+        """Запись из кэша, при промахе - из базы"""
+        storage_key = self._make_key(key)
+        record = self._cache.get(storage_key)
+
+        if record is None:
+            row = await self.db.fetchone(
+                "SELECT state, data, expires_at FROM fsm_storage WHERE key = ?",
+                (storage_key,)
+            )
+            loaded = self._empty_record()
+            if row and row['expires_at'] > time.time():
+                try:
+                    loaded = {
+                        'state': row['state'],
+                        'data': unpack_data(row['data']),
+                        'expires_at': row['expires_at']
+                    }
+                except Exception as e:
+                    logger.error(f"❌ Ошибка чтения состояния {storage_key}: {e}")
+
+            # Пока шла загрузка, запись могла появиться в кэше
+            record = self._cache.setdefault(storage_key, loaded)
+        elif record['expires_at'] <= time.time():
+            record.update(self._empty_record())
+
+        self._cache.move_to_end(storage_key)
+        self._evict()
+        return record
+
+    def _empty_record(self) -> dict:
+        return {'state': None, 'data': {}, 'expires_at': time.time() + self.ttl}
+
+    def _evict(self):
+        """Вытеснение давно не использованных записей, уже сохраненных в базе"""
+        if len(self._cache) <= self.max_cached:
+            return
+
+        for storage_key in list(self._cache):
+            if len(self._cache) <= self.max_cached:
+                break
+            if storage_key not in self._dirty:
+                del self._cache[storage_key]
+
+    def _mark_dirty(self, key: StorageKey):
+        storage_key = self._make_key(key)
+        self._cache[storage_key]['expires_at'] = time.time() + self.ttl
+        self._dirty.add(storage_key)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        """Запись накопленных изменений в базу"""
+        now = time.time()
+        upserts = []
+        deletes = []
+
+        dirty, self._dirty = self._dirty, set()
+        for storage_key in dirty:
+            record = self._cache.get(storage_key)
+            if record is None:
+                continue
+            if record['state'] is None and not record['data']:
+                deletes.append((storage_key,))
+            else:
+                upserts.append((storage_key, record['state'], pack_data(record['data']), record['expires_at']))
+
+        sweep = now - self._last_sweep >= self.sweep_interval
+        if sweep:
+            self._last_sweep = now
+
+        if not upserts and not deletes and not sweep:
+            return
+
+        def write(cursor):
+            if upserts:
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO fsm_storage (key, state, data, expires_at) VALUES (?, ?, ?, ?)",
+                    upserts
+                )
+            if deletes:
+                cursor.executemany("DELETE FROM fsm_storage WHERE key = ?", deletes)
+            if sweep:
+                cursor.execute("DELETE FROM fsm_storage WHERE expires_at <= ?", (now,))
+
+        try:
+            await self.db.write(write, 'fsm_flush')
+        except Exception as e:
+            logger.error(f"❌ Ошибка сохранения состояний FSM: {e}")
+            # Повторим запись при следующем сбросе
+            self._dirty.update(dirty)
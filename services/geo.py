@@ -0,0 +1,229 @@
+import difflib
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Кольца расширения поиска вокруг города пользователя, км
+RINGS_KM = (50, 150, 400)
+
+# Справочник городов: каноническое название -> (широта, долгота)
+CITIES: Dict[str, Tuple[float, float]] = {
+    # Казахстан
+    'Алматы': (43.238, 76.946),
+    'Астана': (51.169, 71.449),
+    'Шымкент': (42.317, 69.596),
+    'Караганда': (49.806, 73.085),
+    'Актобе': (50.283, 57.167),
+    'Тараз': (42.900, 71.367),
+    'Павлодар': (52.287, 76.967),
+    'Усть-Каменогорск': (49.948, 82.628),
+    'Семей': (50.411, 80.227),
+    'Атырау': (47.117, 51.883),
+    'Костанай': (53.214, 63.624),
+    'Кызылорда': (44.853, 65.509),
+    'Уральск': (51.233, 51.367),
+    'Петропавловск': (54.867, 69.150),
+    'Актау': (43.650, 51.160),
+    'Талдыкорган': (45.017, 78.383),
+    'Туркестан': (43.297, 68.251),
+    'Кокшетау': (53.283, 69.383),
+    'Экибастуз': (51.723, 75.323),
+    'Темиртау': (50.054, 72.965),
+    'Жезказган': (47.783, 67.767),
+    'Конаев': (43.867, 77.067),
+    'Каскелен': (43.200, 76.620),
+    'Талгар': (43.300, 77.233),
+    'Есик': (43.357, 77.452),
+    # Россия
+    'Москва': (55.756, 37.617),
+    'Санкт-Петербург': (59.939, 30.316),
+    'Новосибирск': (55.030, 82.920),
+    'Екатеринбург': (56.838, 60.597),
+    'Казань': (55.796, 49.106),
+    'Нижний Новгород': (56.327, 44.006),
+    'Челябинск': (55.160, 61.403),
+    'Самара': (53.195, 50.101),
+    'Омск': (54.989, 73.368),
+    'Ростов-на-Дону': (47.222, 39.720),
+    'Уфа': (54.735, 55.958),
+    'Красноярск': (56.010, 92.852),
+    'Пермь': (58.010, 56.229),
+    'Воронеж': (51.661, 39.200),
+    'Волгоград': (48.708, 44.513),
+    'Краснодар': (45.035, 38.975),
+    'Саратов': (51.533, 46.034),
+    'Тюмень': (57.153, 65.534),
+    'Оренбург': (51.768, 55.097),
+    'Барнаул': (53.348, 83.779),
+    'Томск': (56.484, 84.948),
+    'Кемерово': (55.355, 86.087),
+    'Иркутск': (52.287, 104.305),
+    'Владивосток': (43.116, 131.882),
+    'Хабаровск': (48.480, 135.072),
+    'Сочи': (43.585, 39.723),
+    'Калининград': (54.710, 20.511),
+    'Астрахань': (46.350, 48.040),
+    'Тверь': (56.859, 35.912),
+    'Ярославль': (57.626, 39.894),
+    'Тула': (54.193, 37.617),
+    'Рязань': (54.630, 39.742),
+    'Подольск': (55.431, 37.545),
+    'Химки': (55.889, 37.445),
+    'Балашиха': (55.796, 37.938),
+    # Средняя Азия и другие
+    'Ташкент': (41.311, 69.280),
+    'Самарканд': (39.655, 66.976),
+    'Бухара': (39.768, 64.455),
+    'Бишкек': (42.875, 74.590),
+    'Ош': (40.513, 72.816),
+    'Минск': (53.902, 27.562),
+    'Киев': (50.450, 30.523),
+}
+
+# Сокращения, старые и иностранные названия -> каноническое название
+CITY_ALIASES = {
+    'Алма-Ата': 'Алматы',
+    'Нур-Султан': 'Астана',
+    'Целиноград': 'Астана',
+    'Акмола': 'Астана',
+    'Чимкент': 'Шымкент',
+    'Актюбинск': 'Актобе',
+    'Джамбул': 'Тараз',
+    'Жамбыл': 'Тараз',
+    'Оскемен': 'Усть-Каменогорск',
+    'Усть-Ка': 'Усть-Каменогорск',
+    'Семипалатинск': 'Семей',
+    'Гурьев': 'Атырау',
+    'Кустанай': 'Костанай',
+    'Кзыл-Орда': 'Кызылорда',
+    'Орал': 'Уральск',
+    'Шевченко': 'Актау',
+    'Кокчетав': 'Кокшетау',
+    'Капчагай': 'Конаев',
+    'Иссык': 'Есик',
+    'МСК': 'Москва',
+    'Moscow': 'Москва',
+    'СПБ': 'Санкт-Петербург',
+    'Питер': 'Санкт-Петербург',
+    'Петербург': 'Санкт-Петербург',
+    'Ленинград': 'Санкт-Петербург',
+    'Saint Petersburg': 'Санкт-Петербург',
+    'St Petersburg': 'Санкт-Петербург',
+    'НСК': 'Новосибирск',
+    'ЕКБ': 'Екатеринбург',
+    'Екат': 'Екатеринбург',
+    'Свердловск': 'Екатеринбург',
+    'Нижний': 'Нижний Новгород',
+    'Горький': 'Нижний Новгород',
+    'Ростов': 'Ростов-на-Дону',
+    'Фрунзе': 'Бишкек',
+    'Tashkent': 'Ташкент',
+    'Kyiv': 'Киев',
+    'Київ': 'Киев',
+}
+
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+    # казахские и украинские буквы
+    'ә': 'a', 'ғ': 'g', 'қ': 'k', 'ң': 'n', 'ө': 'o', 'ұ': 'u', 'ү': 'u',
+    'һ': 'h', 'і': 'i', 'ї': 'i', 'є': 'e',
+})
+
+_PREFIX_PATTERN = re.compile(r'^(г|гор|город)\.?\s+')
+_NON_ALNUM_PATTERN = re.compile(r'[^a-z0-9]')
+
+# Минимальная длина ключа для исправления опечаток
+_FUZZY_MIN_LENGTH = 4
+_FUZZY_CUTOFF = 0.85
+
+
+def fold_city(text: str) -> str:
+    """Ключ сравнения названий: регистр, префикс «г.», транслит, без пробелов и дефисов
+
+    «г. Алма-Ата», «алма ата» и «Alma-Ata» дают один и тот же ключ.
+    """
+    text = _PREFIX_PATTERN.sub('', text.strip().lower())
+    text = text.translate(_TRANSLIT).replace('kh', 'h').replace('iy', 'y')
+    return _NON_ALNUM_PATTERN.sub('', text)
+
+
+def _build_lookup() -> Dict[str, str]:
+    lookup = {fold_city(city): city for city in CITIES}
+    for alias, city in CITY_ALIASES.items():
+        lookup.setdefault(fold_city(alias), city)
+    return lookup
+
+
+_LOOKUP = _build_lookup()
+
+
+def lookup_city(text: str, fuzzy: bool = True) -> Optional[str]:
+    """Каноническое название города из справочника или None
+
+    Сначала точное совпадение ключа (с учетом сокращений и транслита),
+    затем, если fuzzy, ближайший ключ для исправления опечаток.
+    """
+    key = fold_city(text)
+    city = _LOOKUP.get(key)
+    if city is None and fuzzy and len(key) >= _FUZZY_MIN_LENGTH:
+        matches = difflib.get_close_matches(key, _LOOKUP.keys(), n=1, cutoff=_FUZZY_CUTOFF)
+        if matches:
+            city = _LOOKUP[matches[0]]
+    return city
+
+
+def normalize_city(text: str) -> str:
+    """Каноническое название города для нового ввода
+
+    Город из справочника (с исправлением опечаток, см. lookup_city).
+    Незнакомый город возвращается как есть, с заглавными буквами.
+    """
+    return lookup_city(text) or ' '.join(text.split()).title()
+
+
+def distance_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """Расстояние между точками (широта, долгота) по большому кругу"""
+    lat1, lon1 = map(math.radians, a)
+    lat2, lon2 = map(math.radians, b)
+    h = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * 6371.0 * math.asin(math.sqrt(h))
+
+
+def _build_nearest() -> Dict[str, List[Tuple[float, str]]]:
+    """Для каждого города - остальные города в пределах последнего кольца по возрастанию расстояния"""
+    nearest = {}
+    for city, point in CITIES.items():
+        distances = (
+            (distance_km(point, other_point), other)
+            for other, other_point in CITIES.items() if other != city
+        )
+        nearest[city] = sorted(item for item in distances if item[0] <= RINGS_KM[-1])
+    return nearest
+
+
+_NEAREST = _build_nearest()
+
+
+def city_rings(city: str) -> List[Tuple[str, ...]]:
+    """Соседние города по кольцам RINGS_KM (для незнакомого города - пусто)
+
+    Пустые кольца пропускаются, каждый город попадает только в ближайшее кольцо.
+    """
+    nearest = _NEAREST.get(city)
+    if not nearest:
+        return []
+
+    rings = []
+    inner = 0.0
+    for radius in RINGS_KM:
+        ring = tuple(other for distance, other in nearest if inner < distance <= radius)
+        if ring:
+            rings.append(ring)
+        inner = radius
+    return rings
+
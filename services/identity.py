@@ -0,0 +1,76 @@
+import threading
+from array import array
+from typing import Optional
+
+
+class IdentityMap:
+    """Соответствие telegram_id ↔ user_id ↔ profile_id в памяти
+
+    user_id и profile_id - плотные автоинкрементные ключи, поэтому обратные
+    связи хранятся в массивах с индексом по id (8 байт на запись), и только
+    telegram_id -> user_id - в словаре. Ноль в массиве - «неизвестно».
+    Неизвестные telegram_id не запоминаются: пользователь может появиться
+    в любой момент.
+
+    Связи не меняются, пока анкету не удалят, поэтому кэш заполняется
+    при первом обращении, а также в add_user и create_profile и
+    сбрасывается только в delete_profile.
+    """
+
+    def __init__(self):
+        self._user_by_telegram = {}
+        self._telegram_by_user = array('q')
+        self._profile_by_user = array('q')
+        self._user_by_profile = array('q')
+        self._lock = threading.Lock()
+
+    # ========== ЧТЕНИЕ ==========
+
+    def user_id(self, telegram_id: int) -> Optional[int]:
+        return self._user_by_telegram.get(telegram_id)
+
+    def telegram_id(self, user_id: int) -> Optional[int]:
+        return self._get(self._telegram_by_user, user_id) or None
+
+    def profile_id(self, user_id: int) -> Optional[int]:
+        return self._get(self._profile_by_user, user_id) or None
+
+    def user_id_by_profile(self, profile_id: int) -> Optional[int]:
+        return self._get(self._user_by_profile, profile_id) or None
+
+    # ========== ЗАПОЛНЕНИЕ И СБРОС ==========
+
+    def remember_user(self, telegram_id: int, user_id: int):
+        with self._lock:
+            self._user_by_telegram[telegram_id] = user_id
+            self._set(self._telegram_by_user, user_id, telegram_id)
+
+    def remember_profile(self, user_id: int, profile_id: int):
+        with self._lock:
+            self._set(self._profile_by_user, user_id, profile_id)
+            self._set(self._user_by_profile, profile_id, user_id)
+
+    def forget_profile(self, user_id: int):
+        """Сброс анкеты пользователя (после удаления)"""
+        with self._lock:
+            profile_id = self._get(self._profile_by_user, user_id)
+            if profile_id:
+                self._set(self._user_by_profile, profile_id, 0)
+            self._set(self._profile_by_user, user_id, 0)
+
+    def clear(self):
+        with self._lock:
+            self._user_by_telegram.clear()
+            for values in (self._telegram_by_user, self._profile_by_user, self._user_by_profile):
+                del values[:]
+
+    @staticmethod
+    def _get(values: array, index: int) -> int:
+        return values[index] if 0 <= index < len(values) else 0
+
+    @staticmethod
+    def _set(values: array, index: int, value: int):
+        if index >= len(values):
+            # Рост с запасом, чтобы не расширять массив на каждый новый id
+            values.frombytes(bytes(values.itemsize * max(index + 1 - len(values), len(values) // 2, 1024)))
+        values[index] = value
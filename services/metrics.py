@@ -0,0 +1,198 @@
+import argparse
+import sqlite3
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Колонки daily_metrics: события за час
+METRICS = ('users', 'profiles', 'likes', 'dislikes', 'views', 'sales', 'revenue')
+
+# Источник каждой колонки: (таблица, условие, прибавляемое значение)
+SOURCES = {
+    'users': ('users', None, '1'),
+    'profiles': ('profiles', None, '1'),
+    'likes': ('likes', "{row}like_type = 'like'", '1'),
+    'dislikes': ('likes', "{row}like_type = 'dislike'", '1'),
+    'views': ('views', None, '1'),
+    'sales': ('star_payments', "{row}status = 'completed'", '1'),
+    'revenue': ('star_payments', "{row}status = 'completed'", '{row}stars_amount'),
+}
+
+# Оценки еще нет в likes (не повтор через INSERT OR REPLACE)
+NEW_LIKE_SQL = (
+    "NOT EXISTS (SELECT 1 FROM likes WHERE from_user_id = NEW.from_user_id "
+    "AND to_profile_id = NEW.to_profile_id AND like_type = NEW.like_type)"
+)
+
+
+def hour_sql(row: str = '') -> str:
+    """Начало часа записи: created_at бывает текстом CURRENT_TIMESTAMP (UTC) или числом"""
+    return (
+        f"(COALESCE(CASE WHEN typeof({row}created_at) = 'text' "
+        f"THEN CAST(strftime('%s', {row}created_at) AS INTEGER) "
+        f"ELSE CAST({row}created_at AS INTEGER) END, "
+        f"CAST(strftime('%s', 'now') AS INTEGER)) / 3600 * 3600)"
+    )
+
+
+def _upsert_sql(column: str, amount: str) -> str:
+    return (
+        f"INSERT INTO daily_metrics (hour_ts, {column}) VALUES ({hour_sql('NEW.')}, {amount}) "
+        f"ON CONFLICT (hour_ts) DO UPDATE SET {column} = {column} + excluded.{column};"
+    )
+
+
+def hour_start(moment: datetime) -> int:
+    """Ключ hour_ts часа UTC, в который попадает moment
+
+    Счетчики почасовые, поэтому граница диапазона внутри часа (полночь
+    в поясе со смещением не на целый час, например UTC+5:30) сдвигается
+    к началу этого часа: час целиком относится к интервалу, в котором
+    он начинается.
+    """
+    return int(moment.timestamp()) // 3600 * 3600
+
+
+def _trigger_sql(name: str, event: str, table: str, when: Optional[str], columns: List[str],
+                 timing: str = 'AFTER') -> str:
+    body = '\n'.join(
+        _upsert_sql(column, SOURCES[column][2].format(row='NEW.')) for column in columns
+    )
+    when_sql = f"WHEN {when}" if when else ""
+    return f'''
+        CREATE TRIGGER IF NOT EXISTS {name} {timing} {event} ON {table} {when_sql}
+        BEGIN
+            {body}
+        END
+    '''
+
+
+def create_schema(connection: sqlite3.Connection):
+    """Таблица daily_metrics и триггеры, которые ее обновляют
+
+    Счетчики считают события (регистрации, лайки, просмотры, оплаты)
+    по часам в UTC. Удаление исходных записей счетчики не уменьшает.
+
+    Лайки считаются триггером BEFORE INSERT: повторная оценка той же анкеты
+    с тем же типом (INSERT OR REPLACE в Database.add_like) уже есть в likes
+    и событием не считается. Смена лайка на дизлайк и обратно - считается.
+    """
+    columns = ',\n'.join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in METRICS)
+    connection.execute(f'''
+        CREATE TABLE IF NOT EXISTS daily_metrics (
+            hour_ts INTEGER PRIMARY KEY,
+            {columns}
+        ) WITHOUT ROWID
+    ''')
+
+    triggers = [
+        _trigger_sql('trg_metrics_users', 'INSERT', 'users', None, ['users']),
+        _trigger_sql('trg_metrics_profiles', 'INSERT', 'profiles', None, ['profiles']),
+        _trigger_sql('trg_metrics_likes', 'INSERT', 'likes',
+                     f"NEW.like_type = 'like' AND {NEW_LIKE_SQL}", ['likes'], timing='BEFORE'),
+        _trigger_sql('trg_metrics_dislikes', 'INSERT', 'likes',
+                     f"NEW.like_type = 'dislike' AND {NEW_LIKE_SQL}", ['dislikes'], timing='BEFORE'),
+        _trigger_sql('trg_metrics_views', 'INSERT', 'views', None, ['views']),
+        _trigger_sql('trg_metrics_sales', 'INSERT', 'star_payments',
+                     "NEW.status = 'completed'", ['sales', 'revenue']),
+        _trigger_sql('trg_metrics_sales_update', 'UPDATE OF status', 'star_payments',
+                     "NEW.status = 'completed' AND OLD.status IS NOT 'completed'", ['sales', 'revenue']),
+    ]
+    for trigger in triggers:
+        connection.execute(trigger)
+
+
+def recreate_like_triggers(connection: sqlite3.Connection):
+    """Пересоздание триггеров лайков и дизлайков (см. create_schema)"""
+    connection.execute("DROP TRIGGER IF EXISTS trg_metrics_likes")
+    connection.execute("DROP TRIGGER IF EXISTS trg_metrics_dislikes")
+    create_schema(connection)
+
+
+def backfill(connection: sqlite3.Connection):
+    """Пересчет daily_metrics по исходным таблицам
+
+    Выполняется в транзакции BEGIN IMMEDIATE (если она еще не открыта),
+    поэтому новые события не теряются и не учитываются дважды.
+    """
+    selects = []
+    for column in METRICS:
+        table, condition, amount = SOURCES[column]
+        values = ', '.join(
+            (amount.format(row='') if other == column else '0') + f" AS {other}"
+            for other in METRICS
+        )
+        where = f"WHERE {condition.format(row='')}" if condition else ""
+        selects.append(f"SELECT {hour_sql()} AS hour_ts, {values} FROM {table} {where}")
+
+    sums = ', '.join(f"SUM({column})" for column in METRICS)
+    query = f'''
+        INSERT INTO daily_metrics (hour_ts, {', '.join(METRICS)})
+        SELECT hour_ts, {sums} FROM ({' UNION ALL '.join(selects)})
+        GROUP BY hour_ts
+    '''
+
+    own_transaction = not connection.in_transaction
+    if own_transaction:
+        connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.execute("DELETE FROM daily_metrics")
+        connection.execute(query)
+        if own_transaction:
+            connection.execute("COMMIT")
+    except Exception:
+        if own_transaction:
+            connection.execute("ROLLBACK")
+        raise
+
+
+async def get_totals(db, names: List[str] = METRICS, start: Optional[datetime] = None,
+                     end: Optional[datetime] = None) -> Dict[str, int]:
+    """Суммы счетчиков за [start, end), по умолчанию - за все время"""
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append("hour_ts >= ?")
+        params.append(hour_start(start))
+    if end is not None:
+        conditions.append("hour_ts < ?")
+        params.append(hour_start(end))
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    sums = ', '.join(f"COALESCE(SUM({name}), 0)" for name in names)
+    row = await db.fetchone(f"SELECT {sums} FROM daily_metrics {where}", params)
+    return {name: row[index] if row else 0 for index, name in enumerate(names)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Счетчики daily_metrics")
+    parser.add_argument('--db', default='dating_bot.db', help="Файл базы данных")
+    parser.add_argument('--backfill', action='store_true',
+                        help="Пересчитать счетчики по исходным таблицам")
+    args = parser.parse_args(argv)
+
+    # Импортируем здесь, чтобы избежать циклического импорта
+    from models import Database
+
+    db = Database(args.db)
+    try:
+        if args.backfill:
+            connection = db.manager.open_connection()
+            connection.isolation_level = None
+            backfill(connection)
+            connection.close()
+            print("✅ Счетчики daily_metrics пересчитаны")
+
+        row = db.cursor.execute(
+            f"SELECT COUNT(*), {', '.join(f'COALESCE(SUM({name}), 0)' for name in METRICS)} FROM daily_metrics"
+        ).fetchone()
+        print(f"📊 Часов с данными: {row[0]}")
+        for index, name in enumerate(METRICS, start=1):
+            print(f"  {name}: {row[index]}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
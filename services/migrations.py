@@ -0,0 +1,289 @@
+import argparse
+import ast
+import os
+import re
+import sqlite3
+import sys
+
+
+def _create_daily_metrics(connection: sqlite3.Connection):
+    # Импортируем здесь, чтобы избежать циклического импорта
+    from services.metrics import backfill, create_schema
+
+    create_schema(connection)
+    backfill(connection)
+
+
+def _normalize_cities(connection: sqlite3.Connection):
+    # Импортируем здесь, чтобы избежать циклического импорта
+    from services.geo import lookup_city
+
+    # Только точные совпадения со справочником и сокращениями (без учета
+    # регистра и написания). Исправление опечаток - только для нового ввода:
+    # похожий по написанию маленький город нельзя молча заменить другим
+    cities = [row[0] for row in connection.execute("SELECT DISTINCT city FROM profiles")]
+    for city in cities:
+        normalized = lookup_city(city, fuzzy=False) if city else None
+        if normalized and normalized != city:
+            updated = connection.execute(
+                "UPDATE profiles SET city = ? WHERE city = ?", (normalized, city)
+            ).rowcount
+            print(f"🏙️ Город анкет: {city!r} -> {normalized!r} ({updated} анкет)")
+
+
+def _create_referral_counters(connection: sqlite3.Connection):
+    # Импортируем здесь, чтобы избежать циклического импорта
+    from services.referral_counters import create_schema, rebuild
+
+    create_schema(connection)
+    rebuild(connection)
+
+
+def _recreate_like_metrics_triggers(connection: sqlite3.Connection):
+    # Импортируем здесь, чтобы избежать циклического импорта
+    from services.metrics import recreate_like_triggers
+
+    recreate_like_triggers(connection)
+
+
+# Каждая миграция - список SQL-запросов или функция, принимающая соединение.
+# Номер миграции = позиция в списке (с 1), применяется один раз
+# и сохраняется в PRAGMA user_version.
+MIGRATIONS = [
+    # 1: индексы под основные сценарии выборок
+    [
+        "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_profiles_user_id ON profiles (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_profiles_search "
+        "ON profiles (is_active, gender, looking_for, city, age)",
+        "CREATE INDEX IF NOT EXISTS idx_profiles_created_at ON profiles (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_photos_profile_id ON photos (profile_id, position)",
+        "CREATE INDEX IF NOT EXISTS idx_likes_to_profile_id ON likes (to_profile_id, from_user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_likes_created_at ON likes (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_likes_type ON likes (like_type, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_views_viewed_profile_id ON views (viewed_profile_id)",
+        "CREATE INDEX IF NOT EXISTS idx_views_created_at ON views (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_bot_profiles_profile_id ON bot_profiles (profile_id, is_active)",
+        "CREATE INDEX IF NOT EXISTS idx_premium_user_id "
+        "ON premium_subscriptions (user_id, is_active, expires_at)",
+        "CREATE INDEX IF NOT EXISTS idx_referrals_referrer_id ON referrals (referrer_id)",
+        "CREATE INDEX IF NOT EXISTS idx_referral_codes_user_id ON referral_codes (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_affiliate_payouts_affiliate_id "
+        "ON affiliate_payouts (affiliate_id, status)",
+        "CREATE INDEX IF NOT EXISTS idx_reports_status ON reports (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_star_payments_status ON star_payments (status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_star_payments_user_id ON star_payments (user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts (status)",
+        "ANALYZE",
+    ],
+    # 2: хранилище состояний FSM (services.fsm_storage)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS fsm_storage (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data BLOB,
+            expires_at REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_fsm_storage_expires_at ON fsm_storage (expires_at)",
+    ],
+    # 3: доставка рассылок по получателям (services.broadcast)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+            broadcast_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (broadcast_id, user_id)
+        ) WITHOUT ROWID
+        ''',
+        "ALTER TABLE broadcasts ADD COLUMN media_type TEXT",
+        "ALTER TABLE broadcasts ADD COLUMN media_file_id TEXT",
+        "ALTER TABLE broadcasts ADD COLUMN failed_count INTEGER DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN is_blocked INTEGER DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN blocked_at TIMESTAMP",
+    ],
+    # 4: почасовые счетчики для админ-статистики (services.metrics)
+    _create_daily_metrics,
+    # 5: битовая маска интересов анкеты (services.scoring)
+    [
+        "ALTER TABLE profiles ADD COLUMN interests_mask INTEGER NOT NULL DEFAULT 0",
+        '''
+        UPDATE profiles SET interests_mask = COALESCE((
+            SELECT SUM(1 << (pi.interest_id - 1)) FROM profile_interests pi
+            WHERE pi.profile_id = profiles.id AND pi.interest_id BETWEEN 1 AND 63
+        ), 0)
+        ''',
+    ],
+    # 6: названия городов анкет по справочнику (services.geo)
+    _normalize_cities,
+    # 7: битовые карты просмотренных анкет (services.seen_set)
+    [
+        '''
+        CREATE TABLE IF NOT EXISTS seen_sets (
+            user_id INTEGER PRIMARY KEY,
+            bitmap BLOB NOT NULL,
+            view_id INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ],
+    # 8: один платеж Telegram - одна запись star_payments
+    [
+        # Повторы до появления индекса оставляем только у первой записи
+        '''
+        UPDATE star_payments SET telegram_payment_charge_id = NULL
+        WHERE telegram_payment_charge_id IS NOT NULL AND id NOT IN (
+            SELECT MIN(id) FROM star_payments
+            WHERE telegram_payment_charge_id IS NOT NULL
+            GROUP BY telegram_payment_charge_id
+        )
+        ''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_star_payments_charge_id "
+        "ON star_payments (telegram_payment_charge_id)",
+    ],
+    # 9: счетчики рефералов (services.referral_counters)
+    _create_referral_counters,
+    # 10: повторный лайк через INSERT OR REPLACE не считается в daily_metrics
+    _recreate_like_metrics_triggers,
+    # 11: подбор кандидатов читает (id, age, interests_mask) только из индекса
+    [
+        "CREATE INDEX IF NOT EXISTS idx_profiles_candidates "
+        "ON profiles (is_active, gender, looking_for, city, age, interests_mask, user_id)",
+        "DROP INDEX IF EXISTS idx_profiles_search",
+    ],
+]
+
+# Файлы, SQL-запросы из которых проверяются в режиме --check
+CHECKED_FILES = ['models.py', os.path.join('handlers', 'admin.py')]
+
+SQL_PATTERN = re.compile(r'^(SELECT|UPDATE|DELETE|WITH)\s', re.IGNORECASE)
+
+
+def get_schema_version(connection: sqlite3.Connection) -> int:
+    """Текущая версия схемы"""
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(connection: sqlite3.Connection) -> int:
+    """Применение недостающих миграций, возвращает версию схемы
+
+    Каждая миграция выполняется в своей транзакции. При ошибке миграция
+    откатывается, а исключение пробрасывается дальше: бот не должен
+    запускаться на частично обновленной схеме.
+    """
+    version = get_schema_version(connection)
+
+    for number, migration in enumerate(MIGRATIONS, start=1):
+        if number <= version:
+            continue
+
+        try:
+            if connection.in_transaction:
+                connection.commit()
+            connection.execute("BEGIN")
+
+            if callable(migration):
+                migration(connection)
+            else:
+                for statement in migration:
+                    connection.execute(statement)
+
+            connection.execute(f"PRAGMA user_version = {number}")
+            connection.commit()
+            version = number
+        except Exception as e:
+            connection.rollback()
+            print(f"❌ Ошибка применения миграции {number}: {e}")
+            raise
+
+    return version
+
+
+# ========== ПРОВЕРКА ПЛАНОВ ЗАПРОСОВ ==========
+
+def extract_queries(path: str) -> list:
+    """Извлечение SQL-запросов из исходного файла: [(строка, запрос)]"""
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+
+    queries = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Constant) or not isinstance(node.value, str):
+            continue
+
+        query = node.value.strip()
+        if not SQL_PATTERN.match(query):
+            continue
+
+        # Шаблоны для .format() подставляют списки плейсхолдеров
+        queries.append((node.lineno, query.replace('{}', '?')))
+
+    return sorted(queries)
+
+
+def explain_query(connection: sqlite3.Connection, query: str) -> list:
+    """План запроса (EXPLAIN QUERY PLAN) с пустыми параметрами"""
+    params = [None] * query.count('?')
+    rows = connection.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+    return [row[3] for row in rows]
+
+
+def is_full_scan(detail: str) -> bool:
+    """Полный проход по таблице без индекса"""
+    return detail.startswith('SCAN ') and ' USING ' not in detail and 'CONSTANT ROW' not in detail
+
+
+def check_query_plans(connection: sqlite3.Connection, root_dir: str = '.') -> int:
+    """Отчет по запросам, которые все еще читают таблицы целиком"""
+    full_scans = 0
+    skipped = 0
+    total = 0
+
+    for rel_path in CHECKED_FILES:
+        path = os.path.join(root_dir, rel_path)
+        for lineno, query in extract_queries(path):
+            total += 1
+            try:
+                plan = explain_query(connection, query)
+            except sqlite3.Error as e:
+                skipped += 1
+                print(f"⚠️ {rel_path}:{lineno}: запрос не разобран ({e})")
+                continue
+
+            scans = [detail for detail in plan if is_full_scan(detail)]
+            if scans:
+                full_scans += 1
+                short_query = re.sub(r'\s+', ' ', query)[:120]
+                print(f"❌ {rel_path}:{lineno}: {short_query}")
+                for detail in scans:
+                    print(f"      {detail}")
+
+    print(f"\nПроверено запросов: {total}, с полным сканированием: {full_scans}, пропущено: {skipped}")
+    return full_scans
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Миграции схемы базы данных")
+    parser.add_argument('--db', default='dating_bot.db', help="путь к базе данных")
+    parser.add_argument('--check', action='store_true',
+                        help="проверить планы запросов из models.py и handlers/admin.py")
+    args = parser.parse_args(argv)
+
+    # Импортируем здесь, чтобы избежать циклического импорта
+    from models import Database
+
+    db = Database(args.db)
+    print(f"Версия схемы: {get_schema_version(db.connection)} из {len(MIGRATIONS)}")
+
+    if args.check:
+        root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return 1 if check_query_plans(db.connection, root_dir) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Optional
+
+from services.async_db import get_db
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilePrefetcher:
+    """Заранее подобранные анкеты для просмотра
+
+    Пока пользователь смотрит анкету N, в фоне подбираются и загружаются
+    (с фото и интересами) следующие depth анкет. Обработчик реакции берет
+    готовую анкету без ожидания подбора. Перед выдачей анкета проверяется
+    одним запросом: скрытая или удаленная за это время пропускается.
+    """
+
+    def __init__(self, db, depth: int = 1, max_users: int = 10000):
+        self.db = db
+        self.depth = depth
+        self.max_users = max_users
+        self._queues = OrderedDict()
+
+    def schedule(self, user_id: int):
+        """Запуск подбора следующих анкет пользователя в фоне"""
+        queue = self._queues.get(user_id)
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+        self._queues.move_to_end(user_id)
+
+        while len(queue) < self.depth:
+            queue.append(asyncio.create_task(self.db.get_next_profile(user_id)))
+
+        while len(self._queues) > self.max_users:
+            _, evicted = self._queues.popitem(last=False)
+            self._cancel(evicted)
+
+    async def next_profile(self, user_id: int) -> Optional[dict]:
+        """Следующая анкета: заранее подобранная или подобранная сейчас"""
+        queue = self._queues.get(user_id)
+        while queue:
+            task = queue.popleft()
+            try:
+                profile = await task
+            except asyncio.CancelledError:
+                continue
+            except Exception as e:
+                logger.error(f"❌ Ошибка предзагрузки анкеты: {e}")
+                continue
+
+            # Пустой результат мог устареть - новые анкеты появляются постоянно
+            if profile and await self.db.is_profile_active(profile['id']):
+                return profile
+
+        return await self.db.get_next_profile(user_id)
+
+    def discard(self, user_id: int):
+        """Сброс подобранных анкет пользователя (например, при смене критериев)"""
+        queue = self._queues.pop(user_id, None)
+        if queue:
+            self._cancel(queue)
+
+    @staticmethod
+    def _cancel(queue: deque):
+        for task in queue:
+            task.cancel()
+
+
+_shared_prefetcher = None
+
+
+def get_prefetcher() -> ProfilePrefetcher:
+    """Общий экземпляр ProfilePrefetcher"""
+    global _shared_prefetcher
+    if _shared_prefetcher is None:
+        _shared_prefetcher = ProfilePrefetcher(get_db())
+    return _shared_prefetcher
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_sweeper_task = None
+
+
+class PremiumCache:
+    """Кэш премиум статуса пользователей
+
+    Для пользователя хранится его активная подписка (или ее отсутствие) и
+    срок, до которого ответ верен: для подписки - ее expires_at, для
+    отсутствия подписки - negative_ttl секунд (подписку может оформить
+    другой процесс). До этого срока проверки не обращаются к базе.
+
+    Как и в ProfileCache, читатель запоминает generation() до запроса,
+    а put() с устаревшим поколением ничего не сохраняет.
+    """
+
+    def __init__(self, max_size: int = 50000, negative_ttl: float = 300):
+        self.max_size = max_size
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self) -> int:
+        """Текущее поколение кэша (меняется при каждом изменении подписок)"""
+        return self._generation
+
+    def get(self, user_id: int) -> Tuple[bool, Optional[dict]]:
+        """(найдено, копия подписки или None)"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return True, dict(entry[1]) if entry[1] else None
+
+    def put(self, user_id: int, status: Optional[dict], generation: int):
+        """Сохранение статуса, прочитанного в поколении generation"""
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._store(user_id, status)
+
+    def update(self, user_id: int, status: dict):
+        """Новая подписка: остается та, что действует дольше"""
+        with self._lock:
+            self._generation += 1
+            entry = self._entries.get(user_id)
+            if entry is None or not entry[1] or entry[1]['expires_at'] < status['expires_at']:
+                self._store(user_id, status)
+
+    def invalidate(self, user_id: int = None):
+        """Сброс статуса пользователя (без аргумента - всех)"""
+        with self._lock:
+            self._generation += 1
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def get_stats(self) -> dict:
+        """Счетчики попаданий и промахов"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def _store(self, user_id: int, status: Optional[dict]):
+        valid_until = status['expires_at'] if status else time.time() + self.negative_ttl
+        self._entries[user_id] = (valid_until, dict(status) if status else None)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+def expire_subscriptions(db) -> int:
+    """Снятие флага is_active с истекших подписок одним запросом
+
+    Возвращает число деактивированных подписок. Кэш сбрасывать не нужно:
+    записи в нем сами перестают действовать в момент expires_at.
+    """
+    return db._write(lambda cursor: cursor.execute(
+        "UPDATE premium_subscriptions SET is_active = 0 WHERE is_active = 1 AND expires_at <= ?",
+        (time.time(),)
+    ).rowcount)
+
+
+async def _sweeper_loop(db, interval: float):
+    while True:
+        try:
+            expired = await db.run(expire_subscriptions, db.db)
+            if expired:
+                logger.info(f"⏳ Деактивировано истекших подписок: {expired}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка деактивации подписок: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_expiry_sweeper(db, interval: float = 600) -> asyncio.Task:
+    """Периодическая деактивация истекших подписок в фоне (db - AsyncDatabase)"""
+    global _sweeper_task
+    if _sweeper_task is None or _sweeper_task.done():
+        _sweeper_task = asyncio.create_task(_sweeper_loop(db, interval))
+    return _sweeper_task
+
+
+def stop_expiry_sweeper():
+    """Остановка фоновой деактивации"""
+    global _sweeper_task
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+        _sweeper_task = None
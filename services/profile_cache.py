@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class ProfileCache:
+    """Кэш загруженных анкет (с фото и интересами)
+
+    Анкеты хранятся по profile_id, отдельный индекс связывает user_id
+    с profile_id. Размер ограничен max_size (вытесняются давно не
+    использованные), каждая запись живет не дольше ttl секунд. Методы
+    записи Database сбрасывают измененные анкеты.
+
+    Чтение из базы может закончиться после записи и ее сброса. Поэтому
+    читатель запоминает generation() до запроса, а put() с устаревшим
+    поколением ничего не сохраняет.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._profiles = OrderedDict()
+        self._by_user = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def generation(self) -> int:
+        """Текущее поколение кэша (меняется при каждом сбросе)"""
+        return self._generation
+
+    def get(self, profile_id: int) -> Optional[dict]:
+        """Копия анкеты из кэша или None"""
+        with self._lock:
+            return self._get(profile_id)
+
+    def get_by_user(self, user_id: int) -> Optional[dict]:
+        """Копия анкеты пользователя из кэша или None"""
+        # Индекс и сама анкета читаются под одной блокировкой, чтобы
+        # invalidate() не пришелся между ними
+        with self._lock:
+            profile_id = self._by_user.get(user_id)
+            if profile_id is None:
+                self.misses += 1
+                return None
+            return self._get(profile_id)
+
+    def put(self, profile: dict, generation: int):
+        """Сохранение анкеты, прочитанной в поколении generation"""
+        with self._lock:
+            if generation != self._generation:
+                return
+
+            self._profiles[profile['id']] = (time.monotonic() + self.ttl, self._copy(profile))
+            self._profiles.move_to_end(profile['id'])
+            self._by_user[profile['user_id']] = profile['id']
+
+            while len(self._profiles) > self.max_size:
+                profile_id = next(iter(self._profiles))
+                self._remove(profile_id)
+
+    def invalidate(self, profile_id: int = None, user_id: int = None):
+        """Сброс анкеты по profile_id и/или user_id"""
+        with self._lock:
+            self._generation += 1
+            if profile_id is None and user_id is not None:
+                profile_id = self._by_user.get(user_id)
+            if profile_id is not None:
+                self._remove(profile_id)
+            if user_id is not None:
+                self._by_user.pop(user_id, None)
+
+    def clear(self):
+        """Сброс всего кэша"""
+        with self._lock:
+            self._generation += 1
+            self._profiles.clear()
+            self._by_user.clear()
+
+    def get_stats(self) -> dict:
+        """Счетчики попаданий и промахов"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._profiles),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    def _get(self, profile_id: int) -> Optional[dict]:
+        """Чтение анкеты, вызывается под self._lock"""
+        entry = self._profiles.get(profile_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(profile_id)
+            self.misses += 1
+            return None
+
+        self._profiles.move_to_end(profile_id)
+        self.hits += 1
+        return self._copy(entry[1])
+
+    def _remove(self, profile_id: int):
+        entry = self._profiles.pop(profile_id, None)
+        if entry is not None and self._by_user.get(entry[1]['user_id']) == profile_id:
+            del self._by_user[entry[1]['user_id']]
+
+    @staticmethod
+    def _copy(profile: dict) -> dict:
+        # Обработчики могут менять списки фото и интересов у полученной анкеты
+        return dict(profile, photos=list(profile['photos']), interests=list(profile['interests']))
@@ -0,0 +1,155 @@
+import argparse
+import sqlite3
+import sys
+from typing import List, Tuple
+
+# Число выполнивших условие рефералов за одну награду
+REWARD_THRESHOLD = 10
+
+# Фактические значения счетчиков по исходным таблицам. rewarded_referrals
+# считается по выданным наградам: каждая покрывает REWARD_THRESHOLD рефералов
+ACTUAL_COUNTERS_SQL = f'''
+    WITH referred AS (
+        SELECT referrer_id AS user_id,
+               COUNT(*) AS total_referrals,
+               SUM(is_completed = 1) AS completed_referrals
+        FROM referrals
+        GROUP BY referrer_id
+    ), rewarded AS (
+        SELECT user_id, {REWARD_THRESHOLD} * COUNT(*) AS rewarded_referrals
+        FROM premium_subscriptions
+        WHERE payment_id = 'referral_reward'
+        GROUP BY user_id
+    )
+    SELECT referred.user_id, referred.total_referrals, referred.completed_referrals,
+           COALESCE(rewarded.rewarded_referrals, 0) AS rewarded_referrals
+    FROM referred LEFT JOIN rewarded ON rewarded.user_id = referred.user_id
+'''
+
+
+def create_schema(connection: sqlite3.Connection):
+    """Таблица referral_counters и триггеры, которые ее обновляют
+
+    Счетчики приглашенных и выполнивших условие рефералов меняются
+    триггерами на referrals в той же транзакции, что и сами рефералы.
+    rewarded_referrals увеличивает выдача награды (Database.claim_referral_reward).
+    """
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS referral_counters (
+            user_id INTEGER PRIMARY KEY,
+            total_referrals INTEGER NOT NULL DEFAULT 0,
+            completed_referrals INTEGER NOT NULL DEFAULT 0,
+            rewarded_referrals INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    triggers = [
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_referral_counters_insert AFTER INSERT ON referrals
+        BEGIN
+            INSERT INTO referral_counters (user_id, total_referrals, completed_referrals)
+            VALUES (NEW.referrer_id, 1, NEW.is_completed = 1)
+            ON CONFLICT (user_id) DO UPDATE SET
+                total_referrals = total_referrals + 1,
+                completed_referrals = completed_referrals + excluded.completed_referrals;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_referral_counters_complete AFTER UPDATE OF is_completed ON referrals
+        WHEN (NEW.is_completed = 1) != (OLD.is_completed = 1)
+        BEGIN
+            UPDATE referral_counters
+            SET completed_referrals = completed_referrals + (NEW.is_completed = 1) - (OLD.is_completed = 1)
+            WHERE user_id = NEW.referrer_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_referral_counters_delete AFTER DELETE ON referrals
+        BEGIN
+            UPDATE referral_counters
+            SET total_referrals = total_referrals - 1,
+                completed_referrals = completed_referrals - (OLD.is_completed = 1)
+            WHERE user_id = OLD.referrer_id;
+        END
+        ''',
+    ]
+    for trigger in triggers:
+        connection.execute(trigger)
+
+
+def rebuild(connection: sqlite3.Connection):
+    """Пересчет referral_counters по referrals и выданным наградам
+
+    Выполняется в транзакции BEGIN IMMEDIATE (если она еще не открыта),
+    поэтому новые рефералы не теряются и не учитываются дважды.
+    """
+    own_transaction = not connection.in_transaction
+    if own_transaction:
+        connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.execute("DELETE FROM referral_counters")
+        connection.execute(f'''
+            INSERT INTO referral_counters
+            (user_id, total_referrals, completed_referrals, rewarded_referrals)
+            {ACTUAL_COUNTERS_SQL}
+        ''')
+        if own_transaction:
+            connection.execute("COMMIT")
+    except Exception:
+        if own_transaction:
+            connection.execute("ROLLBACK")
+        raise
+
+
+def check(connection: sqlite3.Connection) -> List[Tuple[int, tuple, tuple]]:
+    """Расхождения счетчиков: [(user_id, сохраненные, фактические)]
+
+    Значения - (total_referrals, completed_referrals, rewarded_referrals).
+    """
+    stored = {
+        row[0]: tuple(row[1:])
+        for row in connection.execute(
+            "SELECT user_id, total_referrals, completed_referrals, rewarded_referrals FROM referral_counters"
+        )
+    }
+    actual = {row[0]: tuple(row[1:]) for row in connection.execute(ACTUAL_COUNTERS_SQL)}
+
+    mismatches = []
+    for user_id in sorted(set(stored) | set(actual)):
+        counters = stored.get(user_id, (0, 0, 0))
+        expected = actual.get(user_id, (0, 0, 0))
+        if counters != expected:
+            mismatches.append((user_id, counters, expected))
+    return mismatches
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Проверка счетчиков рефералов")
+    parser.add_argument('--db', default='dating_bot.db', help="Файл базы данных")
+    parser.add_argument('--fix', action='store_true',
+                        help="Пересчитать счетчики по исходным таблицам")
+    args = parser.parse_args(argv)
+
+    # Импортируем здесь, чтобы избежать циклического импорта
+    from models import Database
+
+    db = Database(args.db)
+    try:
+        mismatches = check(db.connection)
+        for user_id, counters, expected in mismatches[:50]:
+            print(f"❌ user_id={user_id}: {counters}, ожидалось {expected}")
+        print(f"📊 Расхождений: {len(mismatches)}")
+
+        if mismatches and args.fix:
+            connection = db.manager.open_connection()
+            connection.isolation_level = None
+            rebuild(connection)
+            connection.close()
+            print("✅ Счетчики referral_counters пересчитаны")
+    finally:
+        db.close()
+    return 1 if mismatches and not args.fix else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
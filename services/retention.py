@@ -0,0 +1,232 @@
+import argparse
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from services.seen_set import SeenSet
+
+logger = logging.getLogger(__name__)
+
+# Через сколько дней просмотренная или отклоненная анкета снова попадает в подбор
+RESHOW_AFTER_DAYS = 14
+
+# Не чаще одного раза за столько секунд проверяем, есть ли у зрителя старые просмотры
+RESHOW_CHECK_INTERVAL = 600
+
+_compaction_task = None
+
+# viewer_id -> время последней проверки (time.monotonic), не больше _MAX_RESHOW_CHECKS записей
+_reshow_checks = OrderedDict()
+_reshow_lock = threading.Lock()
+_MAX_RESHOW_CHECKS = 50000
+
+
+def _age_modifier(days: int) -> str:
+    return f'-{days} days'
+
+
+def _free_bytes(db) -> int:
+    """Размер свободных страниц файла базы"""
+    page_size = db.cursor.execute("PRAGMA page_size").fetchone()[0]
+    return db.cursor.execute("PRAGMA freelist_count").fetchone()[0] * page_size
+
+
+def _forget(db, viewer_ids):
+    """Сброс карт и пулов зрителей в памяти (пересоберутся при следующем запросе)"""
+    db.seen_sets.forget(viewer_ids)
+    for viewer_id in viewer_ids:
+        db.candidate_pool.discard(viewer_id)
+
+
+def _fold_into_seen_sets(cursor, by_viewer: dict):
+    """Перенос удаляемых просмотров в сохраненные битовые карты зрителей"""
+    for viewer_id, profile_ids in by_viewer.items():
+        row = cursor.execute("SELECT bitmap FROM seen_sets WHERE user_id = ?", (viewer_id,)).fetchone()
+        seen = SeenSet.from_blob(row[0] if row else None)
+        for profile_id in profile_ids:
+            seen.add(profile_id)
+        cursor.execute('''
+            INSERT INTO seen_sets (user_id, bitmap, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (user_id) DO UPDATE SET
+                bitmap = excluded.bitmap,
+                updated_at = excluded.updated_at
+        ''', (viewer_id, seen.to_blob()))
+
+
+def compact_views(db, keep_days: int = RESHOW_AFTER_DAYS, reshow: bool = True,
+                  batch_size: int = 2000, max_batches: Optional[int] = None) -> dict:
+    """Удаление просмотров старше keep_days дней
+
+    Просмотры удаляются порциями по batch_size, каждая порция - отдельная
+    короткая транзакция в потоке-писателе, поэтому обычные записи не ждут
+    окончания всей очистки. При reshow=True анкеты снова попадают в подбор:
+    битовые карты затронутых зрителей сбрасываются и пересобираются по
+    оставшимся просмотрам. При reshow=False просмотры сворачиваются в
+    карты seen_sets, и анкеты остаются скрытыми.
+
+    Возвращает {'deleted', 'viewers', 'batches', 'bytes_freed'}; bytes_freed -
+    прирост свободного места в файле базы, его займут новые записи.
+    """
+    free_before = _free_bytes(db)
+    modifier = _age_modifier(keep_days)
+
+    def write(cursor):
+        cursor.execute('''
+            SELECT id, viewer_id, viewed_profile_id FROM views
+            WHERE created_at < datetime('now', ?)
+            ORDER BY created_at
+            LIMIT ?
+        ''', (modifier, batch_size))
+        rows = cursor.fetchall()
+
+        by_viewer = {}
+        for view_id, viewer_id, profile_id in rows:
+            by_viewer.setdefault(viewer_id, []).append(profile_id)
+
+        for chunk in db._chunks([row[0] for row in rows]):
+            cursor.execute(
+                "DELETE FROM views WHERE id IN ({})".format(','.join(['?' for _ in chunk])),
+                chunk
+            )
+
+        if reshow:
+            for chunk in db._chunks(list(by_viewer)):
+                cursor.execute(
+                    "DELETE FROM seen_sets WHERE user_id IN ({})".format(','.join(['?' for _ in chunk])),
+                    chunk
+                )
+        else:
+            _fold_into_seen_sets(cursor, by_viewer)
+
+        return len(rows), list(by_viewer)
+
+    stats = {'deleted': 0, 'viewers': 0, 'batches': 0, 'bytes_freed': 0}
+    viewers = set()
+    while max_batches is None or stats['batches'] < max_batches:
+        deleted, viewer_ids = db._write(write)
+        if not deleted:
+            break
+
+        stats['deleted'] += deleted
+        stats['batches'] += 1
+        viewers.update(viewer_ids)
+        if reshow:
+            _forget(db, viewer_ids)
+
+    stats['viewers'] = len(viewers)
+    stats['bytes_freed'] = max(0, _free_bytes(db) - free_before)
+    return stats
+
+
+def reshow_old_views(db, viewer_id: int, days: int = RESHOW_AFTER_DAYS) -> bool:
+    """Возврат в подбор анкет, которые зритель видел больше days дней назад
+
+    Вызывается, когда новых анкет для зрителя не осталось. Возвращает True,
+    если хотя бы одна анкета снова доступна. Зритель, пролиставший все
+    анкеты, вызывает это на каждое нажатие, поэтому проверка выполняется
+    не чаще раза в RESHOW_CHECK_INTERVAL секунд и начинается с дешевого
+    запроса на чтение: запись и пересборка карты - только если старые
+    просмотры действительно есть.
+    """
+    now = time.monotonic()
+    with _reshow_lock:
+        checked_at = _reshow_checks.get(viewer_id)
+        if checked_at is not None and now - checked_at < RESHOW_CHECK_INTERVAL:
+            return False
+        _reshow_checks[viewer_id] = now
+        _reshow_checks.move_to_end(viewer_id)
+        while len(_reshow_checks) > _MAX_RESHOW_CHECKS:
+            _reshow_checks.popitem(last=False)
+
+    has_old_views = db.cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM views WHERE viewer_id = ? AND created_at < datetime('now', ?))",
+        (viewer_id, _age_modifier(days))
+    ).fetchone()[0]
+    if not has_old_views:
+        return False
+
+    seen_before = len(db.seen_sets.get(viewer_id))
+
+    def write(cursor):
+        cursor.execute(
+            "DELETE FROM views WHERE viewer_id = ? AND created_at < datetime('now', ?)",
+            (viewer_id, _age_modifier(days))
+        )
+        cursor.execute("DELETE FROM seen_sets WHERE user_id = ?", (viewer_id,))
+
+    db._write(write)
+    _forget(db, [viewer_id])
+    return len(db.seen_sets.get(viewer_id)) < seen_before
+
+
+async def _compaction_loop(db, interval: float, **kwargs):
+    while True:
+        try:
+            stats = await db.run(compact_views, db.db, **kwargs)
+            if stats['deleted']:
+                logger.info(
+                    f"🧹 Удалено старых просмотров: {stats['deleted']} "
+                    f"({stats['viewers']} зрителей), освобождено {stats['bytes_freed'] // 1024} КБ"
+                )
+        except Exception as e:
+            logger.error(f"❌ Ошибка очистки просмотров: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_compaction(db, interval: float = 6 * 3600, **kwargs) -> asyncio.Task:
+    """Периодическая очистка просмотров в фоне (db - AsyncDatabase)"""
+    global _compaction_task
+    if _compaction_task is None or _compaction_task.done():
+        _compaction_task = asyncio.create_task(_compaction_loop(db, interval, **kwargs))
+    return _compaction_task
+
+
+def stop_compaction():
+    """Остановка фоновой очистки"""
+    global _compaction_task
+    if _compaction_task is not None:
+        _compaction_task.cancel()
+        _compaction_task = None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Очистка старых просмотров анкет")
+    parser.add_argument('--db', default='dating_bot.db', help="Файл базы данных")
+    parser.add_argument('--days', type=int, default=RESHOW_AFTER_DAYS,
+                        help="Удалять просмотры старше этого числа дней")
+    parser.add_argument('--keep-hidden', action='store_true',
+                        help="Не показывать анкеты снова, а свернуть просмотры в seen_sets")
+    parser.add_argument('--batch-size', type=int, default=2000, help="Просмотров в одной транзакции")
+    parser.add_argument('--vacuum', action='store_true', help="Сжать файл базы после очистки")
+    args = parser.parse_args(argv)
+
+    # Импортируем здесь, чтобы избежать циклического импорта
+    from models import Database
+
+    db = Database(args.db)
+    try:
+        stats = compact_views(db, args.days, reshow=not args.keep_hidden, batch_size=args.batch_size)
+        print(f"✅ Удалено просмотров: {stats['deleted']} ({stats['viewers']} зрителей, "
+              f"{stats['batches']} транзакций)")
+        print(f"📦 Освобождено: {stats['bytes_freed'] // 1024} КБ")
+
+        if args.vacuum:
+            connection = db.manager.open_connection()
+            size_before = connection.execute("PRAGMA page_count").fetchone()[0]
+            connection.execute("VACUUM")
+            page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+            size_after = connection.execute("PRAGMA page_count").fetchone()[0]
+            connection.close()
+            print(f"📦 Файл базы уменьшен на {(size_before - size_after) * page_size // 1024} КБ")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
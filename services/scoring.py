@@ -0,0 +1,51 @@
+from typing import List, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Вес одного общего интереса и штраф за год разницы в возрасте:
+# один общий интерес перевешивает 5 лет разницы
+OVERLAP_WEIGHT = 1.0
+AGE_WEIGHT = 0.2
+
+
+def interests_mask(interest_ids: Sequence[int]) -> int:
+    """Битовая маска интересов: бит (id - 1) для каждого интереса"""
+    mask = 0
+    for interest_id in interest_ids:
+        if 1 <= interest_id <= 63:
+            mask |= 1 << (interest_id - 1)
+    return mask
+
+
+def _popcount_numpy(values):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    as_bytes = values.astype('>u8').view(np.uint8).reshape(-1, 8)
+    return np.unpackbits(as_bytes, axis=1).sum(axis=1)
+
+
+def score_candidates(viewer_mask: int, viewer_age: int,
+                     masks: Sequence[int], ages: Sequence[int]) -> List[float]:
+    """Совместимость кандидатов со зрителем
+
+    Число общих интересов (popcount пересечения масок) со штрафом
+    за разницу в возрасте. Считается векторно через NumPy, если он
+    установлен, иначе - обычным циклом.
+    """
+    if not masks:
+        return []
+
+    if np is not None:
+        mask_array = np.asarray(masks, dtype=np.uint64)
+        age_array = np.asarray(ages, dtype=np.float64)
+        overlap = _popcount_numpy(mask_array & np.uint64(viewer_mask))
+        scores = overlap * OVERLAP_WEIGHT - np.abs(age_array - viewer_age) * AGE_WEIGHT
+        return scores.tolist()
+
+    return [
+        (mask & viewer_mask).bit_count() * OVERLAP_WEIGHT - abs(age - viewer_age) * AGE_WEIGHT
+        for mask, age in zip(masks, ages)
+    ]
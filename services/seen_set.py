@@ -0,0 +1,178 @@
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+
+class SeenSet:
+    """Множество id анкет в виде битовой карты (бит N - анкета с id N)"""
+
+    __slots__ = ('bits',)
+
+    def __init__(self, bits: bytes = b''):
+        self.bits = bytearray(bits)
+
+    def add(self, profile_id: int):
+        index = profile_id >> 3
+        if index >= len(self.bits):
+            self.bits.extend(bytes(index - len(self.bits) + 1))
+        self.bits[index] |= 1 << (profile_id & 7)
+
+    def discard(self, profile_id: int):
+        index = profile_id >> 3
+        if index < len(self.bits):
+            self.bits[index] &= ~(1 << (profile_id & 7)) & 0xFF
+
+    def __contains__(self, profile_id: int) -> bool:
+        index = profile_id >> 3
+        return index < len(self.bits) and bool(self.bits[index] >> (profile_id & 7) & 1)
+
+    def __len__(self) -> int:
+        return int.from_bytes(self.bits, 'little').bit_count()
+
+    def to_blob(self) -> bytes:
+        """Сжатая битовая карта для хранения в базе"""
+        return zlib.compress(bytes(self.bits))
+
+    @classmethod
+    def from_blob(cls, blob: Optional[bytes]) -> 'SeenSet':
+        return cls(zlib.decompress(blob) if blob else b'')
+
+
+class SeenSetCache:
+    """Просмотренные и оцененные анкеты каждого зрителя
+
+    Объединение views и likes зрителя хранится битовой картой: проверка
+    «видел ли анкету» - обращение к одному байту вместо запроса к базе.
+    Карты последних max_viewers зрителей держатся в памяти, сжатые копии
+    сохраняются в таблицу seen_sets (не чаще раза в flush_every новых
+    анкет и при вытеснении из кэша). При промахе карта читается из
+    seen_sets и дополняется просмотрами, записанными после сохранения,
+    и лайками зрителя. Дизлайки старше reshow_days дней не учитываются,
+    чтобы отклоненные анкеты со временем снова попадали в подбор
+    (см. services.retention); reshow_days=None - учитываются все.
+    """
+
+    def __init__(self, db, max_viewers: int = 5000, flush_every: int = 20,
+                 reshow_days: Optional[int] = None):
+        self.db = db
+        self.max_viewers = max_viewers
+        self.flush_every = flush_every
+        self.reshow_days = reshow_days
+        self._sets = OrderedDict()
+        self._dirty = {}
+        self._lock = threading.RLock()
+
+    # ========== ПУБЛИЧНЫЕ МЕТОДЫ ==========
+
+    def get(self, viewer_id: int) -> SeenSet:
+        """Битовая карта зрителя (загружается при промахе)"""
+        with self._lock:
+            seen = self._sets.get(viewer_id)
+            if seen is not None:
+                self._sets.move_to_end(viewer_id)
+                return seen
+
+        seen = self._load(viewer_id)
+
+        with self._lock:
+            # Пока карта загружалась, ее мог загрузить другой поток
+            seen = self._sets.setdefault(viewer_id, seen)
+            self._sets.move_to_end(viewer_id)
+            while len(self._sets) > self.max_viewers:
+                evicted_id, evicted = self._sets.popitem(last=False)
+                if self._dirty.pop(evicted_id, 0):
+                    self._persist(evicted_id, evicted)
+        return seen
+
+    def contains(self, viewer_id: int, profile_id: int) -> bool:
+        """Видел ли зритель анкету"""
+        return profile_id in self.get(viewer_id)
+
+    def add(self, viewer_id: int, profile_id: int):
+        """Отметка анкеты просмотренной (только для карт в памяти,
+        остальные восстановятся из views и likes при загрузке)"""
+        with self._lock:
+            seen = self._sets.get(viewer_id)
+            if seen is None or profile_id in seen:
+                return
+            seen.add(profile_id)
+            self._dirty[viewer_id] = self._dirty.get(viewer_id, 0) + 1
+            if self._dirty[viewer_id] >= self.flush_every:
+                del self._dirty[viewer_id]
+                self._persist(viewer_id, seen)
+
+    def forget(self, viewer_ids):
+        """Сброс карт зрителей только в памяти"""
+        with self._lock:
+            for viewer_id in viewer_ids:
+                self._sets.pop(viewer_id, None)
+                self._dirty.pop(viewer_id, None)
+
+    def discard(self, viewer_id: int):
+        """Сброс карты зрителя в памяти и в базе (пересоберется из views и likes)"""
+        self.forget([viewer_id])
+        self.db._write(lambda cursor: cursor.execute(
+            "DELETE FROM seen_sets WHERE user_id = ?", (viewer_id,)
+        ), wait=False)
+
+    def flush(self):
+        """Сохранение всех измененных карт"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            for viewer_id in dirty:
+                seen = self._sets.get(viewer_id)
+                if seen is not None:
+                    self._persist(viewer_id, seen)
+
+    # ========== ВНУТРЕННИЕ МЕТОДЫ ==========
+
+    def _load(self, viewer_id: int) -> SeenSet:
+        """Карта из seen_sets, дополненная новыми просмотрами и лайками"""
+        cursor = self.db.cursor
+        row = cursor.execute(
+            "SELECT bitmap, view_id FROM seen_sets WHERE user_id = ?", (viewer_id,)
+        ).fetchone()
+        seen = SeenSet.from_blob(row['bitmap'] if row else None)
+        view_id = row['view_id'] if row else 0
+
+        cursor.execute(
+            "SELECT viewed_profile_id FROM views WHERE viewer_id = ? AND id > ?",
+            (viewer_id, view_id)
+        )
+        for (profile_id,) in cursor.fetchall():
+            seen.add(profile_id)
+
+        if self.reshow_days is None:
+            cursor.execute("SELECT to_profile_id FROM likes WHERE from_user_id = ?", (viewer_id,))
+        else:
+            cursor.execute('''
+                SELECT to_profile_id FROM likes
+                WHERE from_user_id = ?
+                AND (like_type != 'dislike' OR created_at >= datetime('now', ?))
+            ''', (viewer_id, f'-{self.reshow_days} days'))
+        for (profile_id,) in cursor.fetchall():
+            seen.add(profile_id)
+        return seen
+
+    def _persist(self, viewer_id: int, seen: SeenSet):
+        """Фоновое сохранение карты (вызывается под self._lock)"""
+        def write(cursor):
+            # Карта снимается в потоке-писателе: все просмотры, записанные
+            # до этого момента, в ней уже есть, поэтому view_id не опережает ее
+            with self._lock:
+                blob = seen.to_blob()
+            cursor.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM views WHERE viewer_id = ?", (viewer_id,)
+            )
+            view_id = cursor.fetchone()[0]
+            cursor.execute('''
+                INSERT INTO seen_sets (user_id, bitmap, view_id, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    bitmap = excluded.bitmap,
+                    view_id = excluded.view_id,
+                    updated_at = excluded.updated_at
+            ''', (viewer_id, blob, view_id))
+
+        self.db._write(write, wait=False)
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from services.metrics import METRICS, hour_start
+
+
+def day_start(days_ago: int = 0, now: Optional[datetime] = None) -> datetime:
+    """Локальная полночь days_ago дней назад"""
+    now = now or datetime.now()
+    return (now - timedelta(days=days_ago)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """Локальное время из created_at (текст CURRENT_TIMESTAMP в UTC или unix time)"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value)
+    parsed = datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S')
+    return parsed.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+
+async def get_series(db, names: List[str], start: datetime, buckets: int,
+                     bucket_seconds: int = 86400, cumulative: bool = False) -> Dict[str, list]:
+    """Ряды статистики по интервалам, начиная со start
+
+    Значения берутся из почасовых счетчиков daily_metrics одним запросом
+    с GROUP BY по номеру интервала (bucket_seconds кратно часу). Результат -
+    колонки одинаковой длины: 'dates' (начало интервала) и по списку
+    значений на каждый ряд из names. При cumulative=True значения -
+    нарастающий итог с учетом событий до начала диапазона.
+
+    Часы в daily_metrics - часы UTC. Границы интервалов выравниваются
+    по hour_start: при смещении пояса не на целый час сутки начинаются
+    с часа UTC, в который попадает локальная полночь (для UTC+5:30 -
+    в 23:30), а подписи в 'dates' остаются локальными.
+    """
+    for name in names:
+        if name not in METRICS:
+            raise ValueError(f"Неизвестный ряд статистики: {name}")
+
+    start_ts = hour_start(start)
+    end_ts = start_ts + buckets * bucket_seconds
+    sums = ', '.join(f"SUM({name})" for name in names)
+    where = "hour_ts < ?" if cumulative else "hour_ts >= ? AND hour_ts < ?"
+    params = [end_ts] if cumulative else [start_ts, end_ts]
+
+    rows = await db.fetchall(f'''
+        SELECT
+            CASE WHEN hour_ts < ? THEN -1 ELSE (hour_ts - ?) / ? END AS bucket,
+            {sums}
+        FROM daily_metrics
+        WHERE {where}
+        GROUP BY bucket
+    ''', [start_ts, start_ts, bucket_seconds] + params)
+
+    columns = {name: [0] * buckets for name in names}
+    before = {name: 0 for name in names}
+    for row in rows:
+        bucket = row[0]
+        for index, name in enumerate(names, start=1):
+            value = row[index] or 0
+            if bucket < 0:
+                before[name] += value
+            else:
+                columns[name][bucket] = value
+
+    if cumulative:
+        for name, column in columns.items():
+            total = before[name]
+            for i, value in enumerate(column):
+                total += value
+                column[i] = total
+
+    result = {'dates': [start + timedelta(seconds=i * bucket_seconds) for i in range(buckets)]}
+    result.update(columns)
+    return result
+
+
+async def get_daily_series(db, names: List[str], days: int = 7,
+                           cumulative: bool = False) -> Dict[str, list]:
+    """Ряды статистики по дням за последние days дней, включая сегодня"""
+    return await get_series(db, names, day_start(days - 1), days, cumulative=cumulative)
+
+
+async def get_hourly_series(db, names: List[str]) -> Dict[str, list]:
+    """Ряды статистики по часам за сегодня"""
+    return await get_series(db, names, day_start(), 24, bucket_seconds=3600)
@@ -0,0 +1,120 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class WriteQueue:
+    """Очередь записи в базу данных с пакетными коммитами
+
+    Все изменения выполняет один поток-писатель со своим соединением.
+    Операции копятся в очереди и коммитятся одной транзакцией раз в
+    max_delay секунд или по достижении max_batch операций, поэтому
+    частые мелкие записи (просмотры, лайки) не платят fsync каждая.
+    Каждая операция выполняется в своей точке сохранения: ошибка одной
+    операции не откатывает остальные.
+    """
+
+    def __init__(self, connection_factory, max_batch: int = 100, max_delay: float = 0.005):
+        self.connection_factory = connection_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._cursor = None
+        self._lock = threading.Lock()
+
+    def submit(self, operation) -> Future:
+        """Постановка операции в очередь
+
+        operation(cursor) выполняется в потоке-писателе, ее результат
+        становится результатом Future после коммита транзакции.
+        """
+        # Вложенная запись из самой операции выполняется сразу же
+        if threading.current_thread() is self._thread:
+            future = Future()
+            future.set_result(operation(self._cursor))
+            return future
+
+        self._ensure_started()
+        future = Future()
+        self._queue.put((operation, future))
+        return future
+
+    def close(self):
+        """Дописывание очереди и остановка потока-писателя"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        connection = self.connection_factory()
+        # Транзакциями управляем сами
+        connection.isolation_level = None
+        self._cursor = connection.cursor()
+
+        running = True
+        while running:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+
+            self._flush(batch)
+
+        connection.close()
+
+    def _flush(self, batch: list):
+        """Выполнение пакета операций одной транзакцией"""
+        cursor = self._cursor
+        results = []
+
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+
+            for operation, future in batch:
+                cursor.execute("SAVEPOINT write_op")
+                try:
+                    results.append((future, operation(cursor), None))
+                    cursor.execute("RELEASE write_op")
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO write_op")
+                    cursor.execute("RELEASE write_op")
+                    results.append((future, None, e))
+
+            cursor.execute("COMMIT")
+        except Exception as e:
+            if cursor.connection.in_transaction:
+                cursor.execute("ROLLBACK")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
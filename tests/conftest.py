@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from models import Database
+from services import retention
+from services.async_db import AsyncDatabase
+
+# Анкета по умолчанию: девушка из Алматы ищет парня
+PROFILE_DATA = {
+    'name': 'Анкета', 'age': 20, 'gender': 'Женщина',
+    'looking_for': 'Парня', 'city': 'Алматы', 'interests': [],
+}
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / 'bot.db'))
+    retention._reshow_checks.clear()
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def async_db(tmp_path):
+    database = AsyncDatabase(str(tmp_path / 'bot.db'))
+    yield database
+    asyncio.run(database.close())
+
+
+@pytest.fixture
+def add_profile(db):
+    """add_profile(telegram_id, **поля) или add_profile(user_id=..., **поля) -> (user_id, profile_id)"""
+    def add(telegram_id: int = None, user_id: int = None, **fields) -> tuple:
+        if user_id is None:
+            user_id = db.add_user(telegram_id)
+        profile_id = db.create_profile(user_id, dict(PROFILE_DATA, **fields))
+        return user_id, profile_id
+
+    return add
@@ -0,0 +1,37 @@
+import asyncio
+
+from services import broadcast
+from services.broadcast import DELIVERED, BroadcastEngine
+
+
+class RecordingBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id: int, text: str, parse_mode: str = None):
+        self.sent.append(chat_id)
+
+
+def test_resumed_broadcast_skips_delivered_recipients(async_db):
+    bot = RecordingBot()
+
+    async def scenario():
+        user_ids = [await async_db.add_user(telegram_id) for telegram_id in (11, 12, 13)]
+        broadcast_id = await async_db.execute(
+            "INSERT INTO broadcasts (admin_id, message_text, status) VALUES (1, 'Новости', 'sending')"
+        )
+
+        # До остановки бота рассылка успела дойти до первого получателя
+        engine = BroadcastEngine(bot, async_db, broadcast_id)
+        await async_db.write(lambda cursor: engine._record(cursor, user_ids[0], DELIVERED, None))
+
+        assert await broadcast.resume_broadcasts(bot, async_db) == [broadcast_id]
+        await broadcast._running[broadcast_id]
+        return await engine.get_stats(), await async_db.fetchone(
+            "SELECT status, sent_count FROM broadcasts WHERE id = ?", (broadcast_id,)
+        )
+
+    stats, row = asyncio.run(scenario())
+    assert sorted(bot.sent) == [12, 13]
+    assert stats[DELIVERED] == 3
+    assert (row['status'], row['sent_count']) == ('completed', 3)
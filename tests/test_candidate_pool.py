@@ -0,0 +1,124 @@
+import pytest
+
+
+@pytest.fixture
+def viewer_id(add_profile) -> int:
+    user_id, _ = add_profile(1, gender='Мужчина', looking_for='Девушку')
+    return user_id
+
+
+def count_candidate_queries(db, monkeypatch) -> list:
+    calls = []
+    fetch = db.candidate_pool._fetch_candidates
+
+    def counting_fetch(*args):
+        calls.append(args)
+        return fetch(*args)
+
+    monkeypatch.setattr(db.candidate_pool, '_fetch_candidates', counting_fetch)
+    return calls
+
+
+def test_exhausted_segment_is_not_queried_on_every_pop(db, viewer_id, add_profile, monkeypatch):
+    add_profile(2)
+    assert db.get_next_profile(viewer_id) is not None
+    assert db.get_next_profile(viewer_id) is None
+
+    calls = count_candidate_queries(db, monkeypatch)
+    for _ in range(5):
+        assert db.get_next_profile(viewer_id) is None
+    assert calls == []
+
+
+def test_edited_profile_with_lower_id_is_found(db, viewer_id, add_profile):
+    user_id, profile_id = add_profile(2, city='Астана', age=40)
+    add_profile(3)
+
+    profile = db.get_next_profile(viewer_id)
+    db.add_view(viewer_id, profile['id'])
+    assert db.get_next_profile(viewer_id) is None
+
+    # Анкета с меньшим id стала подходящей после правки
+    db.update_profile(profile_id, 'age', 22)
+    db.candidate_pool.min_rescan_interval = 0
+    assert db.get_next_profile(viewer_id)['id'] == profile_id
+
+
+def test_exhausted_segment_is_rescanned_after_interval(db, viewer_id, add_profile, monkeypatch):
+    _, profile_id = add_profile(2, age=40)
+    assert db.get_next_profile(viewer_id) is None
+
+    # Правка из другого процесса: ревизия пула не меняется
+    db._write(lambda cursor: cursor.execute("UPDATE profiles SET age = 21 WHERE id = ?", (profile_id,)))
+    db.profile_cache.invalidate(profile_id)
+    assert db.get_next_profile(viewer_id) is None
+
+    db.candidate_pool.rescan_interval = 0
+    assert db.get_next_profile(viewer_id)['id'] == profile_id
+
+
+def test_stale_cached_profile_is_not_shown(db, viewer_id, add_profile):
+    _, profile_id = add_profile(2)
+    db.get_profile_by_id(profile_id)
+
+    # Анкету скрыли в другом процессе: в ProfileCache она еще активна
+    db._write(lambda cursor: cursor.execute("UPDATE profiles SET is_active = 0 WHERE id = ?", (profile_id,)))
+    assert db.profile_cache.get(profile_id)['is_active']
+    assert db.get_next_profile(viewer_id) is None
+
+
+def test_stale_cached_profile_is_reloaded(db, viewer_id, add_profile):
+    _, profile_id = add_profile(2, city='Астана')
+    db.get_profile_by_id(profile_id)
+
+    db._write(lambda cursor: cursor.execute("UPDATE profiles SET city = 'Алматы' WHERE id = ?", (profile_id,)))
+    assert db.get_next_profile(viewer_id)['city'] == 'Алматы'
+
+
+def test_best_match_is_ranked_across_whole_segment(db, viewer_id, add_profile):
+    # Лучшая анкета (ровесница зрителя) - за пределами первой порции по id
+    db._write(lambda cursor: cursor.executemany(
+        "INSERT INTO profiles (user_id, name, age, gender, looking_for, city) "
+        "VALUES (?, 'Анкета', 24, 'Женщина', 'Парня', 'Алматы')",
+        [(100 + index,) for index in range(db.candidate_pool.batch_size + 50)]
+    ))
+    _, best_id = add_profile(1000, age=20)
+
+    assert db.get_next_profile(viewer_id)['id'] == best_id
+
+
+def test_interests_update_marks_profiles_changed(db, add_profile):
+    _, profile_id = add_profile(2)
+    revision = db.candidate_pool._revision
+    assert db.update_profile_interests(profile_id, [])
+    assert db.candidate_pool._revision == revision + 1
+
+
+def add_equal_profiles(db, count: int, first_user_id: int = 100):
+    db._write(lambda cursor: cursor.executemany(
+        "INSERT INTO profiles (user_id, name, age, gender, looking_for, city) "
+        "VALUES (?, 'Анкета', 24, 'Женщина', 'Парня', 'Алматы')",
+        [(first_user_id + index,) for index in range(count)]
+    ))
+
+
+def test_equal_candidates_are_not_served_by_id(db, viewer_id):
+    add_equal_profiles(db, 50)
+    served = [db.get_next_profile(viewer_id)['id'] for _ in range(50)]
+    assert sorted(served) != served
+
+
+def test_new_profile_is_served_without_exhausting_backlog(db, viewer_id, add_profile):
+    db.candidate_pool.batch_size = 20
+    add_equal_profiles(db, 100)
+    for _ in range(5):
+        db.add_view(viewer_id, db.get_next_profile(viewer_id)['id'])
+
+    # Новая анкета попадает в очередь при ближайшем дозаполнении
+    _, new_id = add_profile(1000, age=20)
+    served = []
+    for _ in range(db.candidate_pool.batch_size):
+        profile = db.get_next_profile(viewer_id)
+        served.append(profile['id'])
+        db.add_view(viewer_id, profile['id'])
+    assert new_id in served
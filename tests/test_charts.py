@@ -0,0 +1,15 @@
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_chart_worker_does_not_import_bot_modules():
+    code = (
+        "import sys, services.chart_worker; "
+        "print(sorted(m for m in ('aiogram', 'models', 'handlers', 'main') if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
@@ -0,0 +1,60 @@
+import csv
+import gzip
+import os
+import sqlite3
+
+import pytest
+
+from services import export
+
+
+@pytest.fixture
+def connection(tmp_path):
+    connection = sqlite3.connect(str(tmp_path / 'export.db'))
+    connection.execute("CREATE TABLE views (id INTEGER PRIMARY KEY, payload TEXT)")
+    connection.executemany(
+        "INSERT INTO views (payload) VALUES (?)",
+        [(os.urandom(32).hex(),) for _ in range(3000)]
+    )
+    yield connection
+    connection.close()
+
+
+def read_csv_parts(paths: list) -> list:
+    rows = []
+    for path in paths:
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            assert next(reader) == ['id', 'payload']
+            rows.extend(reader)
+    return rows
+
+
+def test_large_export_is_split_into_complete_parts(connection):
+    paths = export.export_table(connection, 'views', 'csv', chunk_size=100, max_part_size=20 * 1024)
+    try:
+        assert len(paths) > 1
+        rows = read_csv_parts(paths)
+        assert [int(row[0]) for row in rows] == list(range(1, 3001))
+    finally:
+        for path in paths:
+            os.remove(path)
+
+
+def test_small_export_is_one_file(connection):
+    paths = export.export_table(connection, 'views', 'jsonl', chunk_size=100)
+    try:
+        assert len(paths) == 1
+    finally:
+        for path in paths:
+            os.remove(path)
+
+
+def test_empty_export_has_header(connection):
+    connection.execute("DELETE FROM views")
+    paths = export.export_table(connection, 'views', 'csv')
+    try:
+        assert read_csv_parts(paths) == []
+    finally:
+        for path in paths:
+            os.remove(path)
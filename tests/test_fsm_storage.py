@@ -0,0 +1,41 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+from services.fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+def test_state_and_data_survive_restart(async_db):
+    async def scenario():
+        storage = SQLiteStorage(async_db)
+        await storage.set_state(KEY, 'ProfileStates:name')
+        await storage.update_data(KEY, {'name': 'Анна'})
+        await storage.update_data(KEY, {'age': 20})
+        await storage.close()
+
+        restarted = SQLiteStorage(async_db)
+        return await restarted.get_state(KEY), await restarted.get_data(KEY)
+
+    state, data = asyncio.run(scenario())
+    assert state == 'ProfileStates:name'
+    assert data == {'name': 'Анна', 'age': 20}
+
+
+def test_expired_record_is_ignored_and_swept(async_db):
+    async def scenario():
+        storage = SQLiteStorage(async_db)
+        await storage.set_state(KEY, 'ProfileStates:name')
+        await storage.close()
+
+        # Запись не менялась дольше ttl
+        await async_db.execute("UPDATE fsm_storage SET expires_at = 0")
+        restarted = SQLiteStorage(async_db, sweep_interval=0)
+        state = await restarted.get_state(KEY)
+        await restarted.flush()
+        return state, await async_db.fetchval("SELECT COUNT(*) FROM fsm_storage")
+
+    state, rows = asyncio.run(scenario())
+    assert state is None
+    assert rows == 0
@@ -0,0 +1,31 @@
+from services.metrics import METRICS
+
+
+def totals(db) -> dict:
+    sums = ', '.join(f"COALESCE(SUM({name}), 0)" for name in METRICS)
+    row = db.cursor.execute(f"SELECT {sums} FROM daily_metrics").fetchone()
+    return dict(zip(METRICS, row))
+
+
+def test_repeated_like_is_counted_once(db, add_profile):
+    viewer_id = db.add_user(1)
+    _, profile_id = add_profile(2)
+
+    for _ in range(3):
+        db.add_like(viewer_id, profile_id, 'like')
+    assert totals(db)['likes'] == 1
+
+    db.add_like(viewer_id, profile_id, 'dislike')
+    db.add_like(viewer_id, profile_id, 'dislike')
+    assert totals(db)['likes'] == 1
+    assert totals(db)['dislikes'] == 1
+
+
+def test_like_after_delete_is_counted_again(db, add_profile):
+    viewer_id = db.add_user(1)
+    _, profile_id = add_profile(2)
+
+    db.add_like(viewer_id, profile_id, 'like')
+    db._write(lambda cursor: cursor.execute("DELETE FROM likes"))
+    db.add_like(viewer_id, profile_id, 'like')
+    assert totals(db)['likes'] == 2
@@ -0,0 +1,45 @@
+import sqlite3
+
+import pytest
+
+from services import migrations
+
+
+def failing_migration(connection: sqlite3.Connection):
+    connection.execute("CREATE TABLE half_applied (id INTEGER)")
+    raise sqlite3.OperationalError("сбой миграции")
+
+
+def test_failed_migration_is_rolled_back_and_raised(tmp_path, monkeypatch):
+    connection = sqlite3.connect(str(tmp_path / 'migrations.db'))
+    connection.execute("CREATE TABLE profiles (id INTEGER, city TEXT)")
+    connection.commit()
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [
+        ["CREATE TABLE first (id INTEGER)"],
+        failing_migration,
+        ["CREATE TABLE third (id INTEGER)"],
+    ])
+
+    with pytest.raises(sqlite3.OperationalError):
+        migrations.migrate(connection)
+
+    tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert 'first' in tables
+    assert 'half_applied' not in tables
+    assert 'third' not in tables
+    assert migrations.get_schema_version(connection) == 1
+    connection.close()
+
+
+def test_city_migration_keeps_unknown_and_similar_cities(tmp_path, capsys):
+    connection = sqlite3.connect(str(tmp_path / 'cities.db'))
+    connection.execute("CREATE TABLE profiles (id INTEGER PRIMARY KEY, city TEXT)")
+    cities = ['алма-ата', 'г. Алматы', 'Алмты', 'Комсомольск-на-Амуре', 'Алматы']
+    connection.executemany("INSERT INTO profiles (city) VALUES (?)", [(city,) for city in cities])
+
+    migrations._normalize_cities(connection)
+
+    rows = [row[0] for row in connection.execute("SELECT city FROM profiles ORDER BY id")]
+    assert rows == ['Алматы', 'Алматы', 'Алмты', 'Комсомольск-на-Амуре', 'Алматы']
+    assert capsys.readouterr().out.count('->') == 2
+    connection.close()
@@ -0,0 +1,76 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+
+def create_payment(db, telegram_id: int, stars_amount: int = 599, duration: int = 30):
+    user_id = db.add_user(telegram_id)
+    payment_id, payload = db.create_star_payment(user_id, stars_amount, 'premium', duration)
+    return user_id, payment_id, payload
+
+
+def count_subscriptions(db, user_id: int) -> int:
+    return db.cursor.execute(
+        "SELECT COUNT(*) FROM premium_subscriptions WHERE user_id = ?", (user_id,)
+    ).fetchone()[0]
+
+
+def payment_status(db, payment_id: int) -> str:
+    return db.cursor.execute("SELECT status FROM star_payments WHERE id = ?", (payment_id,)).fetchone()[0]
+
+
+def test_duplicate_delivery_grants_premium_once(db):
+    user_id, payment_id, payload = create_payment(db, 1)
+
+    assert db.pre_check_star_payment(payload, user_id, 599, 'XTR') is None
+    assert payment_status(db, payment_id) == 'pre_checked'
+
+    assert db.complete_star_payment(payload, 'charge_1', 'provider_1', user_id, 599) == 'completed'
+    assert db.complete_star_payment(payload, 'charge_1', 'provider_1', user_id, 599) == 'duplicate'
+
+    assert payment_status(db, payment_id) == 'completed'
+    assert count_subscriptions(db, user_id) == 1
+    assert db.has_active_premium(user_id)
+
+
+def test_out_of_order_updates(db):
+    user_id, payment_id, payload = create_payment(db, 2)
+
+    # successful_payment раньше pre_checkout_query (платеж еще в pending)
+    assert db.complete_star_payment(payload, 'charge_2', 'provider_2', user_id, 599) == 'completed'
+    assert db.pre_check_star_payment(payload, user_id, 599, 'XTR') == "Платеж уже оплачен"
+    assert db.complete_star_payment(payload, 'charge_2', 'provider_2', user_id, 599) == 'duplicate'
+
+    # Тот же платеж с другим charge_id не выдает премиум повторно
+    assert db.complete_star_payment(payload, 'charge_other', 'provider_2', user_id, 599) is None
+    assert count_subscriptions(db, user_id) == 1
+
+
+def test_pre_checkout_validation(db):
+    user_id, payment_id, payload = create_payment(db, 3)
+
+    assert db.pre_check_star_payment(payload, user_id, 1, 'XTR') == "Неверная сумма платежа"
+    assert db.pre_check_star_payment(payload, user_id + 1, 599, 'XTR') == "Платеж не найден"
+    assert db.pre_check_star_payment(payload, user_id, 599, 'USD') == "Неверная валюта платежа"
+    assert db.pre_check_star_payment('payment_x_y', user_id, 599, 'XTR') == "Платеж не найден"
+    assert payment_status(db, payment_id) == 'pending'
+
+    assert db.complete_star_payment(payload, 'charge_3', 'provider_3', user_id, 1) is None
+    assert count_subscriptions(db, user_id) == 0
+
+
+def test_concurrent_replay(db):
+    payments = [create_payment(db, 1000 + index) for index in range(50)]
+
+    updates = []
+    for user_id, payment_id, payload in payments:
+        updates += [(payload, f'charge_{payment_id}', 'provider', user_id, 599)] * 20
+    random.Random(42).shuffle(updates)
+
+    with ThreadPoolExecutor(16) as executor:
+        results = list(executor.map(lambda update: db.complete_star_payment(*update), updates))
+
+    assert results.count('completed') == len(payments)
+    assert results.count('duplicate') == len(updates) - len(payments)
+    for user_id, payment_id, _ in payments:
+        assert count_subscriptions(db, user_id) == 1
+        assert payment_status(db, payment_id) == 'completed'
@@ -0,0 +1,28 @@
+def test_new_subscription_replaces_cached_absence(db):
+    user_id = db.add_user(1)
+    assert db.get_user_premium_status(user_id) is None
+    assert db.premium_cache.get(user_id) == (True, None)
+
+    subscription_id = db.create_premium_subscription(user_id, 'week', 7)
+    assert db.get_user_premium_status(user_id)['id'] == subscription_id
+
+
+def test_cache_keeps_longest_subscription(db):
+    user_id = db.add_user(1)
+    month_id = db.create_premium_subscription(user_id, 'month', 30)
+    db.create_premium_subscription(user_id, 'week', 7)
+
+    found, status = db.premium_cache.get(user_id)
+    assert found and status['id'] == month_id
+
+
+def test_read_started_before_purchase_is_not_cached(db):
+    user_id = db.add_user(1)
+    generation = db.premium_cache.generation()
+    db.create_premium_subscription(user_id, 'week', 7)
+    db.premium_cache.invalidate(user_id)
+
+    # Ответ "подписки нет", прочитанный до покупки, не попадает в кэш
+    db.premium_cache.put(user_id, None, generation)
+    assert db.premium_cache.get(user_id) == (False, None)
+    assert db.has_active_premium(user_id)
@@ -0,0 +1,29 @@
+def test_profile_update_invalidates_cache(db, add_profile):
+    _, profile_id = add_profile(1)
+    assert db.get_profile_by_id(profile_id)['city'] == 'Алматы'
+    assert db.profile_cache.get(profile_id) is not None
+
+    assert db.update_profile(profile_id, 'city', 'Астана')
+    assert db.profile_cache.get(profile_id) is None
+    assert db.get_profile_by_id(profile_id)['city'] == 'Астана'
+
+
+def test_photo_and_delete_invalidate_user_profile(db, add_profile):
+    user_id, profile_id = add_profile(1)
+    assert db.get_user_profile_by_user_id(user_id)['photos'] == []
+
+    assert db.add_photo(profile_id, 'file-1', 'unique-1')
+    assert db.get_user_profile_by_user_id(user_id)['photos'] == ['file-1']
+
+    assert db.delete_profile(user_id)
+    assert db.get_user_profile_by_user_id(user_id) is None
+
+
+def test_read_started_before_invalidation_is_not_cached(db, add_profile):
+    _, profile_id = add_profile(1)
+    generation = db.profile_cache.generation()
+    stale = db.get_profile_by_id(profile_id)
+    db.profile_cache.invalidate(profile_id)
+
+    db.profile_cache.put(stale, generation)
+    assert db.profile_cache.get(profile_id) is None
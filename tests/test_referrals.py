@@ -0,0 +1,46 @@
+import pytest
+
+from services import referral_counters
+
+
+@pytest.fixture
+def invite(db, add_profile):
+    def invite(referrer_id: int, telegram_id: int, create_profile: bool = True):
+        user_id = db.add_user(telegram_id)
+        db.add_referral(referrer_id, user_id)
+        if create_profile:
+            add_profile(user_id=user_id, name='Друг')
+
+    return invite
+
+
+def count_rewards(db, user_id: int) -> int:
+    return db.cursor.execute(
+        "SELECT COUNT(*) FROM premium_subscriptions WHERE user_id = ? AND payment_id = 'referral_reward'",
+        (user_id,)
+    ).fetchone()[0]
+
+
+def test_reward_is_granted_once_per_threshold(db, invite):
+    referrer_id = db.add_user(1)
+    for index in range(23):
+        invite(referrer_id, 100 + index)
+    invite(referrer_id, 500, create_profile=False)
+
+    assert count_rewards(db, referrer_id) == 2
+    assert db.get_referral_stats(referrer_id) == {'total': 24, 'completed': 3, 'rewarded': 20}
+    assert not db.claim_referral_reward(referrer_id)
+    assert db.has_active_premium(referrer_id)
+
+
+def test_consistency_check_rebuilds_counters(db, invite):
+    referrer_id = db.add_user(1)
+    for index in range(12):
+        invite(referrer_id, 100 + index)
+    assert referral_counters.check(db.connection) == []
+
+    db._write(lambda cursor: cursor.execute("UPDATE referral_counters SET completed_referrals = 1"))
+    assert referral_counters.check(db.connection) == [(referrer_id, (12, 1, 10), (12, 12, 10))]
+
+    db._write(lambda cursor: referral_counters.rebuild(cursor.connection))
+    assert referral_counters.check(db.connection) == []
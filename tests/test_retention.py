@@ -0,0 +1,46 @@
+import pytest
+
+from services import retention
+
+
+@pytest.fixture
+def add_viewer_with_views(db, add_profile):
+    def add(views: int, age_days: int) -> int:
+        viewer_id = db.add_user(1)
+        for index in range(views):
+            _, profile_id = add_profile(100 + index)
+            db.add_view(viewer_id, profile_id)
+        db._write(lambda cursor: cursor.execute(
+            "UPDATE views SET created_at = datetime('now', ?)", (f'-{age_days} days',)
+        ))
+        db.seen_sets.forget([viewer_id])
+        return viewer_id
+
+    return add
+
+
+def test_reshow_returns_old_views(db, add_viewer_with_views):
+    viewer_id = add_viewer_with_views(3, age_days=30)
+    assert retention.reshow_old_views(db, viewer_id, days=14)
+    assert len(db.seen_sets.get(viewer_id)) == 0
+
+
+def test_reshow_skips_rebuild_without_old_views(db, add_viewer_with_views, monkeypatch):
+    viewer_id = add_viewer_with_views(3, age_days=1)
+    writes = []
+    monkeypatch.setattr(db, '_write', lambda operation, wait=True: writes.append(operation))
+
+    assert not retention.reshow_old_views(db, viewer_id, days=14)
+    assert writes == []
+
+
+def test_reshow_is_checked_once_per_interval(db, add_viewer_with_views):
+    viewer_id = add_viewer_with_views(3, age_days=1)
+    assert not retention.reshow_old_views(db, viewer_id, days=14)
+
+    # Просмотры состарились, но повторная проверка раньше интервала не выполняется
+    db._write(lambda cursor: cursor.execute("UPDATE views SET created_at = datetime('now', '-30 days')"))
+    assert not retention.reshow_old_views(db, viewer_id, days=14)
+
+    retention._reshow_checks.clear()
+    assert retention.reshow_old_views(db, viewer_id, days=14)
@@ -0,0 +1,35 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from services.metrics import get_totals
+from services.stats import get_series
+
+# Пояс со смещением не на целый час: полночь - в 18:30 UTC
+INDIA = timezone(timedelta(hours=5, minutes=30))
+
+
+def utc_hour(day: int, hour: int) -> int:
+    return int(datetime(2026, 1, day, hour, tzinfo=timezone.utc).timestamp())
+
+
+def add_views(async_db, counts: dict):
+    asyncio.run(async_db.write(lambda cursor: cursor.executemany(
+        "INSERT INTO daily_metrics (hour_ts, views) VALUES (?, ?)", counts.items()
+    )))
+
+
+def test_hours_are_bucketed_by_local_day_start(async_db):
+    add_views(async_db, {
+        utc_hour(1, 17): 1,    # 22:30 1 января - до диапазона
+        utc_hour(1, 18): 10,   # 23:30 1 января - час, в котором наступает 2 января
+        utc_hour(2, 17): 100,  # 22:30 2 января
+        utc_hour(2, 18): 1000,  # 23:30 2 января - уже 3 января
+    })
+    start = datetime(2026, 1, 2, tzinfo=INDIA)
+
+    series = asyncio.run(get_series(async_db, ['views'], start, 2))
+    assert series['views'] == [110, 1000]
+    assert [date.day for date in series['dates']] == [2, 3]
+
+    today = asyncio.run(get_totals(async_db, ['views'], start=start, end=start + timedelta(days=1)))
+    assert today['views'] == 110
@@ -0,0 +1,31 @@
+import asyncio
+
+from aiogram.types import User
+
+from middlewares.throttling import BucketTable, ThrottlingMiddleware
+
+
+def test_burst_is_allowed_then_rejected():
+    middleware = ThrottlingMiddleware(limits={'default': (1.0, 3)})
+    handled = []
+
+    async def handler(event, data):
+        handled.append(event)
+        return event
+
+    async def scenario():
+        data = {'event_from_user': User(id=1, is_bot=False, first_name='Анна')}
+        return [await middleware(handler, index, data) for index in range(5)]
+
+    assert asyncio.run(scenario()) == [0, 1, 2, None, None]
+    assert handled == [0, 1, 2]
+
+
+def test_bucket_refills_and_warns_once_per_burst():
+    table = BucketTable(capacity=10)
+    key = (1, 'default')
+
+    assert table.consume(key, rate=1.0, burst=1, now=0.0) == (True, False)
+    assert table.consume(key, rate=1.0, burst=1, now=0.1) == (False, True)
+    assert table.consume(key, rate=1.0, burst=1, now=0.2) == (False, False)
+    assert table.consume(key, rate=1.0, burst=1, now=1.2) == (True, False)
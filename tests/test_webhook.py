@@ -0,0 +1,119 @@
+import asyncio
+import multiprocessing
+import random
+import time
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from webhook import SECRET_HEADER, UpdateSequencer, WorkerPool, create_app, get_update_user_id
+
+
+def make_update(update_id: int, user_id: int = None) -> dict:
+    """Апдейт в формате Telegram (сообщение от user_id или событие без пользователя)"""
+    if user_id is None:
+        return {'update_id': update_id, 'poll': {'id': str(update_id)}}
+    return {
+        'update_id': update_id,
+        'message': {'message_id': update_id, 'from': {'id': user_id}, 'chat': {'id': user_id}, 'text': 'hi'},
+    }
+
+
+def send(app, *requests) -> list:
+    """Выполнение запросов (method, path, kwargs) к приложению: [(status, body)]"""
+    async def run():
+        results = []
+        async with TestClient(TestServer(app)) as client:
+            for method, path, kwargs in requests:
+                response = await client.request(method, path, **kwargs)
+                results.append((response.status, await response.text()))
+        return results
+
+    return asyncio.run(run())
+
+
+def test_secret_token_is_required():
+    received = []
+    app = create_app(received.append, lambda: {'ok': True}, '/webhook', secret='s3cret')
+
+    results = send(
+        app,
+        ('POST', '/webhook', {'json': make_update(1, 10)}),
+        ('POST', '/webhook', {'json': make_update(2, 10), 'headers': {SECRET_HEADER: 'wrong'}}),
+        ('POST', '/webhook', {'json': make_update(3, 10), 'headers': {SECRET_HEADER: 's3cret'}}),
+    )
+    assert [status for status, _ in results] == [401, 401, 200]
+    assert [update['update_id'] for update in received] == [3]
+
+
+def test_invalid_json_is_rejected():
+    app = create_app(lambda update: None, lambda: {'ok': True}, '/webhook')
+    [(status, _)] = send(app, ('POST', '/webhook', {'data': 'not json'}))
+    assert status == 400
+
+
+def test_sequencer_keeps_per_user_order():
+    handled = {}
+
+    async def handler(update):
+        # Случайные задержки перемешали бы апдейты без упорядочивания
+        await asyncio.sleep(random.random() / 1000)
+        user_id = update['message']['from']['id']
+        handled.setdefault(user_id, []).append(update['update_id'])
+
+    async def run():
+        sequencer = UpdateSequencer(handler)
+        for update_id in range(300):
+            update = make_update(update_id, user_id=update_id % 5)
+            sequencer.submit(get_update_user_id(update), update)
+        await sequencer.wait_all()
+
+    asyncio.run(run())
+    assert set(handled) == set(range(5))
+    for user_id, update_ids in handled.items():
+        assert update_ids == list(range(user_id, 300, 5))
+
+
+def test_updates_without_user_run_concurrently():
+    running = 0
+    max_running = 0
+
+    async def handler(update):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    async def run():
+        sequencer = UpdateSequencer(handler)
+        for update_id in range(10):
+            update = make_update(update_id)
+            assert get_update_user_id(update) is None
+            sequencer.submit(None, update)
+        await sequencer.wait_all()
+
+    asyncio.run(run())
+    assert max_running == 10
+
+
+def test_health_reports_dead_worker():
+    pool = WorkerPool(2)
+    context = multiprocessing.get_context('spawn')
+    # Вместо воркеров бота - процессы, один из которых сразу завершается
+    pool.processes = [
+        context.Process(target=time.sleep, args=(30,), daemon=True),
+        context.Process(target=time.sleep, args=(0,), daemon=True),
+    ]
+    pool.start()
+    pool.processes[1].join(10)
+
+    try:
+        [(status, body)] = send(create_app(pool.dispatch, pool.health, '/webhook'), ('GET', '/health', {}))
+        assert status == 503
+        assert '"workers_alive": 1' in body
+
+        pool.processes = pool.processes[:1]
+        [(status, _)] = send(create_app(pool.dispatch, pool.health, '/webhook'), ('GET', '/health', {}))
+        assert status == 200
+    finally:
+        pool.processes[0].terminate()
@@ -0,0 +1,50 @@
+import pytest
+
+
+@pytest.fixture
+def writes(db, monkeypatch) -> list:
+    """Операции, отправленные в поток-писатель"""
+    submitted = []
+    submit_write = db.manager.submit_write
+
+    def counting_submit(operation):
+        submitted.append(operation)
+        return submit_write(operation)
+
+    monkeypatch.setattr(db.manager, 'submit_write', counting_submit)
+    return submitted
+
+
+def test_writes_go_through_writer_thread(db, writes):
+    user_id = db.add_user(1)
+    calls = [
+        lambda: db.create_referral_code(user_id, 'CODE0001'),
+        lambda: db.add_referral(user_id, 2),
+        lambda: db.create_star_payment(user_id, 599, 'premium', 30),
+        lambda: db.add_affiliate(user_id),
+        lambda: db.create_affiliate_payout(user_id, 100),
+    ]
+    for call in calls:
+        before = len(writes)
+        assert call()
+        assert len(writes) > before
+
+
+def test_pending_likes_delete_bot_likes_through_writer(db, add_profile, writes):
+    bot_user_id, bot_profile_id = add_profile(2)
+    _, profile_id = add_profile(3, gender='Мужчина', looking_for='Девушку')
+    db._write(lambda cursor: cursor.execute(
+        "INSERT INTO bot_profiles (profile_id, is_active) VALUES (?, 1)", (bot_profile_id,)
+    ))
+    db.add_like(bot_user_id, profile_id, 'like')
+
+    before = len(writes)
+    db.get_pending_likes(profile_id)
+    assert len(writes) == before + 1
+    assert db.cursor.execute(
+        "SELECT COUNT(*) FROM likes WHERE to_profile_id = ?", (profile_id,)
+    ).fetchone()[0] == 0
+
+    # Лайков ботов больше нет - запись не выполняется
+    db.get_pending_likes(profile_id)
+    assert len(writes) == before + 1
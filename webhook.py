@@ -0,0 +1,222 @@
+import asyncio
+import hmac
+import logging
+import multiprocessing
+from typing import Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# Поля апдейта, в которых Telegram передает событие от пользователя
+UPDATE_EVENT_KEYS = (
+    'message', 'edited_message', 'callback_query', 'inline_query',
+    'chosen_inline_result', 'shipping_query', 'pre_checkout_query',
+    'poll_answer', 'my_chat_member', 'chat_member', 'chat_join_request',
+    'message_reaction', 'business_message', 'edited_business_message',
+    'channel_post', 'edited_channel_post'
+)
+
+
+def get_update_user_id(update: dict) -> Optional[int]:
+    """ID пользователя (или чата), от которого пришел апдейт, или None"""
+    for key in UPDATE_EVENT_KEYS:
+        event = update.get(key)
+        if not isinstance(event, dict):
+            continue
+
+        user = event.get('from') or event.get('user')
+        if user:
+            return user['id']
+
+        chat = event.get('chat')
+        if chat:
+            return chat['id']
+
+    return None
+
+
+class UpdateSequencer:
+    """Обработка апдейтов одного пользователя строго по очереди
+
+    Апдейты разных пользователей обрабатываются параллельно, а апдейты
+    одного пользователя - в порядке поступления, чтобы переходы FSM
+    не перемешивались. Апдейты без пользователя (user_id=None) ни с чем
+    не упорядочиваются.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self._tails = {}
+
+    def submit(self, user_id: Optional[int], update: dict) -> asyncio.Task:
+        # Апдейты без пользователя ключуем по update_id: у каждого своя очередь
+        key = ('user', user_id) if user_id is not None else ('update', update.get('update_id'))
+        previous = self._tails.get(key)
+        task = asyncio.create_task(self._run(previous, update))
+        self._tails[key] = task
+        task.add_done_callback(lambda done: self._release(key, done))
+        return task
+
+    async def _run(self, previous, update: dict):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await self.handler(update)
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки апдейта {update.get('update_id')}: {e}")
+
+    def _release(self, key: tuple, task: asyncio.Task):
+        if self._tails.get(key) is task:
+            del self._tails[key]
+
+    async def wait_all(self):
+        """Ожидание обработки всех принятых апдейтов"""
+        while self._tails:
+            await asyncio.wait(list(self._tails.values()))
+
+
+# ========== РАБОЧИЕ ПРОЦЕССЫ ==========
+
+def _worker_main(index: int, updates, primary: bool):
+    asyncio.run(_worker_loop(index, updates, primary))
+
+
+async def _worker_loop(index: int, updates, primary: bool):
+    """Цикл рабочего процесса: получает апдейты своего шарда и обрабатывает их"""
+    # Импортируем здесь, чтобы избежать циклического импорта
+    from main import create_bot, create_dispatcher
+
+    bot = create_bot()
+    dp = create_dispatcher()
+    await dp.emit_startup(bot=bot, primary=primary)
+
+    sequencer = UpdateSequencer(lambda update: dp.feed_raw_update(bot, update))
+    loop = asyncio.get_running_loop()
+    logger.info(f"👷 Воркер {index} запущен")
+
+    try:
+        while True:
+            item = await loop.run_in_executor(None, updates.get)
+            if item is None:
+                break
+            user_id, update = item
+            sequencer.submit(user_id, update)
+
+        await sequencer.wait_all()
+    finally:
+        await dp.emit_shutdown(bot=bot, primary=primary)
+        await bot.session.close()
+        logger.info(f"👷 Воркер {index} остановлен")
+
+
+class WorkerPool:
+    """Пул процессов-обработчиков с шардированием по пользователю"""
+
+    def __init__(self, workers: int):
+        context = multiprocessing.get_context('spawn')
+        self.queues = [context.Queue() for _ in range(workers)]
+        # Фоновые задачи (автолайки и т.п.) запускает только первый воркер
+        self.processes = [
+            context.Process(target=_worker_main, args=(index, queue, index == 0),
+                            name=f'bot-worker-{index}', daemon=True)
+            for index, queue in enumerate(self.queues)
+        ]
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def dispatch(self, update: dict):
+        user_id = get_update_user_id(update)
+        # Апдейты без пользователя распределяем по update_id, а не в один шард
+        shard_key = user_id if user_id is not None else update.get('update_id', 0)
+        self.queues[shard_key % len(self.queues)].put((user_id, update))
+
+    def health(self) -> dict:
+        alive = [process.is_alive() for process in self.processes]
+        return {'ok': all(alive), 'workers': len(alive), 'workers_alive': sum(alive)}
+
+    def stop(self, timeout: float = 30):
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+
+# ========== WEB-СЕРВЕР ==========
+
+def create_app(dispatch, health, path: str, secret: str = None) -> web.Application:
+    """aiohttp-приложение: прием апдейтов и проверка здоровья"""
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), secret):
+            return web.Response(status=401)
+
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        # Отвечаем Telegram сразу, апдейт обрабатывается в фоне
+        dispatch(update)
+        return web.Response()
+
+    async def handle_health(request: web.Request) -> web.Response:
+        status = health()
+        return web.json_response(status, status=200 if status['ok'] else 503)
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    app.router.add_get('/health', handle_health)
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher, url: str, path: str = '/webhook',
+                      secret: str = None, host: str = '0.0.0.0', port: int = 8080,
+                      workers: int = 1):
+    """Запуск бота в режиме вебхука
+
+    При workers > 1 апдейты распределяются по рабочим процессам
+    по from_user.id, иначе обрабатываются в текущем процессе.
+    """
+    pool = None
+    sequencer = None
+
+    if workers > 1:
+        pool = WorkerPool(workers)
+        pool.start()
+        dispatch = pool.dispatch
+        health = pool.health
+    else:
+        await dp.emit_startup(bot=bot)
+        sequencer = UpdateSequencer(lambda update: dp.feed_raw_update(bot, update))
+        dispatch = lambda update: sequencer.submit(get_update_user_id(update), update)
+        health = lambda: {'ok': True, 'workers': 0}
+
+    app = create_app(dispatch, health, path, secret)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    await bot.set_webhook(
+        url.rstrip('/') + path,
+        secret_token=secret or None,
+        allowed_updates=dp.resolve_used_update_types()
+    )
+    logger.info(f"🌐 Вебхук запущен на {host}:{port}{path}, воркеров: {workers}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        if pool:
+            await asyncio.get_running_loop().run_in_executor(None, pool.stop)
+        else:
+            await sequencer.wait_all()
+            await dp.emit_shutdown(bot=bot)